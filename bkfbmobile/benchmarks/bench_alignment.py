@@ -0,0 +1,62 @@
+"""
+Banded DTW stroke alignment vs the original resample-to-most-common-length average.
+
+Synthetic strokes whose recovery stretches with stroke rate (the drive stays the same
+length, as on the water), so resampling alone moves the drive around. Reports how tall
+the averaged drive peak stays relative to one stroke's, the spread, and the cost of aligning one
+stroke for a few template lengths / band widths.
+
+    PYTHONPATH=src python benchmarks/bench_alignment.py
+"""
+
+import time
+
+import numpy as np
+
+from bkfbmobile.AU.averageStroke import getAverageStroke
+from bkfbmobile.AU.strokeAlignment import DtwStrokeAligner, bandRadius
+
+SAMPLE_RATE_HZ = 20.0
+
+
+def syntheticStroke(period_s, rng, drive_s=0.8, noise=0.05):
+    """Sharp catch, fixed-length drive, recovery taking up the rest of the period."""
+    n = int(round(period_s * SAMPLE_RATE_HZ))
+    t = np.arange(n) / SAMPLE_RATE_HZ
+    catch = -2.0 * np.exp(-0.5 * (t / 0.08) ** 2)
+    drive = np.where(t < drive_s, 1.2 * np.sin(np.pi * t / drive_s), 0.0)
+    recovery = np.where(t >= drive_s, -0.3 * np.sin(np.pi * (t - drive_s) / (period_s - drive_s)), 0.0)
+    return catch + drive + recovery + noise * rng.standard_normal(n)
+
+
+def main():
+    rng = np.random.default_rng(0)
+    periods = 60.0 / rng.uniform(20, 34, 400)
+    strokes = [syntheticStroke(p, rng) for p in periods]
+    single = syntheticStroke(float(np.median(periods)), rng, noise=0.0)
+    drive_peak = single.max()
+
+    resampled, _vel = getAverageStroke(list(strokes))
+    lengths = [len(s) for s in strokes]
+    aligner = DtwStrokeAligner(int(np.median(lengths)))
+    aligner.extend(strokes)
+    print(f"{'method':<12} {'drive peak':>10} {'of single':>9} {'mean std':>9}")
+    for name, mean, std in (
+        ('resample', resampled[0], (np.asarray(resampled[2]) - resampled[0])),
+        ('dtw', aligner.mean, aligner.std()),
+    ):
+        print(f"{name:<12} {mean.max():>10.3f} {mean.max() / drive_peak:>9.2f} {np.mean(std):>9.3f}")
+
+    print()
+    print(f"{'length':>6} {'radius':>6} {'ms/stroke':>9}")
+    for length in (40, 60, 100):
+        for radius in (bandRadius(length), bandRadius(length, 0.2)):
+            aligner = DtwStrokeAligner(length, radius)
+            aligner.add(strokes[0])
+            start = time.perf_counter()
+            aligner.extend(strokes[1:201])
+            print(f"{length:>6} {radius:>6} {(time.perf_counter() - start) * 1e3 / 200:>9.3f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,91 @@
+"""
+Per-frame cost of handing matplotlib plots to the UI as PNG vs raw RGBA.
+
+Runs livePlot, averageStroke and lastTwo at the app's real figure size (8x5 in @ 80 dpi)
+on synthetic rowing data, in both frame formats, and times the UI-side decode as well.
+The render and analysis caches are cleared before every call, so each one really draws
+(the stroke pages' times include detecting the strokes).
+
+    PYTHONPATH=src python benchmarks/bench_frames.py [repeats]
+"""
+
+import sys
+import time
+from io import BytesIO
+
+import numpy as np
+from PIL import Image
+
+from bkfbmobile import bkfb
+
+
+def syntheticSession(num_samples=400, sample_rate_hz=20.0, stroke_period_s=2.0):
+    """Stroke-like acceleration on the configured axis plus a little noise."""
+    t = np.arange(num_samples) / sample_rate_hz
+    rng = np.random.default_rng(0)
+    stroke = -9.81 * 1.5 * np.sin(2 * np.pi * t / stroke_period_s)
+    return {
+        'x': list(0.2 * rng.standard_normal(num_samples)),
+        'y': list(stroke + 0.2 * rng.standard_normal(num_samples)),
+        'z': list(9.81 + 0.2 * rng.standard_normal(num_samples)),
+    }
+
+
+def decodePng(png):
+    with Image.open(BytesIO(png)) as image:
+        image.load()
+        return image
+
+
+def decodeRgba(frame):
+    # what frameImage does on backends without a native path: uncompressed PNG via Pillow
+    buf = BytesIO()
+    bkfb.rgbaFrameToPil(frame).save(buf, format='png', compress_level=0)
+    return decodePng(buf.getvalue())
+
+
+def uncached(plot, points):
+    # the same data every time would otherwise be a cache hit after the first call
+    bkfb._render_cache.clear()
+    bkfb._analysis_cache = None
+    return plot(points)
+
+
+def timeIt(fn, repeats):
+    result = fn()
+    start = time.perf_counter()
+    for _ in range(repeats):
+        result = fn()
+    return (time.perf_counter() - start) * 1000.0 / repeats, result
+
+
+def main():
+    repeats = int(sys.argv[1]) if len(sys.argv) > 1 else 10
+    points = syntheticSession()
+    plots = {
+        'livePlot': bkfb.livePlot,
+        'averageStroke': bkfb.averageStroke,
+        'lastTwo': bkfb.lastTwo,
+    }
+
+    print(f"{'plot':<14} {'png render':>11} {'png decode':>11} {'rgba render':>12} {'rgba->pil':>10} {'rgba->png0':>11}  size")
+    for name, plot in plots.items():
+        bkfb.setFrameFormat(bkfb.FRAME_PNG)
+        png_ms, png = timeIt(lambda: uncached(plot, points), repeats)
+        png_decode_ms, _ = timeIt(lambda: decodePng(png), repeats)
+
+        bkfb.setFrameFormat(bkfb.FRAME_RGBA)
+        rgba_ms, frame = timeIt(lambda: uncached(plot, points), repeats)
+        wrap_ms, _ = timeIt(lambda: bkfb.rgbaFrameToPil(frame), repeats)
+        roundtrip_ms, _ = timeIt(lambda: decodeRgba(frame), repeats)
+
+        print(
+            f"{name:<14} {png_ms:>9.1f}ms {png_decode_ms:>9.1f}ms {rgba_ms:>10.1f}ms "
+            f"{wrap_ms:>8.2f}ms {roundtrip_ms:>9.1f}ms  {frame.width}x{frame.height}"
+        )
+
+    bkfb.setFrameFormat(bkfb.FRAME_PNG)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+"""
+Streaming hysteresis stroke detector vs getPeaks (scipy find_peaks).
+
+Checks that both find the same stroke boundaries and compares CPU cost per sample, both for
+one pass over a whole session and for the way the app used getPeaks (re-running it over
+the whole session every avg_stroke_update_interval samples).
+
+Uses synthetic rowing sessions at a few stroke rates / noise levels, plus any recorded
+session CSVs (Time,Sensor1,Sensor2,Sensor3) given on the command line.
+
+    PYTHONPATH=src python benchmarks/bench_strokes.py [session.csv ...]
+"""
+
+import os
+import sys
+import time
+
+import numpy as np
+import pandas
+
+from bkfbmobile import bkfb
+from bkfbmobile.AU.averageStroke import getAccelerationData, getPeaks, readData
+from bkfbmobile.AU.streamingStroke import StreamingStrokeDetector
+from bkfbmobile.filters import LowPassFilter
+
+SAMPLE_RATE_HZ = 20.0
+MATCH_TOLERANCE = 2  # samples
+
+
+def syntheticAcceleration(num_samples, stroke_period_s, noise, seed=0):
+    """Drive/recovery shaped 'ay' in g, low-pass filtered like live data."""
+    t = np.arange(num_samples) / SAMPLE_RATE_HZ
+    rng = np.random.default_rng(seed)
+    ay = 1.5 * np.sin(2 * np.pi * t / stroke_period_s) + 0.5 * np.sin(4 * np.pi * t / stroke_period_s + 1)
+    ay = ay + noise * rng.standard_normal(num_samples)
+    filtered = LowPassFilter(bkfb.LOW_PASS_CUTOFF_HZ, SAMPLE_RATE_HZ, channels=1).batch(ay[:, None])[:, 0]
+    return pandas.DataFrame({'time': t, 'ay': filtered})
+
+
+def agreement(reference, candidate):
+    """(matched, reference count, candidate count, mean |offset|) within MATCH_TOLERANCE."""
+    reference = np.asarray(reference)
+    offsets = []
+    for boundary in candidate:
+        if len(reference) == 0:
+            break
+        nearest = np.min(np.abs(reference - boundary))
+        if nearest <= MATCH_TOLERANCE:
+            offsets.append(nearest)
+    mean_offset = float(np.mean(offsets)) if offsets else float('nan')
+    return len(offsets), len(reference), len(candidate), mean_offset
+
+
+def usPerSample(fn, num_samples, repeats=3):
+    best = float('inf')
+    for _ in range(repeats):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best * 1e6 / num_samples
+
+
+def streamingPass(ay):
+    detector = StreamingStrokeDetector(sample_rate_hz=SAMPLE_RATE_HZ)
+    update = detector.update
+    for value in ay:
+        update(value)
+    return detector.boundaries
+
+
+def appStylePeaks(acc, interval):
+    # what strokeAnalysis did: find_peaks over everything so far, every interval samples
+    for end in range(interval, len(acc) + 1, interval):
+        getPeaks(acc.iloc[:end])
+
+
+def report(name, acc):
+    ay = acc['ay'].to_numpy().tolist()
+    n = len(ay)
+    peaks = np.asarray(getPeaks(acc))
+    boundaries = streamingPass(ay)
+    # the streaming detector can't confirm a trough the session ends in
+    reference = peaks[peaks < n - SAMPLE_RATE_HZ]
+    matched, ref_count, cand_count, offset = agreement(reference, boundaries)
+
+    peaks_us = usPerSample(lambda: getPeaks(acc), n)
+    app_us = usPerSample(lambda: appStylePeaks(acc, bkfb.avg_stroke_update_interval), n, repeats=1)
+    stream_us = usPerSample(lambda: streamingPass(ay), n)
+    print(f"{name:<28} {n:>7} {ref_count:>6} {cand_count:>6} {matched:>6} {offset:>7.2f}"
+          f" {peaks_us:>9.2f} {app_us:>9.2f} {stream_us:>9.2f}")
+
+
+def main():
+    print(f"{'session':<28} {'samples':>7} {'peaks':>6} {'stream':>6} {'match':>6} {'offset':>7}"
+          f" {'peaks/us':>9} {'app/us':>9} {'strm/us':>9}")
+    for period in (1.5, 2.0, 3.0):
+        for noise in (0.05, 0.3):
+            acc = syntheticAcceleration(12000, period, noise)
+            report(f"synthetic {60 / period:.0f} spm noise {noise}", acc)
+    for path in sys.argv[1:]:
+        acc = getAccelerationData(readData(path), axis=bkfb.stroke_axis)
+        report(os.path.basename(path), acc)
+
+
+if __name__ == '__main__':
+    main()
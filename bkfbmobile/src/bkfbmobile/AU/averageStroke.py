@@ -42,6 +42,22 @@ def getAccelerationData(rawData, axis='y'):
   accelerationData = pandas.DataFrame({'time': times, 'ay': ay_vals})
   return accelerationData
 
+#same as getAccelerationData for samples already on a uniform grid (times in seconds)
+def getUniformAccelerationData(times, sensorValues, axis='y'):
+  axis = (axis or 'y').strip().lower()
+  axis_to_column = {
+      'x': 0,
+      'y': 1,
+      'z': 2,
+  }
+  column = axis_to_column.get(axis, 1)
+  sensorValues = numpy.asarray(sensorValues, dtype='float64')
+  accelerationData = pandas.DataFrame({
+      'time': numpy.asarray(times, dtype='float64'),
+      'ay': -sensorValues[:, column]/9.81,
+  })
+  return accelerationData
+
 def getVelocityData(averageStroke, sampling_rate_hz=20.0, direction=1):
   v0 = 0
   velocityData = [0]
@@ -52,8 +68,13 @@ def getVelocityData(averageStroke, sampling_rate_hz=20.0, direction=1):
   return velocityData
 
 #separates the raw data into individual strokes, returns a list of strokes
-def getStrokes(accelerationData, plot=False, padding_samples=1):
-  peakIndexes = getPeaks(accelerationData, plot=plot)
+# peakIndexes can be passed in when the caller already ran getPeaks (fractional ones from
+# refinePeaks are handed to getStrokesBetween)
+def getStrokes(accelerationData, plot=False, padding_samples=1, peakIndexes=None):
+  if peakIndexes is None:
+    peakIndexes = getPeaks(accelerationData, plot=plot)
+  if numpy.issubdtype(numpy.asarray(peakIndexes).dtype, numpy.floating):
+    return getStrokesBetween(accelerationData, peakIndexes, padding_samples)
   strokeAccelerations = []
   max_idx = len(accelerationData) - 1
   for i in range(0,len(peakIndexes)-1):
@@ -65,6 +86,21 @@ def getStrokes(accelerationData, plot=False, padding_samples=1):
       strokeAccelerations.append(accStroke)
   return strokeAccelerations
 
+#same as getStrokes for fractional boundaries (from refinePeaks): each stroke is interpolated
+#on a grid that starts exactly padding_samples before its trough
+def getStrokesBetween(accelerationData, boundaries, padding_samples=1):
+  ay = accelerationData['ay'].to_numpy()
+  strokeAccelerations = []
+  for i in range(0, len(boundaries)-1):
+    start = max(0.0, boundaries[i] - padding_samples)
+    end = min(len(ay), boundaries[i+1] + padding_samples)
+    numSamples = int(round(end - start))
+    # only the samples around this stroke, so the cost doesn't grow with the session
+    first = int(start)
+    local = ay[first:first + numSamples + 2]
+    strokeAccelerations.append(numpy.interp(start - first + numpy.arange(numSamples), numpy.arange(len(local)), local))
+  return strokeAccelerations
+
 def getPeaks(accelerationData, plot=False):
   negAy= -1*accelerationData['ay']
   trueAy = accelerationData['ay']
@@ -76,6 +112,23 @@ def getPeaks(accelerationData, plot=False):
     plt.show()
   return peaks
 
+#moves each trough from getPeaks to the vertex of a parabola through it and its neighbours,
+#so stroke boundaries aren't limited to whole samples (50 ms at 20 Hz)
+def refinePeaks(accelerationData, peakIndexes):
+  ay = accelerationData['ay'].to_numpy() if hasattr(accelerationData, 'columns') else numpy.asarray(accelerationData, dtype='float64')
+  peaks = numpy.asarray(peakIndexes, dtype='int64')
+  refined = peaks.astype('float64')
+  # troughs on the first/last sample have no neighbour on one side
+  inner = (peaks > 0) & (peaks < len(ay) - 1)
+  left = ay[peaks[inner] - 1]
+  centre = ay[peaks[inner]]
+  right = ay[peaks[inner] + 1]
+  curvature = left - 2 * centre + right
+  with numpy.errstate(invalid='ignore', divide='ignore'):
+    offset = numpy.where(curvature > 0, 0.5 * (left - right) / curvature, 0.0)
+  refined[inner] += numpy.clip(offset, -0.5, 0.5)
+  return refined
+
 #takes a single stroke and resamples it so that the average can be taken
 def ressampleStrokes(allStrokes, resampleIndexes, numSamples):
   for i in resampleIndexes:
@@ -0,0 +1,81 @@
+# streaming stroke detector, a constant-work-per-sample alternative to getPeaks
+#
+# getPeaks needs the whole series and scipy. this one looks at one acceleration value at a
+# time (the same 'ay' column getStrokes uses) and reports each stroke boundary (the trough
+# getPeaks would find) as soon as the signal has climbed far enough back out of it.
+#
+# thresholds sit either side of a running baseline, scaled by a running amplitude estimate
+# so they follow the rower, and never closer together than the prominence getPeaks asks for.
+
+# same as getPeaks' prominence=1 (g)
+MIN_PROMINENCE = 1.0
+
+class StreamingStrokeDetector:
+  def __init__(self, sample_rate_hz=20.0, min_prominence=MIN_PROMINENCE, hysteresis=0.35, time_constant_s=6.0):
+    self.min_prominence = min_prominence
+    self.hysteresis = hysteresis
+    # smoothing factor for baseline/amplitude, roughly a few strokes long
+    self.smoothing = 1.0 / max(1.0, time_constant_s * sample_rate_hz)
+    self.reset()
+
+  def reset(self):
+    self.index = 0
+    self.baseline = None
+    self.amplitude = 0.0
+    self.inTrough = False
+    self.troughValue = None
+    self.troughIndex = None
+    self.peakSinceTrough = None
+    self.boundaries = []
+
+  def thresholds(self):
+    halfWidth = max(self.hysteresis * self.amplitude, self.min_prominence / 2.0)
+    return self.baseline - halfWidth, self.baseline + halfWidth
+
+  def update(self, value):
+    """Feed one sample; returns the index of a newly confirmed boundary, else None."""
+    index = self.index
+    self.index += 1
+    if self.baseline is None:
+      self.baseline = value
+      self.peakSinceTrough = value
+    a = self.smoothing
+    self.baseline += a * (value - self.baseline)
+    self.amplitude += a * (abs(value - self.baseline) - self.amplitude)
+    low, high = self.thresholds()
+
+    boundary = None
+    if self.inTrough:
+      if value < self.troughValue:
+        self.troughValue = value
+        self.troughIndex = index
+      elif value > high and value - self.troughValue >= self.min_prominence:
+        # climbed back out: the lowest point is a stroke boundary
+        if self.peakSinceTrough - self.troughValue >= self.min_prominence:
+          boundary = self.troughIndex
+          self.boundaries.append(boundary)
+        self.inTrough = False
+        self.peakSinceTrough = value
+    else:
+      if value > self.peakSinceTrough:
+        self.peakSinceTrough = value
+      if value < low:
+        self.inTrough = True
+        self.troughValue = value
+        self.troughIndex = index
+    return boundary
+
+  def feed(self, values):
+    """Feed a run of samples; returns the boundaries confirmed along the way."""
+    found = []
+    for value in values:
+      boundary = self.update(float(value))
+      if boundary is not None:
+        found.append(boundary)
+    return found
+
+#drop-in for getPeaks on a whole series (uses the 'ay' column)
+def getStreamingPeaks(accelerationData, sample_rate_hz=20.0):
+  detector = StreamingStrokeDetector(sample_rate_hz=sample_rate_hz)
+  detector.feed(accelerationData['ay'].to_numpy())
+  return detector.boundaries
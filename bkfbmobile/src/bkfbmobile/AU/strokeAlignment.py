@@ -0,0 +1,150 @@
+# phase alignment of strokes with banded dynamic time warping
+#
+# getAverageStroke lines strokes up by resampling each one to the most common length, which
+# assumes every part of the stroke stretches evenly when the rate changes - it doesn't, the
+# recovery stretches far more than the drive, so the catch and finish smear out in the
+# average. here each stroke is resampled to the template length first (takes out the overall
+# rate) and then warped onto the running template with DTW, so the catch lands on the catch.
+#
+# the warp is limited to a Sakoe-Chiba band of +/- radius samples, so a stroke costs
+# length x (2 x radius + 1) cells however many strokes came before. each row of the band is
+# one handful of numpy calls (the in-row dependency is a running minimum, see _bandRow).
+
+import numpy
+
+from bkfbmobile.AU.strokeIndex import resampleStroke
+
+# band radius as a fraction of the template length (Sakoe and Chiba used about 10%)
+BAND_FRACTION = 0.1
+
+# moves in the warping path, stored per cell for the backtrack
+_DIAGONAL = 0
+_VERTICAL = 1    # next stroke sample, same template sample
+_HORIZONTAL = 2  # same stroke sample, next template sample
+
+def bandRadius(length, fraction=BAND_FRACTION):
+  return max(1, int(round(fraction * length)))
+
+def _bandRow(cost, above):
+  # D[k] = cost[k] + min(above[k], D[k-1]) in one go: unrolled, D[k] is
+  # P[k] + min over t <= k of (above[t] - P[t-1]) with P the running sum of cost
+  total = numpy.cumsum(cost)
+  before = total - cost
+  candidates = above - before
+  best = numpy.minimum.accumulate(candidates)
+  row = total + best
+  # the running minimum came from further left -> we got here horizontally
+  horizontal = best < candidates
+  return row, horizontal
+
+#dtw of two equal-length series inside a band of +/- radius samples
+#returns (distance, stroke indexes, template indexes) along the warping path
+def bandedDtw(stroke, template, radius):
+  x = numpy.asarray(stroke, dtype='float64').ravel()
+  y = numpy.asarray(template, dtype='float64').ravel()
+  n = len(x)
+  if len(y) != n:
+    raise ValueError("bandedDtw needs equal-length series (resample first)")
+  width = 2 * radius + 1
+  offsets = numpy.arange(width) - radius  # band column k is template index i + k - radius
+
+  # every cell's cost at once; cells outside the template are never read
+  columns = numpy.clip(numpy.arange(n)[:, None] + offsets[None, :], 0, n - 1)
+  costs = (x[:, None] - y[columns]) ** 2
+
+  distances = numpy.full((n, width + 1), numpy.inf)  # spare column so k + 1 is always valid
+  moves = numpy.zeros((n, width), dtype='int8')
+  for i in range(n):
+    first = max(0, radius - i)
+    last = min(width, n + radius - i)
+    if i == 0:
+      # the path starts at (0, 0)
+      above = numpy.full(last - first, numpy.inf)
+      above[radius - first] = 0.0
+      cameVertical = numpy.zeros(last - first, dtype=bool)
+    else:
+      diagonal = distances[i - 1, first:last]
+      vertical = distances[i - 1, first + 1:last + 1]
+      cameVertical = vertical < diagonal
+      above = numpy.where(cameVertical, vertical, diagonal)
+    row, horizontal = _bandRow(costs[i, first:last], above)
+    distances[i, first:last] = row
+    moves[i, first:last] = numpy.where(horizontal, _HORIZONTAL, numpy.where(cameVertical, _VERTICAL, _DIAGONAL))
+
+  # walk back from (n - 1, n - 1)
+  i, k = n - 1, radius
+  strokeIndexes = [i]
+  templateIndexes = [n - 1]
+  while i > 0 or k != radius:
+    move = moves[i, k]
+    if move == _HORIZONTAL:
+      k -= 1
+    elif move == _VERTICAL:
+      i -= 1
+      k += 1
+    else:
+      i -= 1
+    strokeIndexes.append(i)
+    templateIndexes.append(i + k - radius)
+  return (float(numpy.sqrt(distances[n - 1, radius] / n)),
+          numpy.asarray(strokeIndexes[::-1]), numpy.asarray(templateIndexes[::-1]))
+
+class DtwStrokeAligner:
+  """Running phase-aligned average: each stroke is warped onto the current template."""
+  def __init__(self, length, radius=None):
+    self.length = int(length)
+    self.radius = bandRadius(self.length) if radius is None else max(1, int(radius))
+    self.reset()
+
+  def reset(self):
+    self.count = 0
+    self.mean = numpy.zeros(self.length)
+    self.m2 = numpy.zeros(self.length)
+    self.distances = []
+
+  def align(self, stroke):
+    """Stroke warped onto the template timeline, and its DTW distance (RMS, g)."""
+    x = resampleStroke(stroke, self.length)
+    if self.count == 0:
+      return x, 0.0
+    distance, strokeIndexes, templateIndexes = bandedDtw(x, self.mean, self.radius)
+    # template samples the path visits more than once get the mean of their stroke samples
+    sums = numpy.bincount(templateIndexes, weights=x[strokeIndexes], minlength=self.length)
+    counts = numpy.bincount(templateIndexes, minlength=self.length)
+    return sums / counts, distance
+
+  def add(self, stroke):
+    warped, distance = self.align(stroke)
+    # Welford update of the template and its spread
+    self.count += 1
+    delta = warped - self.mean
+    self.mean += delta / self.count
+    self.m2 += delta * (warped - self.mean)
+    self.distances.append(distance)
+    return warped
+
+  def extend(self, strokes):
+    for stroke in strokes:
+      self.add(stroke)
+
+  def std(self):
+    if self.count == 0:
+      return numpy.zeros(self.length)
+    return numpy.sqrt(self.m2 / self.count)
+
+#same output as getAverageStroke, with the strokes phase-aligned by dtw instead of only resampled
+def getAlignedAverageStroke(allStrokes, sampling_rate_hz=20.0, direction=1, radius=None):
+  from bkfbmobile.AU.averageStroke import getMostCommonNumSamples
+  mostCommonNumSamples, _resampleIndexes = getMostCommonNumSamples([len(x) for x in allStrokes])
+  aligner = DtwStrokeAligner(mostCommonNumSamples, radius)
+  aligner.extend(allStrokes)
+  return alignedAverage(aligner, sampling_rate_hz, direction)
+
+#an aligner's template and spread in the getAverageStroke layout
+def alignedAverage(aligner, sampling_rate_hz=20.0, direction=1):
+  from bkfbmobile.AU.averageStroke import getVelocityData
+  averageStroke = aligner.mean.copy()
+  stdDeviation = aligner.std()
+  averageVelocity = numpy.asarray(getVelocityData(averageStroke, sampling_rate_hz=sampling_rate_hz, direction=direction))
+  return ([averageStroke, averageStroke - stdDeviation, averageStroke + stdDeviation],
+          [averageVelocity, averageVelocity - stdDeviation, averageVelocity + stdDeviation])
@@ -0,0 +1,70 @@
+# online clustering of stroke shapes (sequential k-means)
+#
+# getAverageStroke averages everything, so warm-up, steady state and race pace blur into
+# one curve. this keeps a few centroids instead and moves the nearest one towards each new
+# stroke, with a running std band per cluster. every update costs the same (clusters x
+# stroke length) however many strokes came before.
+
+import numpy
+
+from bkfbmobile.AU.strokeIndex import STROKE_LENGTH, resampleStroke
+
+class OnlineStrokeClusters:
+  def __init__(self, maxClusters=3, length=STROKE_LENGTH, newClusterDistance=0.3, spreadFactor=3.0, minMembers=5, memory=200):
+    self.maxClusters = maxClusters
+    self.length = length
+    # a stroke this far (RMS, g) from every centroid, and well outside its spread, starts a new cluster
+    self.newClusterDistance = newClusterDistance
+    self.spreadFactor = spreadFactor
+    self.minMembers = minMembers
+    # the step size stops shrinking after this many strokes so centroids keep following drift
+    self.memory = memory
+    self.reset()
+
+  def reset(self):
+    self.means = numpy.empty((0, self.length))
+    self.variances = numpy.empty((0, self.length))
+    self.counts = numpy.empty(0, dtype='int64')
+    self.labels = []
+
+  def __len__(self):
+    return len(self.counts)
+
+  def _newCluster(self, vector):
+    self.means = numpy.vstack([self.means, vector])
+    self.variances = numpy.vstack([self.variances, numpy.zeros(self.length)])
+    self.counts = numpy.append(self.counts, 1)
+    return len(self.counts) - 1
+
+  def add(self, stroke):
+    """Assign one stroke (any length) to a cluster, updating it; returns the cluster number."""
+    vector = resampleStroke(stroke, self.length)
+    if len(self.counts) == 0:
+      label = self._newCluster(vector)
+      self.labels.append(label)
+      return label
+
+    rms = numpy.sqrt(((self.means - vector) ** 2).mean(axis=1))
+    label = int(numpy.argmin(rms))
+    spread = numpy.sqrt(self.variances[label].mean())
+    settled = self.counts[label] >= self.minMembers
+    if (len(self.counts) < self.maxClusters and settled
+        and rms[label] > max(self.newClusterDistance, self.spreadFactor * spread)):
+      label = self._newCluster(vector)
+    else:
+      # running mean/variance with a step that bottoms out at 1/memory
+      self.counts[label] += 1
+      step = 1.0 / min(self.counts[label], self.memory)
+      delta = vector - self.means[label]
+      self.means[label] += step * delta
+      self.variances[label] = (1.0 - step) * (self.variances[label] + step * delta * delta)
+    self.labels.append(label)
+    return label
+
+  def extend(self, strokes):
+    return [self.add(stroke) for stroke in strokes]
+
+  def clusters(self):
+    """(cluster number, stroke count, mean curve, std curve), biggest cluster first."""
+    order = numpy.argsort(-self.counts, kind='stable')
+    return [(int(i), int(self.counts[i]), self.means[i].copy(), numpy.sqrt(self.variances[i])) for i in order]
@@ -0,0 +1,104 @@
+# per-stroke features as one columnar table per session
+#
+# everything is computed for all strokes at once with reduceat over the stroke boundaries,
+# and kept as one contiguous numpy array per column, so thousands of strokes can be
+# filtered and aggregated without a python loop over strokes.
+
+import numpy
+
+GRAVITY = 9.81
+
+COLUMNS = (
+  'start',          # first sample of the stroke
+  'end',            # first sample of the next stroke
+  'duration_s',
+  'peak_acc',       # highest acceleration (g)
+  'min_acc',        # lowest acceleration (g)
+  'drive_s',        # time spent accelerating in the stroke direction
+  'recovery_s',     # the rest of the stroke
+  'drive_ratio',    # drive_s / duration_s
+  'velocity_gain',  # velocity picked up during the drive (m/s)
+  'peak_jerk',      # largest rate of change of acceleration (g/s)
+)
+
+class StrokeTable:
+  def __init__(self, columns=None):
+    columns = columns or {}
+    self.columns = {name: numpy.ascontiguousarray(columns.get(name, numpy.empty(0)), dtype='float64') for name in COLUMNS}
+
+  def __len__(self):
+    return len(self.columns['start'])
+
+  def __getitem__(self, name):
+    return self.columns[name]
+
+  def select(self, mask):
+    """Rows where mask (boolean array or index array) is set, as a new table."""
+    return StrokeTable({name: values[mask] for name, values in self.columns.items()})
+
+  def concat(self, other):
+    return StrokeTable({name: numpy.concatenate([self.columns[name], other.columns[name]]) for name in COLUMNS})
+
+  def summary(self):
+    """Mean and standard deviation of every column."""
+    if len(self) == 0:
+      return {}
+    return {name: (float(values.mean()), float(values.std())) for name, values in self.columns.items()}
+
+  def toDataFrame(self):
+    import pandas
+    return pandas.DataFrame(self.columns)
+
+#builds the table for one session from the acceleration series ('ay', in g) and the
+#stroke boundaries from getPeaks (stroke i runs from boundaries[i] to boundaries[i+1]).
+#fractional boundaries (refinePeaks) give exact start/end/duration; the per-sample
+#columns use the nearest whole samples
+def getStrokeFeatures(acceleration, boundaries, sampling_rate_hz=20.0, direction=1):
+  acc = numpy.asarray(acceleration, dtype='float64').ravel()
+  exact = numpy.asarray(boundaries, dtype='float64').ravel()
+  exact = exact[(exact >= 0) & (exact <= len(acc) - 1)]
+  bounds = numpy.round(exact).astype('int64')
+  if len(bounds) < 2:
+    return StrokeTable()
+  starts = bounds[:-1]
+  ends = bounds[1:]
+  keep = ends > starts
+  starts = starts[keep]
+  ends = ends[keep]
+  exactStarts = exact[:-1][keep]
+  exactEnds = exact[1:][keep]
+  if len(starts) == 0:
+    return StrokeTable()
+
+  dt = 1.0 / sampling_rate_hz
+  # reduceat over [start, end) needs the end of the last stroke as an upper bound
+  segment = acc[:ends[-1]]
+  peak = numpy.maximum.reduceat(segment, starts)
+  low = numpy.minimum.reduceat(segment, starts)
+
+  signed = direction * segment
+  driving = signed > 0
+  driveSamples = numpy.add.reduceat(driving.astype('float64'), starts)
+  velocityGain = numpy.add.reduceat(numpy.where(driving, signed, 0.0), starts) * GRAVITY * dt
+
+  # jerk between neighbouring samples inside each stroke (none for one-sample strokes)
+  jerk = numpy.abs(numpy.diff(acc)) / dt
+  jerk = numpy.append(jerk, 0.0)
+  # the step out of the last sample of a stroke belongs to the next one
+  jerk[ends - 1] = 0.0
+  peakJerk = numpy.maximum.reduceat(jerk[:ends[-1]], starts)
+
+  duration = (exactEnds - exactStarts) * dt
+  drive = numpy.minimum(driveSamples * dt, duration)
+  return StrokeTable({
+    'start': exactStarts,
+    'end': exactEnds,
+    'duration_s': duration,
+    'peak_acc': peak,
+    'min_acc': low,
+    'drive_s': drive,
+    'recovery_s': duration - drive,
+    'drive_ratio': drive / duration,
+    'velocity_gain': velocityGain,
+    'peak_jerk': peakJerk,
+  })
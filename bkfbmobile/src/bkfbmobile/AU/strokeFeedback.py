@@ -0,0 +1,67 @@
+# per-stroke feedback against a reference stroke (e.g. one saved with saveAverageStroke)
+#
+# meant for the hot path: one finished stroke in, a score out, without touching the rest of
+# the session. the stroke is resampled to the reference length and compared point by point
+# in units of the reference's std band, then summed up per phase of the stroke so the
+# worst part of it can be named.
+
+from collections import namedtuple
+
+import numpy
+
+from bkfbmobile.AU.strokeIndex import resampleStroke
+
+# strokes are cut trough to trough, so they start at the catch.
+# (name, start, end) as fractions of the stroke
+PHASES = (
+  ('catch', 0.0, 0.15),
+  ('drive', 0.15, 0.5),
+  ('finish', 0.5, 0.65),
+  ('recovery', 0.65, 1.0),
+)
+
+# deviation is in std bands of the reference; the band is never taken narrower than this (g)
+# so a reference averaged from very few strokes doesn't make every stroke look terrible
+MIN_SPREAD = 0.05
+
+StrokeFeedback = namedtuple('StrokeFeedback', ['score', 'worstPhase', 'phaseScores', 'bias'])
+
+class ReferenceStroke:
+  def __init__(self, acceleration, lower=None, upper=None, phases=PHASES, minSpread=MIN_SPREAD):
+    self.mean = numpy.asarray(acceleration, dtype='float64').ravel()
+    self.length = len(self.mean)
+    if lower is not None and upper is not None:
+      spread = (numpy.asarray(upper, dtype='float64') - numpy.asarray(lower, dtype='float64')) / 2.0
+    else:
+      spread = numpy.zeros(self.length)
+    self.scale = 1.0 / numpy.maximum(spread, minSpread)
+    self.phaseNames = [name for name, _start, _end in phases]
+    # phase start indexes for reduceat; every phase gets at least one point
+    starts = [min(self.length - 1, int(round(start * self.length))) for _name, start, _end in phases]
+    self.phaseStarts = numpy.maximum.accumulate(numpy.asarray(starts, dtype='int64'))
+    ends = numpy.append(self.phaseStarts[1:], self.length)
+    self.phaseSizes = numpy.maximum(ends - self.phaseStarts, 1)
+
+  @classmethod
+  def fromFile(cls, filePath):
+    """Reference from a CSV written by saveAverageStroke."""
+    from bkfbmobile.AU.averageStroke import loadAverageStroke
+    avgAcceleration, _avgVelocity = loadAverageStroke(filePath)
+    return cls(avgAcceleration[0], avgAcceleration[1], avgAcceleration[2])
+
+  def compare(self, stroke):
+    """Score one stroke (any length, g): RMS deviation in std bands, overall and per phase.
+
+    bias is the mean signed deviation in the worst phase (positive: more acceleration
+    than the reference there).
+    """
+    z = (resampleStroke(stroke, self.length) - self.mean) * self.scale
+    phaseScores = numpy.sqrt(numpy.add.reduceat(z * z, self.phaseStarts) / self.phaseSizes)
+    worst = int(numpy.argmax(phaseScores))
+    bias = numpy.add.reduceat(z, self.phaseStarts)[worst] / self.phaseSizes[worst]
+    return StrokeFeedback(
+      float(numpy.sqrt((z * z).mean())),
+      self.phaseNames[worst],
+      dict(zip(self.phaseNames, phaseScores.tolist())),
+      float(bias),
+    )
@@ -0,0 +1,196 @@
+# nearest-neighbour search over strokes from every recorded session
+#
+# each stroke is resampled to the same length (signal.resample, as getAverageStroke does
+# when it brings strokes to a common length) and stored as one row of a float32 matrix.
+# queries are a single matrix-vector product, optionally in a PCA-reduced space, so a few
+# hundred thousand strokes still answer in milliseconds. new strokes are appended as they
+# are detected. once reduced, strokes are kept as their PCA coefficients only.
+
+import os
+
+import numpy
+from scipy import signal
+
+from bkfbmobile.AU.strokePca import IncrementalStrokePca
+
+STROKE_LENGTH = 50
+
+#brings one stroke to the index's common length
+def resampleStroke(stroke, length=STROKE_LENGTH):
+  stroke = numpy.asarray(stroke, dtype='float64').ravel()
+  if len(stroke) == length:
+    return stroke
+  return signal.resample(stroke, length)
+
+class StrokeIndex:
+  def __init__(self, length=STROKE_LENGTH):
+    self.length = length
+    self.count = 0
+    self.vectors = numpy.empty((64, length), dtype='float32')
+    self.sessionIds = numpy.empty(64, dtype='int32')
+    self.strokeNumbers = numpy.empty(64, dtype='int32')
+    self.sessions = []  # session id -> name
+    self._sessionLookup = {}
+    # optional PCA space
+    self.pca = None
+    self.projected = None
+    self.norms = numpy.empty(64, dtype='float32')  # squared length of each row of space()
+
+  def __len__(self):
+    return self.count
+
+  def _grow(self, needed):
+    capacity = len(self.sessionIds)
+    if needed <= capacity:
+      return
+    while capacity < needed:
+      capacity *= 2
+    if self.vectors is not None:
+      self.vectors = numpy.resize(self.vectors, (capacity, self.length))
+    self.sessionIds = numpy.resize(self.sessionIds, capacity)
+    self.strokeNumbers = numpy.resize(self.strokeNumbers, capacity)
+    if self.projected is not None:
+      self.projected = numpy.resize(self.projected, (capacity, self.projected.shape[1]))
+    self.norms = numpy.resize(self.norms, capacity)
+
+  def sessionId(self, session):
+    key = str(session)
+    if key not in self._sessionLookup:
+      self._sessionLookup[key] = len(self.sessions)
+      self.sessions.append(key)
+    return self._sessionLookup[key]
+
+  def add(self, strokes, session, firstNumber=0):
+    """Append strokes (raw, any length) from one session; returns how many were added."""
+    rows = [resampleStroke(stroke, self.length) for stroke in strokes]
+    if not rows:
+      return 0
+    rows = numpy.asarray(rows, dtype='float32')
+    start = self.count
+    end = start + len(rows)
+    self._grow(end)
+    if self.vectors is not None:
+      self.vectors[start:end] = rows
+    self.sessionIds[start:end] = self.sessionId(session)
+    self.strokeNumbers[start:end] = numpy.arange(firstNumber, firstNumber + len(rows))
+    if self.pca is not None:
+      self.projected[start:end] = self.project(rows)
+    self.count = end
+    self._updateNorms(start, end)
+    return len(rows)
+
+  def removeSession(self, session):
+    """Drop every stroke of one session (e.g. to re-add them cut differently)."""
+    sessionId = self._sessionLookup.get(str(session))
+    if sessionId is None:
+      return 0
+    keep = numpy.flatnonzero(self.sessionIds[:self.count] != sessionId)
+    removed = self.count - len(keep)
+    for array in (self.vectors, self.projected):
+      if array is not None:
+        array[:len(keep)] = array[keep]
+    self.sessionIds[:len(keep)] = self.sessionIds[keep]
+    self.strokeNumbers[:len(keep)] = self.strokeNumbers[keep]
+    self.norms[:len(keep)] = self.norms[keep]
+    self.count = len(keep)
+    return removed
+
+  def _updateNorms(self, start, end):
+    rows = self.space()[start:end]
+    self.norms[start:end] = numpy.einsum('ij,ij->i', rows, rows)
+
+  def space(self):
+    """The matrix queries run against (PCA coordinates if fitted)."""
+    if self.pca is not None:
+      return self.projected[:self.count]
+    return self.vectors[:self.count]
+
+  def project(self, rows):
+    rows = numpy.asarray(rows, dtype='float32')
+    if self.pca is None:
+      return rows
+    return self.pca.transform(rows).astype('float32')
+
+  def fitPca(self, components=8, chunk=1024, keepVectors=False):
+    """Reduce to the top principal components, fitted incrementally a chunk at a time.
+
+    Unless keepVectors, the full-length strokes are dropped afterwards and every stroke is
+    kept as its coefficients only (100k strokes x 8 components is about 3 MB). Later strokes
+    are projected onto the same components so stored coefficients stay comparable.
+    """
+    if self.vectors is None or self.count < 2:
+      return
+    model = IncrementalStrokePca(components, self.length)
+    for start in range(0, self.count, chunk):
+      model.partialFit(self.vectors[start:min(start + chunk, self.count)])
+    self.pca = model
+    self.projected = numpy.empty((len(self.sessionIds), len(model.basis)), dtype='float32')
+    for start in range(0, self.count, chunk):
+      end = min(start + chunk, self.count)
+      self.projected[start:end] = self.project(self.vectors[start:end])
+    if not keepVectors:
+      self.vectors = None
+    self._updateNorms(0, self.count)
+
+  def query(self, stroke, k=5, excludeSession=None):
+    """k nearest strokes as a list of (distance, session, stroke number), closest first."""
+    if self.count == 0:
+      return []
+    target = self.project(resampleStroke(stroke, self.length)[None, :])[0]
+    # |a - b|^2 = |a|^2 - 2ab + |b|^2, one matrix-vector product for the whole index
+    distances = self.norms[:self.count] - 2.0 * (self.space() @ target) + float(target @ target)
+    if excludeSession is not None and str(excludeSession) in self._sessionLookup:
+      distances = numpy.where(self.sessionIds[:self.count] == self._sessionLookup[str(excludeSession)], numpy.inf, distances)
+    k = min(k, self.count)
+    nearest = numpy.argpartition(distances, k - 1)[:k]
+    nearest = nearest[numpy.argsort(distances[nearest])]
+    return [
+      (float(numpy.sqrt(max(distances[i], 0.0))), self.sessions[self.sessionIds[i]], int(self.strokeNumbers[i]))
+      for i in nearest if numpy.isfinite(distances[i])
+    ]
+
+  def save(self, path):
+    arrays = {
+      'length': numpy.array(self.length),
+      'sessionIds': self.sessionIds[:self.count],
+      'strokeNumbers': self.strokeNumbers[:self.count],
+      'sessions': numpy.array(self.sessions, dtype=str),
+    }
+    if self.vectors is not None:
+      arrays['vectors'] = self.vectors[:self.count]
+    if self.pca is not None:
+      arrays['mean'] = self.pca.mean
+      arrays['basis'] = self.pca.basis
+      arrays['singularValues'] = self.pca.singularValues
+      arrays['pcaCount'] = numpy.array(self.pca.count)
+      arrays['projected'] = self.projected[:self.count]
+    tmpPath = path + '.tmp.npz'
+    numpy.savez(tmpPath, **arrays)
+    os.replace(tmpPath, path)
+
+  @classmethod
+  def load(cls, path):
+    with numpy.load(path) as data:
+      index = cls(int(data['length']))
+      count = len(data['sessionIds'])
+      index._grow(max(count, 1))
+      if 'vectors' in data:
+        index.vectors[:count] = data['vectors']
+      else:
+        index.vectors = None
+      index.sessionIds[:count] = data['sessionIds']
+      index.strokeNumbers[:count] = data['strokeNumbers']
+      index.count = count
+      for name in data['sessions'].tolist():
+        index.sessionId(name)
+      if 'basis' in data:
+        model = IncrementalStrokePca(len(data['basis']), index.length)
+        model.mean = data['mean']
+        model.basis = data['basis']
+        model.singularValues = data['singularValues']
+        model.count = int(data['pcaCount'])
+        index.pca = model
+        index.projected = numpy.empty((len(index.sessionIds), len(model.basis)), dtype='float32')
+        index.projected[:count] = data['projected']
+      index._updateNorms(0, count)
+    return index
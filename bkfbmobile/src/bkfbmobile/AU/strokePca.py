@@ -0,0 +1,74 @@
+# incremental PCA of stroke shapes
+#
+# updated a stroke (or a batch of strokes) at a time without ever holding the whole stroke
+# matrix: the model is just the mean, the top components and their singular values, and
+# each update is an SVD of a (components + batch) x stroke-length matrix. strokes can then
+# be kept as a few coefficients, and how well the model reconstructs a stroke says how
+# typical its shape is.
+
+import numpy
+
+class IncrementalStrokePca:
+  def __init__(self, components=8, length=50):
+    self.components = components
+    self.length = length
+    self.reset()
+
+  def reset(self):
+    self.count = 0
+    self.mean = numpy.zeros(self.length)
+    self.basis = numpy.empty((0, self.length))  # (components, length), rows orthonormal
+    self.singularValues = numpy.empty(0)
+
+  def partialFit(self, strokes):
+    """Fold a batch of equal-length strokes (rows) into the model."""
+    batch = numpy.asarray(strokes, dtype='float64').reshape(-1, self.length)
+    n = len(batch)
+    if n == 0:
+      return self
+    batchMean = batch.mean(axis=0)
+    total = self.count + n
+    # the old components, the new strokes around their own mean, and a row for the shift
+    # between the two means (same construction as sklearn's IncrementalPCA)
+    rows = [self.singularValues[:, None] * self.basis, batch - batchMean]
+    if self.count:
+      rows.append(numpy.sqrt(self.count * n / total) * (self.mean - batchMean)[None, :])
+    _u, s, vt = numpy.linalg.svd(numpy.vstack(rows), full_matrices=False)
+    keep = min(self.components, len(s))
+    self.basis = vt[:keep]
+    self.singularValues = s[:keep]
+    self.mean = self.mean + (batchMean - self.mean) * (n / total)
+    self.count = total
+    return self
+
+  def transform(self, strokes):
+    """Coefficients of each stroke (rows) on the components."""
+    strokes = numpy.asarray(strokes, dtype='float64').reshape(-1, self.length)
+    return (strokes - self.mean) @ self.basis.T
+
+  def inverse(self, coefficients):
+    coefficients = numpy.asarray(coefficients, dtype='float64').reshape(-1, len(self.basis))
+    return coefficients @ self.basis + self.mean
+
+  def reconstructionError(self, strokes):
+    """RMS difference between each stroke and its reconstruction from the components."""
+    strokes = numpy.asarray(strokes, dtype='float64').reshape(-1, self.length)
+    residual = strokes - self.inverse(self.transform(strokes))
+    return numpy.sqrt((residual ** 2).mean(axis=1))
+
+  def consistency(self, strokes):
+    """0..1 per stroke: how much of its difference from the mean shape the model explains.
+
+    Strokes that vary the way the session usually varies score near 1, odd ones lower.
+    """
+    strokes = numpy.asarray(strokes, dtype='float64').reshape(-1, self.length)
+    deviation = ((strokes - self.mean) ** 2).sum(axis=1)
+    residual = (self.reconstructionError(strokes) ** 2) * self.length
+    with numpy.errstate(invalid='ignore', divide='ignore'):
+      score = 1.0 - residual / deviation
+    return numpy.clip(numpy.where(deviation > 1e-12, score, 1.0), 0.0, 1.0)
+
+  def explainedVariance(self):
+    if self.count < 2:
+      return numpy.zeros(len(self.singularValues))
+    return self.singularValues ** 2 / (self.count - 1)
@@ -0,0 +1,94 @@
+# stroke rate (strokes per minute) from the autocorrelation of the stroke axis
+#
+# works on a fixed sliding window, so every update costs one FFT of the same size however
+# long the session is, and it doesn't need stroke segmentation to have worked - any
+# repeating motion shows up as a peak in the autocorrelation at one stroke period.
+
+import numpy
+
+class StrokeRateEstimator:
+  def __init__(self, sample_rate_hz=20.0, window_s=12.0, min_spm=10.0, max_spm=60.0, updates_per_s=4.0, min_confidence=0.3):
+    self.sample_rate_hz = float(sample_rate_hz)
+    self.window = max(8, int(round(window_s * self.sample_rate_hz)))
+    # lag range that covers the allowed stroke rates
+    self.minLag = max(1, int(numpy.floor(60.0 * self.sample_rate_hz / max_spm)))
+    self.maxLag = min(self.window - 2, int(numpy.ceil(60.0 * self.sample_rate_hz / min_spm)))
+    self.hop = max(1, int(round(self.sample_rate_hz / updates_per_s)))
+    self.min_confidence = min_confidence
+    # zero padded so the circular FFT correlation doesn't wrap
+    self.fftSize = 1 << int(numpy.ceil(numpy.log2(2 * self.window)))
+    self.reset()
+
+  def reset(self):
+    self.buffer = numpy.zeros(self.window)
+    self.count = 0
+    self.sinceUpdate = 0
+    self.spm = None
+    self.confidence = 0.0
+
+  def append(self, value):
+    self.buffer[self.count % self.window] = value
+    self.count += 1
+    self.sinceUpdate += 1
+
+  def extend(self, values):
+    values = numpy.asarray(values, dtype='float64').ravel()
+    self.sinceUpdate += len(values)
+    # anything older than the window would be overwritten anyway
+    skipped = max(0, len(values) - self.window)
+    self.count += skipped
+    values = values[skipped:]
+    positions = (self.count + numpy.arange(len(values))) % self.window
+    self.buffer[positions] = values
+    self.count += len(values)
+
+  def samples(self):
+    """The window in time order."""
+    if self.count < self.window:
+      return self.buffer[:self.count]
+    pos = self.count % self.window
+    return numpy.concatenate([self.buffer[pos:], self.buffer[:pos]])
+
+  def update(self, force=False):
+    """Re-estimate if enough new samples arrived; returns (spm, confidence)."""
+    if force or self.sinceUpdate >= self.hop:
+      self.sinceUpdate = 0
+      self.spm, self.confidence = self.estimate()
+    return self.spm, self.confidence
+
+  def estimate(self):
+    x = self.samples()
+    # need at least two of the slowest strokes in the window to see the period
+    if len(x) < min(self.window, 2 * self.minLag + 2):
+      return None, 0.0
+    x = x - x.mean()
+    spectrum = numpy.fft.rfft(x, self.fftSize)
+    acf = numpy.fft.irfft(spectrum * numpy.conj(spectrum), self.fftSize)[:len(x)]
+    if acf[0] <= 0:
+      return None, 0.0
+    # unbiased: later lags overlap fewer samples
+    acf = acf / acf[0] * len(x) / (len(x) - numpy.arange(len(x)))
+
+    maxLag = min(self.maxLag, len(x) // 2)
+    if maxLag <= self.minLag:
+      return None, 0.0
+    search = acf[self.minLag:maxLag + 1]
+    # first peak close to the best one, so a multiple of the period doesn't win
+    best = search.max()
+    lag = self.minLag + int(numpy.argmax(search))
+    for i in range(1, len(search) - 1):
+      if search[i] >= 0.85 * best and search[i] >= search[i - 1] and search[i] >= search[i + 1]:
+        lag = self.minLag + i
+        break
+    confidence = float(acf[lag])
+    if confidence < self.min_confidence:
+      return None, max(0.0, confidence)
+
+    # parabolic fit through the neighbours for a sub-sample period
+    refined = float(lag)
+    if 0 < lag < len(acf) - 1:
+      left, centre, right = acf[lag - 1], acf[lag], acf[lag + 1]
+      denominator = left - 2 * centre + right
+      if denominator < 0:
+        refined += 0.5 * (left - right) / denominator
+    return float(60.0 * self.sample_rate_hz / refined), min(1.0, confidence)
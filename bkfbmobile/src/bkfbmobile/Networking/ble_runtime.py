@@ -5,8 +5,12 @@ import contextlib
 import os
 import struct
 import sys
+import time
 from typing import Awaitable, Callable, Optional
 
+from bkfbmobile import latency, metrics
+from bkfbmobile.Networking import device_cache
+
 DEBUG_LOGS = False
 
 
@@ -14,10 +18,53 @@ def _log(*args, **kwargs):
     if DEBUG_LOGS:
         print(*args, **kwargs)
 
+UART_SERVICE = "6E400001-B5A3-F393-E0A9-E50E24DCCA9E"
 UART_TX = "6E400003-B5A3-F393-E0A9-E50E24DCCA9E"
 UART_RX = "6E400002-B5A3-F393-E0A9-E50E24DCCA9E"
 
-SampleHandler = Callable[[float, float, float], None]
+# commands: the app writes "#<tag> <command>" to UART_RX and the sensor answers
+# "#<tag> <reply>" on UART_TX, in among the samples. the tag says which request a reply
+# belongs to, so several can be in flight at once (see CommandChannel)
+TAG_PREFIX = "#"
+COMMAND_TIMEOUT = 2.0
+DOWNLOAD_TIMEOUT = 120.0  # the reply to DOWNLOAD comes after every recorded sample
+STATUS_COMMAND = "STATUS"
+DOWNLOAD_COMMAND = "DOWNLOAD"
+
+# sample rate control: "RATE <hz> <batch>", the sensor switches over and answers
+# "ACK RATE <hz> <batch>". with batch > 1 every notification carries that many
+# newline-separated samples. older firmware ignores the command and never acks, so the
+# app only ever changes rate once the sensor has
+RATE_COMMAND = "RATE"
+RATE_ACK = "ACK RATE"
+DEFAULT_SAMPLE_RATE_HZ = 20.0
+MIN_SAMPLE_RATE_HZ = 1.0
+MAX_SAMPLE_RATE_HZ = 100.0
+MAX_BATCH = 8  # 8 samples of ~40 characters still fit one notification
+
+# command channel of the current in-process session (needed to send commands while streaming)
+_current_channel = None
+
+_notify_metric = metrics.counter("ble.notifications")
+_parse_fail_metric = metrics.counter("ble.parse_failures")
+_heartbeat_metric = metrics.counter("ble.heartbeats")
+_stall_metric = metrics.counter("ble.stalls")
+_rssi_metric = metrics.gauge("ble.rssi")
+
+# link health (see LinkMonitor)
+LINK_OK = "ok"
+LINK_STALLED = "stalled"  # notifications overdue, probing with heartbeats
+LINK_DEAD = "dead"  # nothing for too long, or a heartbeat failed: end the session
+
+# (seq, x, y, z) - seq is the firmware sequence number
+SampleHandler = Callable[[int, float, float, float], None]
+# (rate_hz, batch) acknowledged by the sensor
+RateHandler = Callable[[float, int], None]
+
+
+def simulated() -> bool:
+    """BKFB_SIMULATED_SENSOR=1 swaps the BLE client for Networking.simulated_sensor."""
+    return os.environ.get("BKFB_SIMULATED_SENSOR", "").lower() in ("1", "true", "yes")
 
 
 def _is_android() -> bool:
@@ -37,6 +84,11 @@ def _backend_name() -> str:
 
 
 def _get_bleak_client_class():
+    if simulated():
+        from bkfbmobile.Networking.simulated_sensor import SimulatedSensor
+
+        return SimulatedSensor
+
     if _is_android():
         # Preferred import path for the bleekWare repo copied into this app package.
         try:
@@ -89,30 +141,351 @@ def decode_payload(data: bytes):
         return data
 
 
-def parse_xyz_sample(text: str) -> Optional[tuple[float, float, float]]:
+def parse_sequenced_sample(text: str) -> Optional[tuple[int, float, float, float]]:
     parts = text.strip().split()
     if len(parts) != 7 or parts[1] != "x" or parts[3] != "y" or parts[5] != "z":
         return None
 
     try:
-        return float(parts[2]), float(parts[4]), float(parts[6])
+        return int(parts[0]), float(parts[2]), float(parts[4]), float(parts[6])
     except ValueError:
         return None
 
 
+def parse_sequenced_samples(text: str) -> list[tuple[int, float, float, float]]:
+    """Every sample in a notification (one per line when the sensor batches them)."""
+    samples = []
+    for line in text.splitlines():
+        sample = parse_sequenced_sample(line)
+        if sample is not None:
+            samples.append(sample)
+    return samples
+
+
+def clamp_rate(rate_hz: float, batch: int = 1) -> tuple[float, int]:
+    rate_hz = min(MAX_SAMPLE_RATE_HZ, max(MIN_SAMPLE_RATE_HZ, float(rate_hz)))
+    batch = min(MAX_BATCH, max(1, int(batch)))
+    return rate_hz, batch
+
+
+def rate_command(rate_hz: float, batch: int = 1) -> str:
+    rate_hz, batch = clamp_rate(rate_hz, batch)
+    return f"{RATE_COMMAND} {rate_hz:g} {batch}"
+
+
+def parse_rate_ack(text: str) -> Optional[tuple[float, int]]:
+    """(rate_hz, batch) from an 'ACK RATE <hz> <batch>' notification."""
+    parts = text.strip().split()
+    if len(parts) != 4 or " ".join(parts[:2]) != RATE_ACK:
+        return None
+    try:
+        return float(parts[2]), int(parts[3])
+    except ValueError:
+        return None
+
+
+def parse_status(text: str) -> Optional[dict]:
+    """Fields of a 'STATUS <name> <value> ...' reply, numbers where they parse."""
+    parts = text.strip().split()
+    if not parts or parts[0] != STATUS_COMMAND or len(parts) % 2 != 1:
+        return None
+    status = {}
+    for name, value in zip(parts[1::2], parts[2::2]):
+        try:
+            status[name] = float(value) if "." in value else int(value)
+        except ValueError:
+            status[name] = value
+    return status
+
+
+def parse_download_done(text: str) -> Optional[int]:
+    """Record count from the 'DONE <n>' reply that ends a download."""
+    parts = text.strip().split()
+    if len(parts) != 2 or parts[0] != "DONE" or not parts[1].isdigit():
+        return None
+    return int(parts[1])
+
+
+def split_tag(text: str) -> tuple[Optional[int], str]:
+    """(tag, reply) for a tagged notification, (None, text) for anything else."""
+    if not text.startswith(TAG_PREFIX):
+        return None, text
+    tag, _sep, reply = text[len(TAG_PREFIX):].partition(" ")
+    try:
+        return int(tag), reply
+    except ValueError:
+        return None, text
+
+
+class CommandTimeout(Exception):
+    """The sensor didn't answer a command in time (or the connection went away)."""
+
+
+class CommandChannel:
+    """Tagged request/response over the UART characteristics.
+
+    request() writes "#<tag> <command>" and waits for the reply with the same tag; the
+    notification handler passes every notification through handle(), which resolves the
+    matching request. replies can arrive on the BLE backend's own thread.
+    """
+
+    MAX_TAG = 9999
+
+    def __init__(self, client):
+        self.client = client
+        self._pending = {}  # tag -> future
+        self._next_tag = 1
+
+    def __len__(self):
+        return len(self._pending)
+
+    def _tag(self) -> int:
+        tag = self._next_tag
+        while tag in self._pending:
+            tag = tag % self.MAX_TAG + 1
+        self._next_tag = tag % self.MAX_TAG + 1
+        return tag
+
+    async def request(self, command: str, timeout: float = COMMAND_TIMEOUT) -> str:
+        """Send one command and return the sensor's reply (without the tag)."""
+        tag = self._tag()
+        future = asyncio.get_running_loop().create_future()
+        self._pending[tag] = future
+        try:
+            await self.client.write_gatt_char(UART_RX, f"{TAG_PREFIX}{tag} {command}".encode("utf-8"))
+            return await asyncio.wait_for(future, timeout)
+        except asyncio.TimeoutError:
+            raise CommandTimeout(f"No reply to {command.split()[0]} within {timeout:g} s") from None
+        finally:
+            self._pending.pop(tag, None)
+
+    def handle(self, text: str) -> tuple[Optional[int], str]:
+        """Route a tagged reply to its request; returns split_tag(text) either way."""
+        tag, reply = split_tag(text)
+        if tag is not None:
+            future = self._pending.get(tag)
+            if future is not None:
+                future.get_loop().call_soon_threadsafe(_resolve, future, reply)
+        return tag, reply
+
+    def close(self) -> None:
+        """Fail everything still waiting (the connection is going away)."""
+        for future in list(self._pending.values()):
+            future.get_loop().call_soon_threadsafe(_fail, future, CommandTimeout("Disconnected"))
+        self._pending.clear()
+
+
+def _resolve(future, reply):
+    if not future.done():
+        future.set_result(reply)
+
+
+def _fail(future, exc):
+    if not future.done():
+        future.set_exception(exc)
+
+
+async def request(command: str, timeout: float = COMMAND_TIMEOUT) -> Optional[str]:
+    """Command to the sensor of the current in-process session; None when not connected."""
+    channel = _current_channel
+    if channel is None:
+        return None
+    return await channel.request(command, timeout)
+
+
+async def request_sample_rate(rate_hz: float, batch: int = 1) -> Optional[tuple[float, int]]:
+    """Ask the sensor for a new rate; (rate_hz, batch) it acked (it's applied on that ack)."""
+    reply = await request(rate_command(rate_hz, batch))
+    return None if reply is None else parse_rate_ack(reply)
+
+
+async def request_status() -> Optional[dict]:
+    reply = await request(STATUS_COMMAND)
+    return None if reply is None else parse_status(reply)
+
+
+async def request_download() -> Optional[int]:
+    """Have the sensor send back what it recorded offline; returns how many records it sent."""
+    reply = await request(DOWNLOAD_COMMAND, timeout=DOWNLOAD_TIMEOUT)
+    return None if reply is None else parse_download_done(reply)
+
+
+def parse_recorded_sample(text: str) -> Optional[tuple[int, float, float, float]]:
+    """Parse an '[OLD] seq x .. y .. z ..' line sent back during a data download."""
+    parts = text.strip().split()
+    if len(parts) != 8 or parts[0] != "[OLD]":
+        return None
+    return parse_sequenced_sample(" ".join(parts[1:]))
+
+
+def parse_xyz_sample(text: str) -> Optional[tuple[float, float, float]]:
+    sample = parse_sequenced_sample(text)
+    if sample is None:
+        return None
+    return sample[1:]
+
+
 async def discover(timeout: float = 5.0):
     scanner_cls = _get_bleak_scanner_class()
-    devices = await scanner_cls.discover(timeout=timeout)
-    return devices
+    found = await scanner_cls.discover(timeout=timeout, return_adv=True)
+    device_cache.remember_scan(found.values())
+    return [device for device, _adv in found.values()]
 
 
-async def _keep_alive(client, interval: float = 8.0) -> None:
-    while True:
-        try:
-            await client.write_gatt_char(UART_RX, b"batman")
-        except Exception:
-            return
-        await asyncio.sleep(interval)
+async def resolve_device(address: str, timeout: float = 10.0) -> None:
+    """Make sure this process has a scanned BLEDevice for address (see client_args).
+
+    The app's scans only help connects from the app process; the desktop worker runs in
+    its own, so it looks the sensor up once itself and every later connect skips the scan.
+    """
+    if _is_android() or simulated() or device_cache.scanned_device(address) is not None:
+        return
+    scanner_cls = _get_bleak_scanner_class()
+    device = await scanner_cls.find_device_by_address(address, timeout=timeout)
+    if device is None:
+        raise ConnectionError(f"Sensor {address} not found")
+    device_cache.remember_scan([device])
+
+
+def client_args(address: str):
+    """Connect target and client kwargs, using the device cache to skip scanning/discovery where we can."""
+    if _is_android():
+        # bleekWare already connects straight from the address and can't filter services
+        return address, {}
+
+    target = device_cache.scanned_device(address) or address
+    kwargs = {}
+    if device_cache.is_known(address):
+        # we already know the UART service lives here, so only discover that one
+        kwargs["services"] = [UART_SERVICE]
+    return target, kwargs
+
+
+def remember_connection(client, address: str) -> None:
+    """Store MTU and GATT handles for a freshly connected client."""
+    if simulated():
+        return
+    try:
+        device_cache.remember_device(
+            address,
+            name=getattr(getattr(client, "device", None), "name", None),
+            mtu=getattr(client, "mtu_size", None),
+            handles=device_cache.gatt_handles(client, (UART_TX, UART_RX)),
+        )
+    except Exception as e:
+        _log(f"[ble_runtime] Could not update device cache: {e}")
+
+
+class LinkMonitor:
+    """Connection health from the notifications themselves.
+
+    The sensor streams all the time, so a notification is the best sign of a live link and
+    heartbeats ("batman", which the firmware ignores) are only written once nothing has come
+    in for heartbeat_idle_s (a couple of notification periods, at least heartbeat_min_s) -
+    while data flows they would only compete with it for airtime.
+    The link counts as stalled after a few missed notification periods (at the current rate
+    and batch) and dead a little after that, or as soon as a heartbeat can't be written.
+    RSSI is read now and then on backends that can (get_rssi); bleak can't while connected.
+    """
+
+    check_interval_s = 0.25
+    heartbeat_min_s = 2.0
+    heartbeat_periods = 2
+    stall_periods = 4
+    stall_min_s = 1.0
+    dead_periods = 8
+    dead_min_s = 5.0
+    rssi_interval_s = 5.0
+
+    def __init__(self, client, rate_hz: float = DEFAULT_SAMPLE_RATE_HZ, batch: int = 1):
+        self.client = client
+        self.state = LINK_OK
+        self.rssi = None
+        self.heartbeats = 0
+        self.stalls = 0
+        self.set_rate(rate_hz, batch)
+        self.last_rx = self.last_heartbeat = time.monotonic()
+        self._next_rssi = self.last_rx
+
+    def received(self) -> None:
+        """Call for every notification; it's the whole per-notification cost."""
+        self.last_rx = time.monotonic()
+
+    def set_rate(self, rate_hz: float, batch: int = 1) -> None:
+        # seconds between notifications at this rate
+        self.period = max(1, int(batch)) / float(rate_hz)
+        # slow, batched rates leave gaps longer than heartbeat_min_s between notifications
+        self.heartbeat_idle_s = max(self.heartbeat_min_s, self.heartbeat_periods * self.period)
+
+    def idle(self) -> float:
+        return time.monotonic() - self.last_rx
+
+    def stall_after(self) -> float:
+        return max(self.stall_min_s, self.stall_periods * self.period)
+
+    def dead_after(self) -> float:
+        return max(self.dead_min_s, self.dead_periods * self.period)
+
+    async def check(self) -> str:
+        """One look at the link: heartbeat if it has gone quiet, update the state."""
+        now = time.monotonic()
+        idle = now - self.last_rx
+        if idle >= self.heartbeat_idle_s and now - self.last_heartbeat >= self.heartbeat_idle_s:
+            self.last_heartbeat = now
+            try:
+                await self.client.write_gatt_char(UART_RX, b"batman")
+            except Exception:
+                self.state = LINK_DEAD
+                return self.state
+            self.heartbeats += 1
+            _heartbeat_metric.inc()
+
+        if now >= self._next_rssi:
+            self._next_rssi = now + self.rssi_interval_s
+            await self.read_rssi()
+
+        if idle >= self.dead_after():
+            self.state = LINK_DEAD
+        elif idle >= self.stall_after():
+            if self.state != LINK_STALLED:
+                self.stalls += 1
+                _stall_metric.inc()
+            self.state = LINK_STALLED
+        else:
+            self.state = LINK_OK
+        return self.state
+
+    async def read_rssi(self) -> Optional[int]:
+        get_rssi = getattr(self.client, "get_rssi", None)
+        if get_rssi is None:
+            return None
+        with contextlib.suppress(Exception):
+            rssi = await asyncio.wait_for(get_rssi(), timeout=1.0)
+            if rssi is not None:
+                self.rssi = int(rssi)
+                _rssi_metric.set(self.rssi)
+        return self.rssi
+
+    async def run(self, on_change: Optional[Callable[[str, float], Awaitable[None]]] = None) -> str:
+        """Check until the link is dead; on_change(state, idle seconds) on every change."""
+        state = self.state
+        while True:
+            await asyncio.sleep(self.check_interval_s)
+            new_state = await self.check()
+            if new_state != state:
+                state = new_state
+                if on_change:
+                    await on_change(state, self.idle())
+            if state == LINK_DEAD:
+                return state
+
+
+def link_status_text(state: str, idle: float) -> str:
+    if state == LINK_STALLED:
+        return f"No data for {idle:.1f} s..."
+    if state == LINK_DEAD:
+        return f"Link lost (no data for {idle:.1f} s)"
+    return "Connected"
 
 
 async def stream_samples(
@@ -120,7 +493,11 @@ async def stream_samples(
     on_sample: SampleHandler,
     stop_event: asyncio.Event,
     on_status: Optional[Callable[[str], Awaitable[None]]] = None,
+    on_rate: Optional[RateHandler] = None,
+    on_recorded: Optional[SampleHandler] = None,
 ) -> None:
+    """Stream samples from the sensor until stop_event; on_recorded gets downloaded ones."""
+    global _current_channel
     _log(f"[ble_runtime] stream_samples starting for {address} using {_backend_name()}")
     disconnect_event = asyncio.Event()
 
@@ -134,47 +511,99 @@ async def stream_samples(
         disconnect_event.set()
 
     def on_rx(_sender, data):
+        rx_ns = latency.now() if latency.enabled else None
+        _notify_metric.inc()
+        if monitor is not None:
+            monitor.received()
         _log(f"[ble_runtime] Received {len(data)} bytes: {data[:50]}")  # Show first 50 bytes
         decoded = decode_payload(bytes(data))
         _log(f"[ble_runtime] Decoded: {decoded}")
         if not isinstance(decoded, str):
             _log(f"[ble_runtime] Decoded is not string, type: {type(decoded)}")
+            _parse_fail_metric.inc()
+            return
+
+        # what the sensor recorded offline, sent back during a DOWNLOAD
+        if decoded.startswith("[OLD]"):
+            recorded = parse_recorded_sample(decoded)
+            if recorded is None:
+                _parse_fail_metric.inc()
+            elif on_recorded:
+                on_recorded(*recorded)
             return
 
-        sample = parse_xyz_sample(decoded)
-        if sample is None:
-            _log("[ble_runtime] parse_xyz_sample returned None")
+        # samples never start with the tag prefix, so this costs them one check
+        if decoded.startswith(TAG_PREFIX) and channel is not None:
+            tag, decoded = channel.handle(decoded)
+        else:
+            tag = None
+
+        # rate acks also switch the app over, in order with the samples
+        ack = parse_rate_ack(decoded)
+        if ack is not None:
+            _log(f"[ble_runtime] Sensor rate now {ack[0]} Hz, {ack[1]} per notification")
+            if monitor is not None:
+                monitor.set_rate(*ack)
+            if on_rate:
+                on_rate(*ack)
             return
+        if tag is not None:
+            return
+
+        samples = parse_sequenced_samples(decoded)
+        if not samples:
+            _log("[ble_runtime] parse_sequenced_samples found no sample")
+            _parse_fail_metric.inc()
+            return
+
+        _log(f"[ble_runtime] Parsed samples: {samples}")
+        for sample in samples:
+            if rx_ns is not None:
+                latency.mark(sample[0], "notify", rx_ns)
+                latency.mark(sample[0], "decode")
+            on_sample(*sample)
 
-        _log(f"[ble_runtime] Parsed sample: {sample}")
-        on_sample(*sample)
+    async def on_link_change(state: str, idle: float) -> None:
+        await emit_status(link_status_text(state, idle))
 
+    channel = None
+    monitor = None
     client_cls = _get_bleak_client_class()
     _log(f"[ble_runtime] Got client class: {client_cls}")
     await emit_status(f"Connecting using {_backend_name()}...")
 
     try:
-        async with client_cls(address, disconnected_callback=on_disconnect) as client:
+        await resolve_device(address)
+        target, client_kwargs = client_args(address)
+        async with client_cls(target, disconnected_callback=on_disconnect, **client_kwargs) as client:
             _log("[ble_runtime] Client connected, setting up notifications")
             await emit_status("Connected")
+            remember_connection(client, address)
+            channel = CommandChannel(client)
+            monitor = LinkMonitor(client)
             await client.start_notify(UART_TX, on_rx)
             _log(f"[ble_runtime] Notifications started for {UART_TX}")
             await client.write_gatt_char(UART_RX, b"batman initiated")
             _log(f"[ble_runtime] Wrote initiation command to {UART_RX}")
             _log("[ble_runtime] Entering main loop, waiting for data...")
+            _current_channel = channel
 
-            keep_task = asyncio.create_task(_keep_alive(client))
+            monitor_task = asyncio.create_task(monitor.run(on_link_change))
             try:
-                while not stop_event.is_set() and not disconnect_event.is_set():
+                while not stop_event.is_set() and not disconnect_event.is_set() and not monitor_task.done():
                     await asyncio.sleep(0.05)
             finally:
-                keep_task.cancel()
+                _current_channel = None
+                channel.close()
+                monitor_task.cancel()
                 with contextlib.suppress(asyncio.CancelledError):
-                    await keep_task
+                    await monitor_task
                     
         _log("[ble_runtime] Client disconnected cleanly")
     except Exception as e:
         _log(f"[ble_runtime] Exception in stream_samples: {e}")
+        # the device may have gone stale; look it up afresh next time
+        device_cache.forget_scanned_device(address)
         import traceback
         traceback.print_exc()
         raise
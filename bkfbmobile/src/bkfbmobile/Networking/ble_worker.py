@@ -1,4 +1,9 @@
 # this is the BLE backbone of hte project
+#
+# the app starts this once in the background and keeps it alive, sending json commands
+# on stdin ({"cmd": "connect" | "disconnect" | "download" | "rate" | "status" | "quit"}), so a connect doesn't
+# pay for interpreter startup, the bleak import and the D-Bus setup every time.
+# passing an address on the command line still does a single one-shot session.
 
 import asyncio
 import contextlib
@@ -8,14 +13,26 @@ import sys
 
 from bleak import BleakClient
 
+from bkfbmobile import latency
+from bkfbmobile.Networking import ble_runtime, device_cache
+
 # addresses for recieve and send
 UART_TX = "6E400003-B5A3-F393-E0A9-E50E24DCCA9E"
 UART_RX = "6E400002-B5A3-F393-E0A9-E50E24DCCA9E"
 
 
+# command channel for the current session (needed by the sensor commands)
+_current_channel = None
+
+# plain counters, sent to the app once a second as a "metrics" message
+METRICS_INTERVAL = 1.0
+_stats = {"notifications": 0, "parse_failures": 0, "samples": 0, "heartbeats": 0, "stalls": 0}
+
+
 def emit(payload):
     print(json.dumps(payload), flush=True)
 
+
 # decodes incoming data
 def decode_to_float(data: bytes):
     try:
@@ -34,64 +51,212 @@ def decode_to_float(data: bytes):
             return [struct.unpack("<f", data[i : i + 4])[0] for i in range(0, len(data), 4)]
         return data
 
-# heartbeat function because bluetooth likes to die when left idle :(
-async def keep_alive(client: BleakClient, interval: float = 8.0) -> None:
-    while True:
-        try:
-            # send in batman to make sure its safe
-            await client.write_gatt_char(UART_RX, b"batman")
-        except Exception:
-            return
-        await asyncio.sleep(interval)
-
-
-async def run(address: str):
+async def run(address: str, stop_event: asyncio.Event = None, session=None):
+    global _current_channel
     disconnect_event = asyncio.Event()
 
+    def send(payload):
+        # tag everything with the session so the app can ignore leftovers from older sessions
+        if session is not None:
+            payload["session"] = session
+        emit(payload)
+
     def on_disconnect(_client):
         disconnect_event.set()
 
     def on_rx(_sender, data):
+        rx_ns = latency.now() if latency.enabled else None
+        _stats["notifications"] += 1
+        if monitor is not None:
+            monitor.received()
         decoded = decode_to_float(bytes(data))
         if not isinstance(decoded, str):
+            _stats["parse_failures"] += 1
             return
 
-        parts = decoded.strip().split()
-        if len(parts) != 7 or parts[1] != "x" or parts[3] != "y" or parts[5] != "z":
+        recorded = ble_runtime.parse_recorded_sample(decoded)
+        if recorded is not None:
+            seq, x_value, y_value, z_value = recorded
+            send({"type": "recorded", "seq": seq, "x": x_value, "y": y_value, "z": z_value})
             return
 
-        try:
-            x_value = float(parts[2])
-            y_value = float(parts[4])
-            z_value = float(parts[6])
-        except ValueError:
+        tag = None
+        if decoded.startswith(ble_runtime.TAG_PREFIX) and channel is not None:
+            tag, decoded = channel.handle(decoded)
+
+        ack = ble_runtime.parse_rate_ack(decoded)
+        if ack is not None:
+            # in line with the samples, so the app switches over between the right two
+            if monitor is not None:
+                monitor.set_rate(*ack)
+            send({"type": "rate", "rate_hz": ack[0], "batch": ack[1]})
+            return
+        if tag is not None:
             return
 
-        emit({"type": "sample", "x": x_value, "y": y_value, "z": z_value})
+        samples = ble_runtime.parse_sequenced_samples(decoded)
+        if not samples:
+            _stats["parse_failures"] += 1
+            return
+
+        decode_ns = latency.now() if rx_ns is not None else None
+        for seq, x_value, y_value, z_value in samples:
+            _stats["samples"] += 1
+            payload = {"type": "sample", "seq": seq, "x": x_value, "y": y_value, "z": z_value}
+            if rx_ns is not None:
+                # same clock as the app, it merges these into its own trace
+                payload["t"] = {"notify": rx_ns, "decode": decode_ns}
+            send(payload)
+
+    async def on_link_change(state, idle):
+        send({"type": "status", "text": ble_runtime.link_status_text(state, idle)})
 
-    emit({"type": "status", "text": "Connecting..."})
-    async with BleakClient(address, disconnected_callback=on_disconnect) as client:
-        emit({"type": "status", "text": "Connected"})
+    def stats():
+        # heartbeats (bluetooth likes to die when left idle :( ) and stalls come from the monitor
+        _stats["heartbeats"] = monitor.heartbeats
+        _stats["stalls"] = monitor.stalls
+        if monitor.rssi is not None:
+            _stats["rssi"] = monitor.rssi
+        return dict(_stats)
+
+    channel = None
+    monitor = None
+    send({"type": "status", "text": "Connecting..."})
+    # found once per worker, so reconnects skip the scan; known devices also skip the full
+    # service discovery
+    await ble_runtime.resolve_device(address)
+    target, client_kwargs = ble_runtime.client_args(address)
+    client_cls = BleakClient
+    if ble_runtime.simulated():
+        from bkfbmobile.Networking.simulated_sensor import SimulatedSensor
+        client_cls = SimulatedSensor
+    async with client_cls(target, disconnected_callback=on_disconnect, **client_kwargs) as client:
+        send({"type": "status", "text": "Connected"})
+        ble_runtime.remember_connection(client, address)
+        channel = ble_runtime.CommandChannel(client)
+        monitor = ble_runtime.LinkMonitor(client)
         await client.start_notify(UART_TX, on_rx)
         await client.write_gatt_char(UART_RX, b"batman initiated")
+        _current_channel = channel
 
-        keep_task = asyncio.create_task(keep_alive(client))
+        monitor_task = asyncio.create_task(monitor.run(on_link_change))
+        loop = asyncio.get_running_loop()
+        next_metrics = loop.time() + METRICS_INTERVAL
         try:
-            while not disconnect_event.is_set():
+            while not disconnect_event.is_set() and not monitor_task.done():
+                if stop_event is not None and stop_event.is_set():
+                    break
+                if loop.time() >= next_metrics:
+                    send({"type": "metrics", "stats": stats()})
+                    next_metrics += METRICS_INTERVAL
                 await asyncio.sleep(0.05)
         finally:
-            keep_task.cancel()
+            _current_channel = None
+            channel.close()
+            monitor_task.cancel()
             with contextlib.suppress(asyncio.CancelledError):
-                await keep_task
+                await monitor_task
 
-    emit({"type": "disconnected"})
+    send({"type": "disconnected"})
 
 
-def main():
-    address = sys.argv[1].strip()
+async def run_session(address: str, stop_event: asyncio.Event, session) -> None:
+    # errors end the session, not the worker
+    try:
+        await run(address, stop_event=stop_event, session=session)
+    except Exception as exc:
+        # the device may have gone stale; look it up afresh next time
+        device_cache.forget_scanned_device(address)
+        emit({"type": "error", "text": str(exc), "session": session})
+
+
+async def run_command(command: dict) -> None:
+    """One sensor command from the app, run alongside the others; replies go back tagged with the session."""
+    cmd = command.get("cmd")
+    session = command.get("session")
+    channel = _current_channel
+    if channel is None:
+        emit({"type": "status", "text": "Not connected", "session": session})
+        emit_no_reply(cmd, session)
+        return
+    try:
+        if cmd == "download":
+            # the recorded samples come back as "recorded" messages before the reply
+            reply = await channel.request(ble_runtime.DOWNLOAD_COMMAND, ble_runtime.DOWNLOAD_TIMEOUT)
+            emit({"type": "downloaded", "count": ble_runtime.parse_download_done(reply), "session": session})
+        elif cmd == "rate":
+            rate_hz = command.get("rate_hz", ble_runtime.DEFAULT_SAMPLE_RATE_HZ)
+            # the ack itself reaches the app as a "rate" message, in order with the samples
+            await channel.request(ble_runtime.rate_command(rate_hz, command.get("batch", 1)))
+        elif cmd == "status":
+            reply = await channel.request(ble_runtime.STATUS_COMMAND)
+            emit({"type": "sensor_status", "status": ble_runtime.parse_status(reply), "session": session})
+    except Exception as exc:
+        emit({"type": "status", "text": f"Sensor {cmd} failed: {exc}", "session": session})
+        emit_no_reply(cmd, session)
+
+
+def emit_no_reply(cmd: str, session) -> None:
+    """Answer a download or status the app is waiting on when the sensor can't."""
+    if cmd == "download":
+        emit({"type": "downloaded", "count": None, "session": session})
+    elif cmd == "status":
+        emit({"type": "sensor_status", "status": None, "session": session})
+
+
+async def serve() -> None:
+    loop = asyncio.get_running_loop()
+    session_task = None
+    stop_event = None
+    command_tasks = set()
 
+    emit({"type": "ready"})
+
+    while True:
+        # stdin in a thread so this works the same on every platform's event loop
+        line = await loop.run_in_executor(None, sys.stdin.readline)
+        if not line:
+            # the app went away, so should we
+            break
+
+        try:
+            command = json.loads(line)
+        except ValueError:
+            continue
+
+        cmd = command.get("cmd")
+        session = command.get("session")
+        if cmd == "connect":
+            if session_task is not None and not session_task.done():
+                emit({"type": "error", "text": "Already connected", "session": session})
+                continue
+            stop_event = asyncio.Event()
+            session_task = asyncio.create_task(
+                run_session(command.get("address", "").strip(), stop_event, session)
+            )
+        elif cmd == "disconnect":
+            if stop_event is not None:
+                stop_event.set()
+        elif cmd in ("download", "rate", "status"):
+            # several can wait on the sensor at once without holding up stdin
+            command_tasks.add(asyncio.create_task(run_command(command)))
+            command_tasks = {task for task in command_tasks if not task.done()}
+        elif cmd == "quit":
+            break
+
+    if stop_event is not None:
+        stop_event.set()
+    if session_task is not None:
+        with contextlib.suppress(Exception):
+            await asyncio.wait_for(session_task, timeout=2.0)
+
+
+def main():
     try:
-        asyncio.run(run(address))
+        if len(sys.argv) > 1:
+            asyncio.run(run(sys.argv[1].strip()))
+        else:
+            asyncio.run(serve())
     except Exception as exc:
         emit({"type": "error", "text": str(exc)})
         raise SystemExit(1)
@@ -0,0 +1,153 @@
+# remembers the sensors we've talked to so connect/scan don't start from nothing every time
+
+import json
+import os
+import time
+from typing import Optional
+
+CACHE_PATH = os.path.join(os.path.dirname(__file__), "KnownDevices.json")
+
+# BLEDevice objects from scans in this process. passing one of these to the client
+# instead of a bare address lets bleak skip its own find-by-address scan. only good in
+# the process that scanned (the worker resolves its own, see ble_runtime.resolve_device)
+_scanned_devices = {}
+
+
+def _normalize(address: str) -> str:
+    return (address or "").strip().upper()
+
+
+def load_devices(path: str = CACHE_PATH) -> dict:
+    """Return the cached device records keyed by normalized address."""
+    try:
+        if os.path.exists(path):
+            with open(path, "r") as f:
+                devices = json.load(f)
+            if isinstance(devices, dict):
+                return devices
+    except Exception as e:
+        print(f"Error loading device cache: {e}")
+    return {}
+
+
+def save_devices(devices: dict, path: str = CACHE_PATH) -> None:
+    # write to a temp file first so a crash mid-write doesn't wipe the cache
+    tmp_path = f"{path}.tmp"
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(tmp_path, "w") as f:
+            json.dump(devices, f, indent=2, sort_keys=True)
+        os.replace(tmp_path, path)
+    except Exception as e:
+        print(f"Error saving device cache: {e}")
+
+
+def get_device(address: str, path: str = CACHE_PATH) -> Optional[dict]:
+    return load_devices(path).get(_normalize(address))
+
+
+def is_known(address: str, path: str = CACHE_PATH) -> bool:
+    """Connected before and found the UART characteristics, so discovery can stop at that service.
+
+    bleak can't be handed the stored handles themselves; they're kept for diagnostics.
+    """
+    record = get_device(address, path)
+    return bool(record and record.get("handles"))
+
+
+def remember_device(
+    address: str,
+    name: Optional[str] = None,
+    rssi: Optional[int] = None,
+    mtu: Optional[int] = None,
+    handles: Optional[dict] = None,
+    path: str = CACHE_PATH,
+) -> dict:
+    """Merge new metadata for one device into the cache and persist it."""
+    key = _normalize(address)
+    devices = load_devices(path)
+    record = devices.get(key, {"address": address.strip()})
+
+    if name:
+        record["name"] = name
+    if rssi is not None:
+        record["rssi"] = int(rssi)
+    if mtu:
+        record["mtu"] = int(mtu)
+    if handles:
+        record["handles"] = {uuid.upper(): int(handle) for uuid, handle in handles.items()}
+    record["last_seen"] = time.time()
+
+    devices[key] = record
+    save_devices(devices, path)
+    return record
+
+
+def remember_scan(scanned, path: str = CACHE_PATH) -> None:
+    """Record the results of a BLE scan (one cache write for the whole batch).
+
+    Accepts plain devices or (device, advertisement_data) pairs from discover(return_adv=True).
+    """
+    devices = load_devices(path)
+    now = time.time()
+    for item in scanned:
+        device, adv = item if isinstance(item, tuple) else (item, None)
+        address = getattr(device, "address", None)
+        if not address:
+            continue
+        key = _normalize(address)
+        _scanned_devices[key] = device
+
+        record = devices.get(key, {"address": address})
+        name = getattr(device, "name", None)
+        if name:
+            record["name"] = name
+        rssi = getattr(adv, "rssi", None)
+        if rssi is not None:
+            record["rssi"] = int(rssi)
+        record["last_seen"] = now
+        devices[key] = record
+    save_devices(devices, path)
+
+
+def known_devices(path: str = CACHE_PATH) -> list:
+    """Cached device records, most recently seen first."""
+    devices = list(load_devices(path).values())
+    devices.sort(key=lambda record: record.get("last_seen", 0), reverse=True)
+    return devices
+
+
+def scanned_device(address: str):
+    """BLEDevice from an earlier scan in this process, if we have one."""
+    return _scanned_devices.get(_normalize(address))
+
+
+def forget_scanned_device(address: str) -> None:
+    _scanned_devices.pop(_normalize(address), None)
+
+
+def device_label(record: dict) -> str:
+    return f"{record.get('name') or 'Unknown'} ({record.get('address', '')})"
+
+
+def gatt_handles(client, uuids) -> dict:
+    """Characteristic handles for the given UUIDs on a connected client, where the backend exposes them."""
+    handles = {}
+    try:
+        services = client.services
+    except Exception:
+        return handles
+
+    getter = getattr(services, "get_characteristic", None)
+    if getter is None:
+        return handles
+
+    for uuid in uuids:
+        try:
+            characteristic = getter(uuid)
+        except Exception:
+            characteristic = None
+        handle = getattr(characteristic, "handle", None)
+        if handle is not None:
+            handles[uuid] = handle
+    return handles
@@ -0,0 +1,119 @@
+# stand-in for the ESP32, for working on the app (and testing) without the hardware
+#
+# looks like the part of a bleak client ble_runtime and ble_worker use, and speaks the same
+# UART protocol as the firmware: numbered "seq x .. y .. z .." notifications at the current
+# rate (batched when asked to), "RATE <hz> <batch>" answered with "ACK RATE <hz> <batch>",
+# STATUS and DOWNLOAD ("[OLD] ..." lines for whatever is in recorded) answered, replies
+# tagged like the command was,
+# and everything else ("batman", "GIMMEH DATAH") ignored.
+# turn it on with BKFB_SIMULATED_SENSOR=1.
+
+import asyncio
+import contextlib
+import math
+import random
+from typing import Callable, Optional
+
+from bkfbmobile.Networking import ble_runtime
+
+
+class SimulatedSensor:
+    mtu_size = 247
+    stroke_period_s = 2.4
+
+    def __init__(self, address, disconnected_callback: Optional[Callable] = None, **_kwargs):
+        self.address = address
+        self.disconnected_callback = disconnected_callback
+        self.paused = False  # stop notifying without disconnecting, like a stalled link
+        self.rate_hz = ble_runtime.DEFAULT_SAMPLE_RATE_HZ
+        self.batch = 1
+        self.sequence = 1
+        self.time_s = 0.0
+        self.written = []  # every command the app wrote, for tests
+        self.recorded = []  # (seq, x, y, z) "recorded offline", sent back on DOWNLOAD
+        self._notify = None
+        self._task = None
+        self._random = random.Random(0)
+
+    @property
+    def is_connected(self) -> bool:
+        return self._task is not None
+
+    async def get_rssi(self) -> int:
+        # like bleekWare's; a sensor at arm's length
+        return -60 + self._random.randint(-3, 3)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *_exc):
+        await self.disconnect()
+
+    async def disconnect(self) -> None:
+        task, self._task = self._task, None
+        if task is not None:
+            task.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await task
+
+    async def start_notify(self, _char, callback) -> None:
+        self._notify = callback
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def write_gatt_char(self, _char, data: bytes, response: bool = False) -> None:
+        text = bytes(data).decode("utf-8", "replace").strip()
+        self.written.append(text)
+        tag, command = ble_runtime.split_tag(text)
+        reply = self.reply(command)
+        if reply is not None:
+            self._send(reply if tag is None else f"{ble_runtime.TAG_PREFIX}{tag} {reply}")
+
+    def reply(self, command: str) -> Optional[str]:
+        parts = command.split()
+        if len(parts) == 3 and parts[0] == ble_runtime.RATE_COMMAND:
+            try:
+                rate_hz, batch = ble_runtime.clamp_rate(float(parts[1]), int(parts[2]))
+            except ValueError:
+                return None
+            # the firmware switches at the next sample, then acks
+            self.rate_hz, self.batch = rate_hz, batch
+            return f"{ble_runtime.RATE_ACK} {rate_hz:g} {batch}"
+        if parts == [ble_runtime.STATUS_COMMAND]:
+            return f"{ble_runtime.STATUS_COMMAND} rate {self.rate_hz:g} batch {self.batch} seq {self.sequence}"
+        if parts == [ble_runtime.DOWNLOAD_COMMAND]:
+            for seq, x, y, z in self.recorded:
+                self._send(f"[OLD] {seq} x {x:.3f} y {y:.3f} z {z:.3f}")
+            return f"DONE {len(self.recorded)}"
+        return None
+
+    def _send(self, text: str) -> None:
+        if self._notify is not None:
+            self._notify(None, bytearray(text.encode("utf-8")))
+
+    def sample(self, seq: int) -> str:
+        # a rough stroke on y (drive and recovery) plus gravity on z and a little noise
+        phase = 2 * math.pi * self.time_s / self.stroke_period_s
+        y = 15.0 * math.sin(phase) + 5.0 * math.sin(2 * phase + 1.0)
+        x = self._random.gauss(0.0, 0.2)
+        z = 9.81 + self._random.gauss(0.0, 0.2)
+        return f"{seq} x {x:.3f} y {y + self._random.gauss(0.0, 0.2):.3f} z {z:.3f}"
+
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+        next_time = loop.time()
+        lines = []
+        while True:
+            if self.paused:
+                await asyncio.sleep(1.0 / self.rate_hz)
+                next_time = loop.time()
+                continue
+            lines.append(self.sample(self.sequence))
+            self.sequence += 1
+            self.time_s += 1.0 / self.rate_hz
+            if len(lines) >= self.batch:
+                self._send("\n".join(lines))
+                lines = []
+            # keep to the rate on average, like the firmware's delay per sample
+            next_time += 1.0 / self.rate_hz
+            await asyncio.sleep(max(0.0, next_time - loop.time()))
@@ -8,11 +8,16 @@ Multi-page app with Live Feed, Average Stroke, and Bluetooth Config screens.
 import asyncio
 import os
 import sys
+import time
 import toga
 from toga.style import Pack
 from toga.style.pack import COLUMN, ROW
 
-from bkfbmobile import bkfb
+from bkfbmobile import bkfb, canvasPlot, frameImage, latency, metrics
+from bkfbmobile.Networking import device_cache
+
+# sensor sample rates offered on the config page
+SAMPLE_RATE_CHOICES = {"10 Hz": 10.0, "20 Hz": 20.0, "50 Hz": 50.0}
 
 
 class BeeWareProject(toga.App):
@@ -24,11 +29,38 @@ class BeeWareProject(toga.App):
         # Detect if running on mobile
         self.is_mobile = self.detectMobile()
 
-        # Shared image views that will be updated by BLE stream
-        self.live_plot_view = toga.ImageView(style=Pack(flex=1, margin=10))
+        # Shared image views that will be updated by BLE stream.
+        # The live feed draws natively on a canvas unless BKFB_LIVE_RENDER=png.
+        self.live_render_mode = (
+            bkfb.LIVE_RENDER_PNG
+            if os.environ.get("BKFB_LIVE_RENDER", "").lower() == bkfb.LIVE_RENDER_PNG
+            else bkfb.LIVE_RENDER_CANVAS
+        )
+        bkfb.setLiveRenderMode(self.live_render_mode)
+        # Matplotlib pages hand over raw RGBA frames unless BKFB_FRAME_FORMAT=png.
+        if os.environ.get("BKFB_FRAME_FORMAT", "").lower() == bkfb.FRAME_PNG:
+            bkfb.setFrameFormat(bkfb.FRAME_PNG)
+        else:
+            bkfb.setFrameFormat(bkfb.FRAME_RGBA)
+        self.live_canvas_size = (640, 400)
+        self.last_live_frame = None
+        if self.live_render_mode == bkfb.LIVE_RENDER_CANVAS:
+            self.live_plot_view = toga.Canvas(style=Pack(flex=1, margin=10), on_resize=self.onLiveCanvasResize)
+        else:
+            self.live_plot_view = toga.ImageView(style=Pack(flex=1, margin=10))
         self.avg_plot_view = toga.ImageView(style=Pack(flex=1, margin=10))
         self.compare_plot_view = toga.ImageView(style=Pack(flex=1, margin=10))
         self.status_label = toga.Label("Idle", style=Pack(margin=5))
+        self.diagnostics_view = toga.MultilineTextInput(readonly=True, style=Pack(flex=1, margin=10))
+        # saved sessions, drawn from their zoom pyramid
+        self.recorded_session = None
+        self.session_names = []
+        self.session_window = (0, 0)
+        self.session_canvas_size = (640, 400)
+        self.session_view = toga.Canvas(style=Pack(flex=1, margin=10), on_resize=self.onSessionCanvasResize)
+        self.session_selection = toga.Selection(items=[], style=Pack(margin=5, flex=1))
+        self.session_slider = toga.Slider(min=0.0, max=1.0, on_change=self.onSessionScrubbed, style=Pack(margin=5, flex=1))
+        self.last_diagnostics_refresh = 0.0
         
         # Load existing Bluetooth address from config
         self.config_path = os.path.join(os.path.dirname(bkfb.__file__), 'Networking', 'ESP32.cfg')
@@ -49,12 +81,24 @@ class BeeWareProject(toga.App):
             live_feed_page = self.createLiveFeedPageMobile()
             avg_stroke_page = self.createAvgStrokePageMobile()
             compare_strokes_page = self.createCompareStrokesPageMobile()
+            sessions_page = self.createSessionsPageMobile()
             config_page = self.createConfigPageMobile()
+            diagnostics_page = self.createDiagnosticsPageMobile()
         else:
             live_feed_page = self.createLiveFeedPageDesktop()
             avg_stroke_page = self.createAvgStrokePageDesktop()
             compare_strokes_page = self.createCompareStrokesPageDesktop()
+            sessions_page = self.createSessionsPageDesktop()
             config_page = self.createConfigPageDesktop()
+            diagnostics_page = self.createDiagnosticsPageDesktop()
+
+        # Tabs that show a plot, so bkfb only renders the one on screen
+        self.plot_pages = {
+            "Live Feed": bkfb.PAGE_LIVE,
+            "Average Stroke": bkfb.PAGE_AVERAGE,
+            "Compare Stroke": bkfb.PAGE_COMPARE,
+        }
+        bkfb.setActivePage(bkfb.PAGE_LIVE)
 
         # Create tab container
         container = toga.OptionContainer(
@@ -62,15 +106,35 @@ class BeeWareProject(toga.App):
                 ("Live Feed", live_feed_page),
                 ("Average Stroke", avg_stroke_page),
                 ("Compare Stroke", compare_strokes_page),
+                ("Sessions", sessions_page),
                 ("Bluetooth Config", config_page),
+                ("Diagnostics", diagnostics_page),
             ],
+            on_select=self.onTabSelected,
             style=Pack(flex=1)
         )
 
+        # Show sensors we've seen before straight away instead of waiting on a scan
+        self.loadKnownDevices()
+
         self.main_window = toga.MainWindow(title=self.formal_name)
         self.main_window.content = container
         self.main_window.show()
         
+        # Start the BLE worker in the background so Connect doesn't wait on it
+        self.loop.create_task(bkfb.prewarmWorker())
+
+        # strokes from earlier sessions, for similar-stroke lookups
+        bkfb.setStrokeIndexPath(os.path.join(self.paths.data, "stroke_index.npz"))
+
+        # reference stroke for per-stroke feedback, if one was set before
+        self.reference_stroke_path = os.path.join(self.paths.data, "reference_stroke.csv")
+        if os.path.exists(self.reference_stroke_path):
+            try:
+                bkfb.setReferenceStroke(self.reference_stroke_path)
+            except Exception as e:
+                print(f"Error loading reference stroke: {e}")
+
         # Scale window only for desktop preview of mobile UI.
         if self.mobile_preview_forced and not (self.isAndroidRuntime() or self.isIosRuntime()):
             self.setMobileWindowSize()
@@ -135,8 +199,14 @@ class BeeWareProject(toga.App):
     def createLiveFeedPageMobile(self):
         """Create mobile-optimized live feed page with vertical layout."""
         clear_button = toga.Button("Clear", on_press=self.clearPlots, style=Pack(margin=5, flex=1))
+        session_switch = toga.Switch("Full session", on_change=self.onLiveViewChanged, style=Pack(margin=5, flex=1))
+        save_button = toga.Button("Save", on_press=self.saveSession, style=Pack(margin=5, flex=1))
+        download_button = toga.Button("Download", on_press=self.downloadRecorded, style=Pack(margin=5, flex=1))
         controls = toga.Box(style=Pack(direction=ROW, margin=5))
         controls.add(clear_button)
+        controls.add(session_switch)
+        controls.add(save_button)
+        controls.add(download_button)
 
         page_box = toga.Box(style=Pack(direction=COLUMN, flex=1))
         page_box.add(self.live_plot_view)
@@ -147,8 +217,14 @@ class BeeWareProject(toga.App):
     def createAvgStrokePageMobile(self):
         """Create mobile-optimized average stroke page."""
         clear_button = toga.Button("Clear", on_press=self.clearPlots, style=Pack(margin=5, flex=1))
+        clusters_switch = toga.Switch("Clusters", on_change=self.onClustersToggled, style=Pack(margin=5, flex=1))
+        align_switch = toga.Switch("Phase align", on_change=self.onAlignmentToggled, style=Pack(margin=5, flex=1))
+        reference_button = toga.Button("Set reference", on_press=self.setReferenceStroke, style=Pack(margin=5, flex=1))
         controls = toga.Box(style=Pack(direction=ROW, margin=5))
         controls.add(clear_button)
+        controls.add(clusters_switch)
+        controls.add(align_switch)
+        controls.add(reference_button)
 
         page_box = toga.Box(style=Pack(direction=COLUMN, flex=1))
         page_box.add(self.avg_plot_view)
@@ -159,8 +235,10 @@ class BeeWareProject(toga.App):
     def createCompareStrokesPageMobile(self):
         """Create mobile page for comparing the last two detected strokes."""
         clear_button = toga.Button("Clear", on_press=self.clearPlots, style=Pack(margin=5, flex=1))
+        similar_button = toga.Button("Similar", on_press=self.showSimilarStrokes, style=Pack(margin=5, flex=1))
         controls = toga.Box(style=Pack(direction=ROW, margin=5))
         controls.add(clear_button)
+        controls.add(similar_button)
 
         page_box = toga.Box(style=Pack(direction=COLUMN, flex=1))
         page_box.add(self.compare_plot_view)
@@ -168,6 +246,27 @@ class BeeWareProject(toga.App):
 
         return page_box
     
+    def createSessionsPageMobile(self):
+        """Create mobile page for zooming through a saved session."""
+        open_button = toga.Button("Open", on_press=self.openRecordedSession, style=Pack(margin=5))
+        picker = toga.Box(style=Pack(direction=ROW, margin=5))
+        picker.add(self.session_selection)
+        picker.add(open_button)
+
+        controls = toga.Box(style=Pack(direction=ROW, margin=5))
+        controls.add(toga.Button("<", on_press=self.panSessionBack, style=Pack(margin=5, flex=1)))
+        controls.add(toga.Button("-", on_press=self.zoomSessionOut, style=Pack(margin=5, flex=1)))
+        controls.add(toga.Button("+", on_press=self.zoomSessionIn, style=Pack(margin=5, flex=1)))
+        controls.add(toga.Button(">", on_press=self.panSessionForward, style=Pack(margin=5, flex=1)))
+
+        page_box = toga.Box(style=Pack(direction=COLUMN, flex=1))
+        page_box.add(picker)
+        page_box.add(self.session_view)
+        page_box.add(self.session_slider)
+        page_box.add(controls)
+
+        return page_box
+
     def createConfigPageMobile(self):
         """Create mobile settings page with the same controls as desktop."""
         title_label = toga.Label(
@@ -234,11 +333,25 @@ class BeeWareProject(toga.App):
         )
         self.stroke_direction_selection.value = "+" if self.stroke_direction >= 0 else "-"
 
+        sample_rate_label = toga.Label(
+            "Rate:",
+            style=Pack(margin=(10, 5, 5, 5), font_weight="bold")
+        )
+
+        self.sample_rate_selection = toga.Selection(
+            items=list(SAMPLE_RATE_CHOICES),
+            on_change=self.onSampleRateChanged,
+            style=Pack(margin=5, flex=1)
+        )
+        self.sample_rate_selection.value = "20 Hz"
+
         stroke_axis_row = toga.Box(style=Pack(direction=ROW, margin=5))
         stroke_axis_row.add(stroke_axis_label)
         stroke_axis_row.add(self.stroke_axis_selection)
         stroke_axis_row.add(stroke_direction_label)
         stroke_axis_row.add(self.stroke_direction_selection)
+        stroke_axis_row.add(sample_rate_label)
+        stroke_axis_row.add(self.sample_rate_selection)
 
         save_button = toga.Button(
             "Save Address",
@@ -279,13 +392,43 @@ class BeeWareProject(toga.App):
         
         return page_box
 
+    def createDiagnosticsPageMobile(self):
+        """Create mobile page showing live pipeline metrics."""
+        metrics_switch = toga.Switch(
+            "Collect metrics",
+            value=metrics.enabled,
+            on_change=self.onMetricsToggled,
+            style=Pack(margin=5, flex=1)
+        )
+        refresh_button = toga.Button("Refresh", on_press=self.refreshDiagnostics, style=Pack(margin=5, flex=1))
+        sensor_button = toga.Button("Sensor", on_press=self.querySensorStatus, style=Pack(margin=5, flex=1))
+        save_button = toga.Button("Save JSON", on_press=self.saveDiagnostics, style=Pack(margin=5, flex=1))
+
+        controls = toga.Box(style=Pack(direction=ROW, margin=5))
+        controls.add(refresh_button)
+        controls.add(sensor_button)
+        controls.add(save_button)
+
+        page_box = toga.Box(style=Pack(direction=COLUMN, flex=1))
+        page_box.add(metrics_switch)
+        page_box.add(self.diagnostics_view)
+        page_box.add(controls)
+
+        return page_box
+
     # desktop ui
 
     def createLiveFeedPageDesktop(self):
         """Create desktop-optimized live feed page with side-by-side layout."""
         clear_button = toga.Button("Clear", on_press=self.clearPlots, style=Pack(margin=5))
+        session_switch = toga.Switch("Full session", on_change=self.onLiveViewChanged, style=Pack(margin=5))
+        save_button = toga.Button("Save", on_press=self.saveSession, style=Pack(margin=5))
+        download_button = toga.Button("Download recorded", on_press=self.downloadRecorded, style=Pack(margin=5))
         controls = toga.Box(style=Pack(direction=ROW, margin=5))
         controls.add(clear_button)
+        controls.add(session_switch)
+        controls.add(save_button)
+        controls.add(download_button)
         controls.add(toga.Divider(style=Pack(flex=1)))
 
         page_box = toga.Box(style=Pack(direction=COLUMN, flex=1))
@@ -297,8 +440,14 @@ class BeeWareProject(toga.App):
     def createAvgStrokePageDesktop(self):
         """Create desktop-optimized average stroke page."""
         clear_button = toga.Button("Clear", on_press=self.clearPlots, style=Pack(margin=5))
+        clusters_switch = toga.Switch("Clusters", on_change=self.onClustersToggled, style=Pack(margin=5))
+        align_switch = toga.Switch("Phase align", on_change=self.onAlignmentToggled, style=Pack(margin=5))
+        reference_button = toga.Button("Set reference", on_press=self.setReferenceStroke, style=Pack(margin=5))
         controls = toga.Box(style=Pack(direction=ROW, margin=5))
         controls.add(clear_button)
+        controls.add(clusters_switch)
+        controls.add(align_switch)
+        controls.add(reference_button)
         controls.add(toga.Divider(style=Pack(flex=1)))
 
         page_box = toga.Box(style=Pack(direction=COLUMN, flex=1))
@@ -310,8 +459,10 @@ class BeeWareProject(toga.App):
     def createCompareStrokesPageDesktop(self):
         """Create desktop page for comparing the last two detected strokes."""
         clear_button = toga.Button("Clear", on_press=self.clearPlots, style=Pack(margin=5))
+        similar_button = toga.Button("Similar strokes", on_press=self.showSimilarStrokes, style=Pack(margin=5))
         controls = toga.Box(style=Pack(direction=ROW, margin=5))
         controls.add(clear_button)
+        controls.add(similar_button)
         controls.add(toga.Divider(style=Pack(flex=1)))
 
         page_box = toga.Box(style=Pack(direction=COLUMN, flex=1))
@@ -320,6 +471,27 @@ class BeeWareProject(toga.App):
 
         return page_box
     
+    def createSessionsPageDesktop(self):
+        """Create desktop page for zooming, panning and scrubbing through a saved session."""
+        open_button = toga.Button("Open", on_press=self.openRecordedSession, style=Pack(margin=5, width=120))
+        picker = toga.Box(style=Pack(direction=ROW, margin=5))
+        picker.add(self.session_selection)
+        picker.add(open_button)
+
+        controls = toga.Box(style=Pack(direction=ROW, margin=5))
+        controls.add(toga.Button("Back", on_press=self.panSessionBack, style=Pack(margin=5)))
+        controls.add(toga.Button("Zoom out", on_press=self.zoomSessionOut, style=Pack(margin=5)))
+        controls.add(toga.Button("Zoom in", on_press=self.zoomSessionIn, style=Pack(margin=5)))
+        controls.add(toga.Button("Forward", on_press=self.panSessionForward, style=Pack(margin=5)))
+        controls.add(self.session_slider)
+
+        page_box = toga.Box(style=Pack(direction=COLUMN, flex=1))
+        page_box.add(picker)
+        page_box.add(self.session_view)
+        page_box.add(controls)
+
+        return page_box
+
     def createConfigPageDesktop(self):
         """Create desktop-optimized bluetooth configuration page with full-width address input."""
         title_label = toga.Label(
@@ -386,11 +558,25 @@ class BeeWareProject(toga.App):
         )
         self.stroke_direction_selection.value = "+" if self.stroke_direction >= 0 else "-"
 
+        sample_rate_label = toga.Label(
+            "Rate:",
+            style=Pack(margin=(10, 5, 5, 5), font_weight="bold")
+        )
+
+        self.sample_rate_selection = toga.Selection(
+            items=list(SAMPLE_RATE_CHOICES),
+            on_change=self.onSampleRateChanged,
+            style=Pack(margin=5, width=100)
+        )
+        self.sample_rate_selection.value = "20 Hz"
+
         stroke_axis_row = toga.Box(style=Pack(direction=ROW, margin=5))
         stroke_axis_row.add(stroke_axis_label)
         stroke_axis_row.add(self.stroke_axis_selection)
         stroke_axis_row.add(stroke_direction_label)
         stroke_axis_row.add(self.stroke_direction_selection)
+        stroke_axis_row.add(sample_rate_label)
+        stroke_axis_row.add(self.sample_rate_selection)
         
         save_button = toga.Button(
             "Save Address", 
@@ -435,6 +621,31 @@ class BeeWareProject(toga.App):
         
         return page_box
     
+    def createDiagnosticsPageDesktop(self):
+        """Create desktop page showing live pipeline metrics."""
+        metrics_switch = toga.Switch(
+            "Collect metrics",
+            value=metrics.enabled,
+            on_change=self.onMetricsToggled,
+            style=Pack(margin=5)
+        )
+        refresh_button = toga.Button("Refresh", on_press=self.refreshDiagnostics, style=Pack(margin=5, width=120))
+        sensor_button = toga.Button("Sensor status", on_press=self.querySensorStatus, style=Pack(margin=5, width=120))
+        save_button = toga.Button("Save JSON", on_press=self.saveDiagnostics, style=Pack(margin=5, width=120))
+
+        controls = toga.Box(style=Pack(direction=ROW, margin=5))
+        controls.add(metrics_switch)
+        controls.add(toga.Divider(style=Pack(flex=1)))
+        controls.add(refresh_button)
+        controls.add(sensor_button)
+        controls.add(save_button)
+
+        page_box = toga.Box(style=Pack(direction=COLUMN, flex=1))
+        page_box.add(self.diagnostics_view)
+        page_box.add(controls)
+
+        return page_box
+
     def loadBtAddress(self):
         """Load Bluetooth address from config file."""
         try:
@@ -513,6 +724,239 @@ class BeeWareProject(toga.App):
         except Exception as e:
             self.status_label.text = f"Error saving stroke direction: {e}"
     
+    async def onSampleRateChanged(self, widget):
+        """Ask the sensor for another sample rate (lower saves battery, higher for racing)."""
+        rate_hz = SAMPLE_RATE_CHOICES.get(widget.value)
+        if rate_hz is None or rate_hz == bkfb.SAMPLE_RATE_HZ:
+            return
+        try:
+            if await bkfb.requestSampleRate(rate_hz):
+                self.status_label.text = f"Asked sensor for {rate_hz:g} Hz..."
+            else:
+                self.status_label.text = "Connect first to change the sample rate"
+        except Exception as e:
+            self.status_label.text = f"Error changing sample rate: {e}"
+
+    def loadKnownDevices(self):
+        """Fill the device dropdown from the persistent device cache."""
+        self.discovered_devices = {}
+        for record in device_cache.known_devices():
+            address = record.get("address")
+            if address:
+                self.discovered_devices[device_cache.device_label(record)] = address
+
+        if self.discovered_devices:
+            self.device_selection.items = list(self.discovered_devices.keys())
+
+    def onTabSelected(self, widget):
+        """Switch rendering to the newly opened tab and catch it up if it went stale."""
+        tab = widget.current_tab
+        title = tab.text if tab is not None else None
+        page = self.plot_pages.get(title)
+        bkfb.setActivePage(page)
+        if page is not None:
+            self.showImages(*bkfb.renderPage(page))
+        elif title == "Diagnostics":
+            self.refreshDiagnostics()
+        elif title == "Sessions":
+            self.refreshSessionList()
+
+    def onLiveCanvasResize(self, widget, width, height, **kwargs):
+        """Redraw the native live plot at the new size."""
+        self.live_canvas_size = (width, height)
+        if self.last_live_frame is not None:
+            canvasPlot.drawLivePlot(self.live_plot_view, self.last_live_frame, width, height)
+
+    def showImages(self, plot_png, avg_png, compare_png):
+        """Put freshly rendered plots into their image views."""
+        if isinstance(plot_png, dict):
+            # native canvas frame
+            self.last_live_frame = plot_png
+            canvasPlot.drawLivePlot(self.live_plot_view, plot_png, *self.live_canvas_size)
+            latency.markFrame("image")
+        elif plot_png:
+            self.live_plot_view.image = frameImage.toTogaImage(plot_png)
+            latency.markFrame("image")
+        if avg_png:
+            self.avg_plot_view.image = frameImage.toTogaImage(avg_png)
+        if compare_png:
+            self.compare_plot_view.image = frameImage.toTogaImage(compare_png)
+
+    def sessionsDirectory(self):
+        return os.path.join(self.paths.data, "sessions")
+
+    def refreshSessionList(self):
+        """List saved sessions, newest first."""
+        try:
+            names = [name for name in os.listdir(self.sessionsDirectory()) if name.endswith(".csv")]
+        except OSError:
+            names = []
+        names.sort(reverse=True)
+        # replacing the items loses the selection, so only when the list changed
+        if names != self.session_names:
+            self.session_names = names
+            self.session_selection.items = names
+
+    async def openRecordedSession(self, widget):
+        """Open the chosen session's zoom pyramid and show all of it."""
+        name = self.session_selection.value
+        if not name:
+            self.status_label.text = "No saved sessions yet"
+            return
+        try:
+            self.recorded_session = bkfb.openSession(os.path.join(self.sessionsDirectory(), name))
+            self.session_window = self.recorded_session.clampView(0, self.recorded_session.total)
+            self.drawRecordedSession()
+            self.status_label.text = f"Opened {name} ({self.recorded_session.total} samples)"
+        except Exception as e:
+            self.status_label.text = f"Error opening session: {e}"
+
+    def drawRecordedSession(self):
+        """Draw the current view of the open session, one pyramid row per pixel or so."""
+        if self.recorded_session is None:
+            return
+        width, height = self.session_canvas_size
+        start, end = self.session_window
+        frame = self.recorded_session.frame(start, end, max_points=max(50, int(width)))
+        canvasPlot.drawLivePlot(self.session_view, frame, width, height)
+
+    def setSessionWindow(self, window):
+        """Show another part of the open session and move the scrub bar to match."""
+        self.session_window = window
+        start, end = window
+        total = max(self.recorded_session.total, 1)
+        self.session_slider.value = min(1.0, (start + end) / 2 / total)
+        self.drawRecordedSession()
+
+    def onSessionCanvasResize(self, widget, width, height, **kwargs):
+        """Redraw the open session at the new size."""
+        self.session_canvas_size = (width, height)
+        self.drawRecordedSession()
+
+    def onSessionScrubbed(self, widget):
+        """Centre the view on where the scrub bar was dragged."""
+        if self.recorded_session is None:
+            return
+        window = self.recorded_session.scrub(*self.session_window, widget.value)
+        if window != self.session_window:
+            self.session_window = window
+            self.drawRecordedSession()
+
+    def zoomSessionIn(self, widget):
+        if self.recorded_session is not None:
+            self.setSessionWindow(self.recorded_session.zoom(*self.session_window, 0.5))
+
+    def zoomSessionOut(self, widget):
+        if self.recorded_session is not None:
+            self.setSessionWindow(self.recorded_session.zoom(*self.session_window, 2.0))
+
+    def panSessionBack(self, widget):
+        if self.recorded_session is not None:
+            self.setSessionWindow(self.recorded_session.pan(*self.session_window, -0.5))
+
+    def panSessionForward(self, widget):
+        if self.recorded_session is not None:
+            self.setSessionWindow(self.recorded_session.pan(*self.session_window, 0.5))
+
+    def onLiveViewChanged(self, widget):
+        """Switch the live page between the recent window and the whole session."""
+        bkfb.setLiveViewMode(bkfb.LIVE_VIEW_SESSION if widget.value else bkfb.LIVE_VIEW_WINDOW)
+        self.showImages(*bkfb.renderPage(bkfb.PAGE_LIVE, force=True))
+
+    def onClustersToggled(self, widget):
+        """Show one average per stroke cluster instead of a single average."""
+        bkfb.setShowStrokeClusters(widget.value)
+        self.showImages(*bkfb.renderPage(bkfb.PAGE_AVERAGE, force=True))
+
+    def onAlignmentToggled(self, widget):
+        """Line strokes up by dynamic time warping instead of resampling alone."""
+        bkfb.setStrokeAlignment(bkfb.STROKE_ALIGNMENT_DTW if widget.value else bkfb.STROKE_ALIGNMENT_RESAMPLE)
+        self.showImages(*bkfb.renderPage(bkfb.PAGE_AVERAGE, force=True))
+
+    async def setReferenceStroke(self, widget):
+        """Use this session's average stroke as the reference every new stroke is scored against."""
+        try:
+            if bkfb.saveReferenceStroke(self.reference_stroke_path) is None:
+                self.status_label.text = "No strokes detected yet for a reference"
+            else:
+                self.status_label.text = "Reference stroke set"
+        except Exception as e:
+            self.status_label.text = f"Error setting reference stroke: {e}"
+
+    async def showSimilarStrokes(self, widget):
+        """Find the strokes from earlier sessions most like the latest one."""
+        try:
+            self.status_label.text = bkfb.similarStrokesText()
+        except Exception as e:
+            self.status_label.text = f"Error finding similar strokes: {e}"
+
+    def onMetricsToggled(self, widget):
+        """Turn pipeline metrics collection on or off."""
+        bkfb.setMetricsEnabled(widget.value)
+        if widget.value:
+            metrics.reset()
+        self.refreshDiagnostics(widget)
+
+    def refreshDiagnostics(self, widget=None):
+        """Show the current metrics snapshot on the diagnostics page."""
+        self.last_diagnostics_refresh = time.monotonic()
+        sensor = " ".join(f"{name}={value}" for name, value in bkfb.sensor_status.items())
+        sensor = f"sensor: {sensor}" if sensor else ""
+        if not metrics.enabled:
+            self.diagnostics_view.value = "\n".join(filter(None, ["Metrics collection is off.", sensor]))
+            return
+        text = metrics.formatSnapshot(metrics.snapshot())
+        if latency.enabled:
+            total = latency.summary()["stages"]["total"]
+            text += f"\nlatency.total: n={total['count']} p50<={total['p50_us']}us p95<={total['p95_us']}us"
+        if sensor:
+            text += f"\n{sensor}"
+        self.diagnostics_view.value = text or "No metrics yet."
+
+    async def querySensorStatus(self, widget):
+        """Ask the connected sensor for its status and show it with the metrics."""
+        try:
+            if await bkfb.requestSensorStatus() is None:
+                self.status_label.text = "No answer from the sensor (connect first)"
+                return
+            self.refreshDiagnostics()
+        except Exception as e:
+            self.status_label.text = f"Error asking the sensor: {e}"
+
+    async def saveSession(self, widget):
+        """Save the recorded session (CSV plus zoom pyramid) to the app data folder."""
+        try:
+            path = bkfb.saveSession(os.path.join(self.paths.data, "sessions"))
+            self.status_label.text = f"Session saved: {path}"
+        except Exception as e:
+            self.status_label.text = f"Error saving session: {e}"
+
+    async def downloadRecorded(self, widget):
+        """Fetch what the sensor recorded while disconnected and save it as a session."""
+        try:
+            self.status_label.text = "Downloading recorded data..."
+            samples = await bkfb.requestDownload()
+            if samples is None:
+                self.status_label.text = "Connect first to download recorded data"
+            elif not samples:
+                self.status_label.text = "Nothing recorded on the sensor"
+            else:
+                path = bkfb.saveRecordedSession(samples, os.path.join(self.paths.data, "sessions"))
+                self.status_label.text = f"Recorded data saved: {path}"
+        except Exception as e:
+            self.status_label.text = f"Error downloading recorded data: {e}"
+
+    async def saveDiagnostics(self, widget):
+        """Dump metrics (and latency histograms when tracing) to JSON for field reports."""
+        try:
+            os.makedirs(self.paths.data, exist_ok=True)
+            path = os.path.join(self.paths.data, f"bkfb_metrics_{int(time.time())}.json")
+            extra = {"latency": latency.summary()} if latency.enabled else None
+            metrics.dumpJson(path, extra=extra)
+            self.status_label.text = f"Metrics saved: {path}"
+        except Exception as e:
+            self.status_label.text = f"Error saving metrics: {e}"
+
     async def scanDevices(self, widget):
         """Scan for nearby BLE devices."""
         if self.scanning:
@@ -520,7 +964,8 @@ class BeeWareProject(toga.App):
         
         self.scanning = True
         self.status_label.text = "Scanning for devices..."
-        self.discovered_devices = {}
+        self.loadKnownDevices()
+        known_count = len(self.discovered_devices)
         
         try:
             if self.is_mobile:
@@ -532,8 +977,9 @@ class BeeWareProject(toga.App):
                 await asyncio.sleep(5)  # Scan for 5 seconds
                 await scanner.stop()
                 
-                devices = scanner.discovered_devices
-                for device in devices:
+                found = scanner.discovered_devices_and_advertisement_data
+                device_cache.remember_scan(found.values())
+                for device, _adv in found.values():
                     name = device.name or "Unknown"
                     addr = device.address
                     self.discovered_devices[f"{name} ({addr})"] = addr
@@ -542,8 +988,9 @@ class BeeWareProject(toga.App):
                 try:
                     from bleak import BleakScanner
                     
-                    devices = await BleakScanner.discover(timeout=5.0)
-                    for device in devices:
+                    found = await BleakScanner.discover(timeout=5.0, return_adv=True)
+                    device_cache.remember_scan(found.values())
+                    for device, _adv in found.values():
                         name = device.name or "Unknown"
                         addr = device.address
                         self.discovered_devices[f"{name} ({addr})"] = addr
@@ -555,7 +1002,7 @@ class BeeWareProject(toga.App):
             if self.discovered_devices:
                 # Update selection widget
                 self.device_selection.items = list(self.discovered_devices.keys())
-                self.status_label.text = f"Found {len(self.discovered_devices)} device(s)"
+                self.status_label.text = f"Found {len(self.discovered_devices)} device(s) ({known_count} known)"
             else:
                 self.device_selection.items = ["No devices found"]
                 self.status_label.text = "No BLE devices found"
@@ -616,12 +1063,9 @@ class BeeWareProject(toga.App):
         self.stop_event = asyncio.Event()
 
         async def onUpdate(plot_png, avg_png, compare_png):
-            if plot_png:
-                self.live_plot_view.image = toga.Image(src=plot_png)
-            if avg_png:
-                self.avg_plot_view.image = toga.Image(src=avg_png)
-            if compare_png:
-                self.compare_plot_view.image = toga.Image(src=compare_png)
+            self.showImages(plot_png, avg_png, compare_png)
+            if metrics.enabled and time.monotonic() - self.last_diagnostics_refresh >= 1.0:
+                self.refreshDiagnostics()
 
         async def onStatus(status):
             self.status_label.text = status
@@ -654,13 +1098,13 @@ class BeeWareProject(toga.App):
     async def clearPlots(self, widget):
         plot_png, avg_png, compare_png = bkfb.clearInAppPlots()
         if plot_png:
-            self.live_plot_view.image = toga.Image(src=plot_png)
+            self.showImages(plot_png, None, None)
         if avg_png:
-            self.avg_plot_view.image = toga.Image(src=avg_png)
+            self.avg_plot_view.image = frameImage.toTogaImage(avg_png)
         else:
             self.avg_plot_view.image = None
         if compare_png:
-            self.compare_plot_view.image = toga.Image(src=compare_png)
+            self.compare_plot_view.image = frameImage.toTogaImage(compare_png)
         else:
             self.compare_plot_view.image = None
 
@@ -671,6 +1115,10 @@ class BeeWareProject(toga.App):
         if self.stream_task and not self.stream_task.done():
             self.stream_task.cancel()
         bkfb.forceStopWorkerSync()
+        bkfb.saveStrokeIndex()
+        trace_path = bkfb.exportLatencyTrace()
+        if trace_path:
+            print(f"Latency trace written to {trace_path}")
         return True
 
 
@@ -3,14 +3,22 @@
 import asyncio
 import atexit
 import json
+import math
 import os
 import signal
 import matplotlib.pyplot as plt
 import matplotlib
 import numpy as np
 import sys
+import tempfile
+import time
+from collections import deque, namedtuple
+from itertools import islice
 from io import BytesIO
 
+from bkfbmobile import filters, ingest, latency, metrics, pyramid, timebase
+from bkfbmobile.AU.strokeRate import StrokeRateEstimator
+from bkfbmobile.decimate import MinMaxDecimator
 from bkfbmobile.Networking import ble_runtime
 
 # load address from config
@@ -26,6 +34,7 @@ matplotlib.use('Agg')
 
 # data variables
 data_points = {"x": [], "y": [], "z": []}  # coord -> [values]
+sample_seqs = []  # firmware sequence number of each sample in data_points
 plot_fig = None
 plot_ax = None
 plot_avg_fig = None
@@ -37,30 +46,90 @@ show_individual_strokes = False  # show stroke preview
 stroke_padding_samples = 1  # padding
 stroke_axis = 'y'  # axis (configurable in app)
 stroke_direction = 1  # +1 or -1 (configurable in app)
+STROKE_DETECTOR_PEAKS = 'peaks'  # scipy find_peaks over the whole session (original)
+STROKE_DETECTOR_STREAMING = 'streaming'  # hysteresis detector, only fed the new samples
+stroke_detector = os.environ.get("BKFB_STROKE_DETECTOR", STROKE_DETECTOR_PEAKS)
+_streaming_state = None  # (axis, StreamingStrokeDetector) for the session so far
+STROKE_ALIGNMENT_RESAMPLE = 'resample'  # resample to the most common length (original)
+STROKE_ALIGNMENT_DTW = 'dtw'  # banded dtw onto the running template, only new strokes aligned
+stroke_alignment = os.environ.get("BKFB_STROKE_ALIGNMENT", STROKE_ALIGNMENT_RESAMPLE)
+_aligned_state = None  # (detection settings, DtwStrokeAligner, strokes aligned so far)
+# stroke boundaries between samples (parabola through each trough), so timing isn't
+# limited to the sample period
+refine_stroke_boundaries = os.environ.get("BKFB_REFINE_BOUNDARIES", "1").lower() not in ("0", "false", "no")
+
+# which plot page the app is showing. only that one renders as data arrives,
+# the others are marked stale and rendered when they're opened
+PAGE_LIVE = 'live'
+PAGE_AVERAGE = 'average'
+PAGE_COMPARE = 'compare'
+active_page = PAGE_LIVE
+
+# how the live page is drawn: 'canvas' hands the app the raw window to draw natively,
+# 'png' renders it through matplotlib like the other pages
+LIVE_RENDER_CANVAS = 'canvas'
+LIVE_RENDER_PNG = 'png'
+live_render_mode = LIVE_RENDER_PNG
+
+# what the live page shows: the last window_size samples, or the whole session through
+# an incrementally maintained min/max overview (constant drawing cost however long it runs)
+LIVE_VIEW_WINDOW = 'window'
+LIVE_VIEW_SESSION = 'session'
+live_view_mode = LIVE_VIEW_WINDOW
+SESSION_OVERVIEW_BUCKETS = 400
+session_overview = MinMaxDecimator(SESSION_OVERVIEW_BUCKETS)
+_stale_pages = set()
+StrokeAnalysis = namedtuple('StrokeAnalysis', ['strokes', 'version', 'features'])
+_analysis_cache = None  # (key, StrokeAnalysis) for the latest sample
+_render_cache = {}  # page -> (key, last image), redrawn only when the key changes
+_shown_outputs = {}  # page -> image the app is already displaying
+_last_analysis_point_count = 0
+
+# firmware sends one numbered sample every DELAY (50 ms) until the app asks for another
+# rate (requestSampleRate). this is the one copy of the rate everything else is built from;
+# applySampleRate swaps it and all that depends on it together once the sensor acks
+SAMPLE_RATE_HZ = ble_runtime.DEFAULT_SAMPLE_RATE_HZ
+sensor_batch = 1  # samples per notification
+rate_segments = [(0, SAMPLE_RATE_HZ)]  # (first sample, rate) for each stretch of the session at one rate
+# Time column units in session CSVs (getAccelerationData divides by 1e8 and multiplies by 60)
+CSV_TIME_UNITS_PER_SECOND = 1e8 / 60.0
+
+# stroke rate from the autocorrelation of the (filtered) stroke axis over the last few strokes
+stroke_rate_estimator = StrokeRateEstimator(SAMPLE_RATE_HZ)
 
 # incoming-data low-pass filter settings
 LOW_PASS_CUTOFF_HZ = 10
-LOW_PASS_SAMPLE_RATE_HZ = 20.0
-_filtered_sample = {'x': None, 'y': None, 'z': None}
+LOW_PASS_SAMPLE_RATE_HZ = SAMPLE_RATE_HZ
+LOW_PASS_KIND = filters.FILTER_RC  # or filters.FILTER_BUTTERWORTH (cutoff must be below nyquist)
+LOW_PASS_ORDER = 2
+_sample_filter = filters.makeFilter(LOW_PASS_KIND, LOW_PASS_CUTOFF_HZ, LOW_PASS_SAMPLE_RATE_HZ, LOW_PASS_ORDER)
 
 
 def lowPassFilterSample(x_value, y_value, z_value):
-    """Apply first-order low-pass filtering to one XYZ sample."""
-    dt = 1.0 / LOW_PASS_SAMPLE_RATE_HZ
-    rc = 1.0 / (2.0 * np.pi * LOW_PASS_CUTOFF_HZ)
-    alpha = dt / (rc + dt)
-
-    output = {}
-    for axis, raw in (('x', float(x_value)), ('y', float(y_value)), ('z', float(z_value))):
-        prev = _filtered_sample[axis]
-        if prev is None:
-            filtered = raw
-        else:
-            filtered = prev + alpha * (raw - prev)
-        _filtered_sample[axis] = filtered
-        output[axis] = filtered
+    """Apply the low-pass filter to one XYZ sample."""
+    return _sample_filter.sample((x_value, y_value, z_value))
+
+
+def lowPassFilterBatch(values):
+    """Apply the low-pass filter to an (N, 3) batch in one call (same output as per sample)."""
+    return _sample_filter.batch(values)
+
 
-    return output['x'], output['y'], output['z']
+def setLowPassFilter(kind, cutoff_hz=None, order=None):
+    """Swap the incoming-data filter (state starts over)."""
+    global _sample_filter, LOW_PASS_KIND, LOW_PASS_CUTOFF_HZ, LOW_PASS_ORDER
+    candidate = filters.makeFilter(
+        kind,
+        LOW_PASS_CUTOFF_HZ if cutoff_hz is None else cutoff_hz,
+        LOW_PASS_SAMPLE_RATE_HZ,
+        LOW_PASS_ORDER if order is None else order,
+    )
+    _sample_filter = candidate
+    LOW_PASS_KIND = kind
+    if cutoff_hz is not None:
+        LOW_PASS_CUTOFF_HZ = cutoff_hz
+    if order is not None:
+        LOW_PASS_ORDER = order
 
 
 def setStrokeAxis(axis):
@@ -69,9 +138,102 @@ def setStrokeAxis(axis):
     candidate = (axis or '').strip().lower()
     if candidate not in ('x', 'y', 'z'):
         candidate = 'y'
+    if candidate != stroke_axis:
+        stroke_rate_estimator.reset()
     stroke_axis = candidate
 
 
+def setStrokeDetector(kind):
+    """Pick the stroke boundary detector ('peaks' or 'streaming')."""
+    global stroke_detector, _streaming_state
+    stroke_detector = STROKE_DETECTOR_STREAMING if kind == STROKE_DETECTOR_STREAMING else STROKE_DETECTOR_PEAKS
+    _streaming_state = None
+
+
+def setStrokeAlignment(kind):
+    """Pick how strokes are lined up for the average ('resample' or 'dtw')."""
+    global stroke_alignment, _aligned_state
+    stroke_alignment = STROKE_ALIGNMENT_DTW if kind == STROKE_ALIGNMENT_DTW else STROKE_ALIGNMENT_RESAMPLE
+    _aligned_state = None
+
+
+def setRefineStrokeBoundaries(flag):
+    """Place stroke boundaries between samples (True) or on the lowest sample (False)."""
+    global refine_stroke_boundaries
+    refine_stroke_boundaries = bool(flag)
+
+
+def applySampleRate(rate_hz, batch=1):
+    """Switch everything built on the sample rate over at once (when the sensor acks a change).
+
+    Samples from here on are a new stretch of the session: the filter, stroke rate and stroke
+    analysis start over on it, while the live plot and saved sessions keep everything.
+    """
+    global SAMPLE_RATE_HZ, LOW_PASS_SAMPLE_RATE_HZ, sensor_batch, _sample_filter, stroke_rate_estimator
+    rate_hz = float(rate_hz)
+    sensor_batch = int(batch)
+    if rate_hz == SAMPLE_RATE_HZ:
+        return
+    # build the new pieces first so nothing changes if one of them can't be made
+    cutoff_hz = LOW_PASS_CUTOFF_HZ
+    if LOW_PASS_KIND == filters.FILTER_BUTTERWORTH:
+        cutoff_hz = min(cutoff_hz, 0.45 * rate_hz)
+    sample_filter = filters.makeFilter(LOW_PASS_KIND, cutoff_hz, rate_hz, LOW_PASS_ORDER)
+    estimator = StrokeRateEstimator(rate_hz)
+
+    SAMPLE_RATE_HZ = rate_hz
+    LOW_PASS_SAMPLE_RATE_HZ = rate_hz
+    _sample_filter = sample_filter
+    stroke_rate_estimator = estimator
+    if rate_segments[-1][0] == len(data_points['z']):
+        rate_segments[-1] = (len(data_points['z']), rate_hz)
+    else:
+        rate_segments.append((len(data_points['z']), rate_hz))
+    resetStrokeAnalysis()
+    _stale_pages.update((PAGE_AVERAGE, PAGE_COMPARE))
+
+
+async def requestSampleRate(rate_hz, batch=None):
+    """Ask the sensor for a new rate; nothing here changes until it acknowledges.
+
+    By default samples are batched so notifications stay at about the original 20 per second.
+    """
+    if batch is None:
+        batch = math.ceil(rate_hz / ble_runtime.DEFAULT_SAMPLE_RATE_HZ)
+    rate_hz, batch = ble_runtime.clamp_rate(rate_hz, batch)
+    if isMobilePlatform():
+        return await ble_runtime.request_sample_rate(rate_hz, batch)
+    return await sendWorkerCommand("rate", rate_hz=rate_hz, batch=batch, session=_worker_session)
+
+
+async def requestSensorStatus():
+    """Ask the sensor how it's doing (rate, batch, sequence, ...).
+
+    Returns the answer, which is also kept in sensor_status, or None when not connected or
+    the sensor didn't answer in time.
+    """
+    global _status_done
+    if isMobilePlatform():
+        status = await ble_runtime.request_status()
+        if status is not None:
+            sensor_status.clear()
+            sensor_status.update(status)
+        return status
+    if not _worker_streaming:
+        return None
+    _status_done = asyncio.get_running_loop().create_future()
+    try:
+        if not await sendWorkerCommand("status", session=_worker_session):
+            return None
+        # runWorkerStream resolves it with the worker's "sensor_status" message; the worker
+        # gives up on the sensor after COMMAND_TIMEOUT, so this only trips if the worker is stuck
+        return await asyncio.wait_for(_status_done, 2 * ble_runtime.COMMAND_TIMEOUT)
+    except asyncio.TimeoutError:
+        return None
+    finally:
+        _status_done = None
+
+
 def setStrokeDirection(direction):
     """Set stroke direction sign (+1 or -1)."""
     global stroke_direction
@@ -79,9 +241,69 @@ def setStrokeDirection(direction):
 
 # BLE stuff
 save_writer = None
+# samples waiting between the BLE callback and the consumer; when rendering falls behind,
+# drop_oldest keeps the live view current (block / drop_newest are the alternatives)
+INGEST_QUEUE_CAPACITY = 2048
+INGEST_QUEUE_POLICY = os.environ.get("BKFB_QUEUE_POLICY", ingest.DROP_OLDEST)
 _active_worker = None
 _active_worker_pid = None
+_worker_stderr_tail = deque(maxlen=20)
+_worker_session = 0
+_worker_start = None  # startWorker in progress
+_download_done = None  # future for the worker's reply to a download
+_status_done = None  # same for a status request
+_worker_streaming = False  # a live session is reading the worker's messages
 _shutdown_hooks_registered = False
+recorded_samples = []  # (seq, x, y, z) sent back by a download
+sensor_status = {}  # last answer to requestSensorStatus
+
+# strokes from every session, for "most similar stroke" lookups. opened by the app
+stroke_index = None
+stroke_index_path = None
+session_label = time.strftime('%Y-%m-%d %H:%M:%S')  # names this session's strokes in the index
+_indexed_strokes = 0  # strokes of this session already in the index
+_index_settings = None  # how those strokes were cut
+# past this many strokes the saved index keeps PCA coefficients instead of full strokes
+STROKE_INDEX_PCA_THRESHOLD = 2000
+STROKE_INDEX_PCA_COMPONENTS = 8
+
+# live clusters of stroke shapes (warm-up / steady state / race pace ...)
+show_stroke_clusters = False  # average page shows one average per cluster
+stroke_clusters = None
+# incremental PCA of this session's stroke shapes; each new stroke is scored on how well
+# the model explains it before being folded in
+stroke_shape_model = None
+stroke_consistency = []  # 0..1 per stroke
+_clustered_strokes = 0
+_cluster_settings = None  # detection settings the clusters/shape model were built with
+# strokes are cut from the samples since a little before the last boundary while the stroke
+# pages aren't up: (settings, sample index of the last boundary, strokes fed so far)
+_tracking_state = None
+STROKE_TRACKING_LOOKBACK_S = 10.0
+_last_seq = None
+
+# per-stroke feedback against a saved reference stroke. it runs straight off the incoming
+# samples with its own streaming detector, so each stroke is scored as soon as its trailing
+# trough is confirmed instead of on the next (whole session) analysis pass
+reference_stroke = None
+stroke_feedback = []  # StrokeFeedback for each stroke since the reference was set
+_feedback_state = None  # (axis, StreamingStrokeDetector, recent 'ay' values)
+FEEDBACK_HISTORY_SAMPLES = 400  # longer than any stroke; a longer gap is a pause, not a stroke
+
+# pipeline metrics (no-ops unless metrics collection is on)
+_samples_metric = metrics.counter("pipeline.samples")
+_seq_dropped_metric = metrics.counter("pipeline.seq_dropped")
+_seq_duplicate_metric = metrics.counter("pipeline.seq_duplicates")
+_queue_depth_metric = metrics.gauge("pipeline.queue_depth")
+_frames_metric = metrics.counter("render.frames")
+_coalesced_metric = metrics.counter("render.samples_coalesced")
+_render_ms_metric = metrics.histogram("render.live_ms")
+_analysis_ms_metric = metrics.histogram("analysis.ms")
+_render_cache_hits_metric = metrics.counter("render.cache_hits")
+_stroke_rate_metric = metrics.gauge("analysis.stroke_rate_spm")
+_consistency_metric = metrics.gauge("analysis.stroke_consistency")
+_feedback_ms_metric = metrics.histogram("feedback.ms")
+_feedback_score_metric = metrics.gauge("feedback.score")
 
 def recentSeries(points, size):
     start_idx = max(0, len(points['z']) - size)
@@ -100,6 +322,121 @@ def recentSeries(points, size):
     return start_idx, end_idx, x_indices, recent, all_recent
 
 
+# how matplotlib figures are handed to the app: 'png' bytes, or 'rgba' which wraps the Agg
+# canvas' pixel buffer (no zlib encode here; the UI copies it into a native bitmap, see frameImage)
+FRAME_PNG = 'png'
+FRAME_RGBA = 'rgba'
+frame_format = FRAME_PNG
+FRAME_DPI = 80
+
+# raw frame: width/height in pixels and a memoryview of the RGBA pixels (row-major, no copy)
+RgbaFrame = namedtuple('RgbaFrame', ['width', 'height', 'buffer'])
+
+
+def setFrameFormat(fmt):
+    global frame_format
+    frame_format = FRAME_RGBA if fmt == FRAME_RGBA else FRAME_PNG
+
+
+def figureToPng(fig):
+    buf = BytesIO()
+    fig.savefig(buf, format='png', dpi=FRAME_DPI, bbox_inches='tight')
+    return buf.getvalue()
+
+
+def figureToRgba(fig):
+    """Render the figure and wrap the Agg pixel buffer without copying it."""
+    fig.set_dpi(FRAME_DPI)
+    # stands in for bbox_inches='tight', which only applies when saving
+    fig.tight_layout()
+    fig.canvas.draw()
+    # the memoryview keeps the renderer's buffer alive after the figure is closed
+    pixels = np.asarray(fig.canvas.buffer_rgba())
+    height, width = pixels.shape[:2]
+    return RgbaFrame(width, height, memoryview(pixels).cast('B'))
+
+
+def figureOutput(fig):
+    """Encode a finished figure in the current frame format and close it."""
+    try:
+        if frame_format == FRAME_RGBA:
+            return figureToRgba(fig)
+        return figureToPng(fig)
+    finally:
+        plt.close(fig)
+
+
+def rgbaFrameToPil(frame):
+    """PIL image sharing the frame's pixel memory (for exports or toga's PIL support)."""
+    from PIL import Image  # pillow is a matplotlib dependency
+    return Image.frombuffer('RGBA', (frame.width, frame.height), frame.buffer, 'raw', 'RGBA', 0, 1)
+
+
+def sessionSeries():
+    """Whole-session min/max envelope, shaped like recentSeries' output."""
+    xs, ys = session_overview.envelope()
+    recent = {coord: ys[:, i].tolist() for i, coord in enumerate(('x', 'y', 'z'))}
+    all_recent = ys.ravel().tolist()
+    return 0, session_overview.total, xs, recent, all_recent
+
+
+def visibleSeries(points):
+    if live_view_mode == LIVE_VIEW_SESSION:
+        return sessionSeries()
+    return recentSeries(points, window_size)
+
+
+def setLiveViewMode(mode):
+    global live_view_mode
+    live_view_mode = LIVE_VIEW_SESSION if mode == LIVE_VIEW_SESSION else LIVE_VIEW_WINDOW
+
+
+def strokeRate():
+    """Current stroke rate in strokes/min, or None until there's a clear rhythm."""
+    spm, _confidence = stroke_rate_estimator.update()
+    _stroke_rate_metric.set(spm)
+    return spm
+
+
+def strokeRateText(spm):
+    return f"{spm:.1f} spm" if spm is not None else "-- spm"
+
+
+def liveFrame(data_points):
+    """Visible window of the live data for the native canvas plot (no image encoding)."""
+    start_idx, end_idx, x_indices, recent, all_recent = visibleSeries(data_points)
+    if all_recent:
+        y_min, y_max = min(all_recent) - 0.5, max(all_recent) + 0.5
+    else:
+        y_min, y_max = -1.0, 1.0
+    frame = {
+        'start': start_idx,
+        'end': end_idx,
+        'series': {coord: recent[coord] for coord in ('x', 'y', 'z') if recent[coord]},
+        'ymin': y_min,
+        'ymax': y_max,
+        'stroke_rate': strokeRate(),
+    }
+    if reference_stroke is not None:
+        frame['feedback'] = strokeFeedbackText()
+    if live_view_mode == LIVE_VIEW_SESSION:
+        # envelope points aren't one per sample
+        frame['xs'] = x_indices.tolist()
+    return frame
+
+
+def renderLive(data_points):
+    """Live page output in the current render mode (canvas frame or PNG)."""
+    if live_render_mode == LIVE_RENDER_CANVAS:
+        return liveFrame(data_points)
+    return livePlot(data_points)
+
+
+def setLiveRenderMode(mode):
+    global live_render_mode
+    live_render_mode = LIVE_RENDER_CANVAS if mode == LIVE_RENDER_CANVAS else LIVE_RENDER_PNG
+
+
 # creates main live data plot
 def livePlot(data_points):
     try:
@@ -107,7 +444,7 @@ def livePlot(data_points):
         
         # colours (maybe make configurable in the future)
         colors = {"x": "red", "y": "blue", "z": "green"}
-        start_idx, end_idx, x_indices, recent, all_recent = recentSeries(data_points, window_size)
+        start_idx, end_idx, x_indices, recent, all_recent = visibleSeries(data_points)
         
         # coords
         for coord in ["x", "y", "z"]:
@@ -116,60 +453,410 @@ def livePlot(data_points):
         
         ax.set_xlabel('Point Index')
         ax.set_ylabel('Measured Value (m/s^2)')
-        ax.set_title('Real-Time Data Replay')
+        if live_view_mode == LIVE_VIEW_SESSION:
+            title = 'Full Session (min/max overview)'
+        else:
+            title = 'Real-Time Data Replay'
+        title = f'{title} - {strokeRateText(strokeRate())}'
+        if reference_stroke is not None:
+            title += f'\n{strokeFeedbackText()}'
+        ax.set_title(title)
         ax.set_xlim(start_idx, end_idx)
         if all_recent:
             ax.set_ylim(min(all_recent) - 0.5, max(all_recent) + 0.5)
         ax.legend()
         ax.grid(True)
         
-        # convert to png for display in app
-        buf = BytesIO()
-        fig.savefig(buf, format='png', dpi=80, bbox_inches='tight')
-        buf.seek(0)
-        png_data = buf.getvalue()
-        plt.close(fig)
-        
-        return png_data
+        # convert for display in app (png or raw rgba)
+        return figureOutput(fig)
     except Exception as e:  
         print(f"Error generating plot PNG: {e}")
         return None
 
 # avereage stroke plot
+def sessionTimebase(points=None, seqs=None, current_rate_only=False):
+    """Samples on a uniform grid from their sequence numbers (gaps filled, duplicates dropped).
+
+    A live session recorded at more than one rate is gridded a stretch at a time and joined
+    up; current_rate_only gives just the stretch since the last rate change.
+    """
+    points = data_points if points is None else points
+    values = np.column_stack([points['x'], points['y'], points['z']]) if points['z'] else np.empty((0, 3))
+    if seqs is None:
+        seqs = sample_seqs if points is data_points else range(1, len(values) + 1)
+    seqs = list(seqs)[:len(values)]
+    if len(seqs) < len(values):
+        # data added without appendSample has no sequence numbers
+        seqs = list(range(1, len(values) + 1))
+    if points is not data_points or len(rate_segments) == 1:
+        return timebase.uniformGrid(seqs, values, SAMPLE_RATE_HZ)
+    if current_rate_only:
+        start = rate_segments[-1][0]
+        return timebase.uniformGrid(seqs[start:], values[start:], SAMPLE_RATE_HZ)
+    ends = [start for start, _rate in rate_segments[1:]] + [len(values)]
+    return timebase.joinGrids([
+        (timebase.uniformGrid(seqs[start:end], values[start:end], rate), rate)
+        for (start, rate), end in zip(rate_segments, ends) if end > start
+    ])
+
+
+def streamingBoundaries(acc):
+    """Stroke boundaries from the streaming detector, feeding it only rows it hasn't seen."""
+    global _streaming_state
+    from bkfbmobile.AU.streamingStroke import StreamingStrokeDetector
+
+    ay = acc['ay'].to_numpy()
+    if _streaming_state is None or _streaming_state[0] != stroke_axis or len(ay) < _streaming_state[1].index:
+        _streaming_state = (stroke_axis, StreamingStrokeDetector(sample_rate_hz=SAMPLE_RATE_HZ))
+    detector = _streaming_state[1]
+    detector.feed(ay[detector.index:])
+    return detector.boundaries
+
+
+def strokeAnalysis(data_points):
+    """Detect strokes in the session so far (shared by the average and compare pages).
+
+    The result carries a version that only changes when the detected strokes do (peak
+    positions, axis, padding), and is reused until a new sample arrives.
+    """
+    global _analysis_cache
+    if len(data_points['z']) < 20:
+        return None
+    cache_key = (point_count, len(data_points['z']), stroke_axis, stroke_padding_samples, stroke_detector,
+                 stroke_direction, refine_stroke_boundaries)
+    if _analysis_cache is not None and _analysis_cache[0] == cache_key:
+        return _analysis_cache[1]
+
+    # because it breaks on mobile
+    try:
+        from bkfbmobile.AU.averageStroke import getStrokes, getPeaks, getUniformAccelerationData, refinePeaks
+        from bkfbmobile.AU.strokeFeatures import getStrokeFeatures
+    except ImportError as e:
+        # Optional numeric dependencies are missing in this runtime.
+        print(f"Stroke analysis not available: {e}")
+        return None
+
+    # put samples on their real (sequence number) timebase so dropped packets don't
+    # squash strokes, then extract strokes
+    grid = sessionTimebase(data_points, current_rate_only=True)
+    if len(grid.times) < 20:
+        return None
+    acc = getUniformAccelerationData(grid.times, grid.values, axis=stroke_axis)
+    if stroke_detector == STROKE_DETECTOR_STREAMING:
+        peaks = np.asarray(streamingBoundaries(acc), dtype=np.int64)
+    else:
+        peaks = np.asarray(getPeaks(acc))
+    if refine_stroke_boundaries:
+        peaks = refinePeaks(acc, peaks)
+    strokes = getStrokes(acc, padding_samples=stroke_padding_samples, peakIndexes=peaks)
+
+    # strokes are cut between peaks, so the peak positions pin them down exactly
+    version = (len(strokes), int(peaks[-1]) if len(peaks) else -1, hash(peaks.tobytes()),
+               stroke_axis, stroke_padding_samples)
+    indexNewStrokes(strokes)
+    trackStrokeShapes(strokes)
+
+    # per-stroke features for the whole session in one vectorized pass
+    features = getStrokeFeatures(acc['ay'].to_numpy(), peaks, SAMPLE_RATE_HZ, stroke_direction)
+    analysis = StrokeAnalysis(strokes, version, features)
+    _analysis_cache = (cache_key, analysis)
+    return analysis
+
+
+def setStrokeIndexPath(path):
+    """Where the cross-session stroke index lives; it's loaded the first time it's needed."""
+    global stroke_index, stroke_index_path
+    stroke_index_path = path
+    stroke_index = None
+
+
+def strokeIndex():
+    """The stroke index, loaded from stroke_index_path (or a new one) on first use."""
+    global stroke_index
+    if stroke_index is not None or stroke_index_path is None:
+        return stroke_index
+    try:
+        from bkfbmobile.AU.strokeIndex import StrokeIndex
+    except ImportError as e:
+        print(f"Stroke index not available: {e}")
+        return None
+    try:
+        stroke_index = StrokeIndex.load(stroke_index_path) if os.path.exists(stroke_index_path) else StrokeIndex()
+    except Exception as e:
+        print(f"Error loading stroke index, starting a new one: {e}")
+        stroke_index = StrokeIndex()
+    return stroke_index
+
+
+def saveStrokeIndex():
+    if stroke_index is None or stroke_index_path is None:
+        return None
+    try:
+        # full-length strokes grow the index (and memory) without bound; reduce once it's big
+        if stroke_index.pca is None and len(stroke_index) >= STROKE_INDEX_PCA_THRESHOLD:
+            stroke_index.fitPca(components=STROKE_INDEX_PCA_COMPONENTS)
+        os.makedirs(os.path.dirname(stroke_index_path), exist_ok=True)
+        stroke_index.save(stroke_index_path)
+        return stroke_index_path
+    except Exception as e:
+        print(f"Error saving stroke index: {e}")
+        return None
+
+
+def indexNewStrokes(strokes, first=0):
+    # only strokes we haven't seen; earlier ones don't change once the next peak is in.
+    # strokes[0] is this session's stroke number first
+    global _indexed_strokes, _index_settings
+    if strokeIndex() is None:
+        return
+    settings = (stroke_axis, stroke_padding_samples, stroke_detector, refine_stroke_boundaries)
+    total = first + len(strokes)
+    if settings != _index_settings or total < _indexed_strokes:
+        # cut differently now, so this session's strokes so far are replaced rather than mixed in
+        if _indexed_strokes:
+            stroke_index.removeSession(session_label)
+        _indexed_strokes = 0
+        _index_settings = settings
+    if total <= _indexed_strokes:
+        return
+    stroke_index.add(strokes[max(0, _indexed_strokes - first):], session_label,
+                     firstNumber=max(_indexed_strokes, first))
+    _indexed_strokes = total
+
+
+def trackStrokeShapes(strokes, first=0):
+    """Feed strokes not seen yet to the live clusters and the shape model (strokes[0] is number first)."""
+    global stroke_clusters, stroke_shape_model, _clustered_strokes, _cluster_settings
+    from bkfbmobile.AU.strokeClusters import OnlineStrokeClusters
+    from bkfbmobile.AU.strokeIndex import resampleStroke
+    from bkfbmobile.AU.strokePca import IncrementalStrokePca
+
+    settings = (stroke_axis, stroke_padding_samples, stroke_detector, refine_stroke_boundaries)
+    total = first + len(strokes)
+    if stroke_clusters is None or settings != _cluster_settings or total < _clustered_strokes:
+        stroke_clusters = OnlineStrokeClusters()
+        stroke_shape_model = IncrementalStrokePca()
+        stroke_consistency.clear()
+        _clustered_strokes = 0
+        _cluster_settings = settings
+
+    new_strokes = strokes[max(0, _clustered_strokes - first):]
+    if total <= _clustered_strokes or not new_strokes:
+        return
+    stroke_clusters.extend(new_strokes)
+    for stroke in new_strokes:
+        vector = resampleStroke(stroke, stroke_shape_model.length)
+        # too few strokes yet to say what's typical
+        if stroke_shape_model.count > stroke_shape_model.components:
+            stroke_consistency.append(float(stroke_shape_model.consistency(vector)[0]))
+        else:
+            stroke_consistency.append(None)
+        stroke_shape_model.partialFit(vector)
+    _consistency_metric.set(stroke_consistency[-1])
+    _clustered_strokes = total
+
+
+def trackNewStrokes():
+    """Feed the strokes completed since the last call to the index, clusters and shape model.
+
+    Only the samples from a little before the last stroke boundary on are cut into strokes,
+    so this costs the same however long the session gets (strokeAnalysis redoes the lot).
+    """
+    global _tracking_state
+    try:
+        from bkfbmobile.AU.averageStroke import getStrokes, getPeaks, getUniformAccelerationData, refinePeaks
+        from bkfbmobile.AU.streamingStroke import getStreamingPeaks
+    except ImportError as e:
+        print(f"Stroke analysis not available: {e}")
+        return None
+
+    count = len(data_points['z'])
+    segment_start = rate_segments[-1][0]
+    settings = (stroke_axis, stroke_padding_samples, stroke_detector, refine_stroke_boundaries, segment_start)
+    if _tracking_state is None or _tracking_state[0] != settings or (_tracking_state[1] or 0) > count:
+        # start over from the beginning of this stretch at one rate
+        _tracking_state = (settings, None, 0)
+    _settings, last_boundary, fed = _tracking_state
+
+    start = segment_start
+    if last_boundary is not None:
+        start = max(segment_start, last_boundary - int(STROKE_TRACKING_LOOKBACK_S * SAMPLE_RATE_HZ))
+    if count - start < 20:
+        return None
+    if len(sample_seqs) >= count:
+        seqs = sample_seqs[start:count]
+    else:
+        # data added without appendSample has no sequence numbers
+        seqs = list(range(start + 1, count + 1))
+    values = np.column_stack([data_points[coord][start:count] for coord in ('x', 'y', 'z')])
+    grid = timebase.uniformGrid(seqs, values, SAMPLE_RATE_HZ)
+    acc = getUniformAccelerationData(grid.times, grid.values, axis=stroke_axis)
+    if stroke_detector == STROKE_DETECTOR_STREAMING:
+        peaks = np.asarray(getStreamingPeaks(acc, SAMPLE_RATE_HZ), dtype=np.int64)
+    else:
+        peaks = np.asarray(getPeaks(acc))
+    if refine_stroke_boundaries:
+        peaks = refinePeaks(acc, peaks)
+    if len(peaks) < 2:
+        return 0
+    strokes = getStrokes(acc, padding_samples=stroke_padding_samples, peakIndexes=peaks)
+
+    # where each boundary sits in data_points, to pick up from the last one next time
+    unwrapped, _restarts = timebase.unwrapSequence(seqs)
+    boundaries = start + np.searchsorted(unwrapped, grid.seqs[np.asarray(peaks, dtype=np.int64)])
+    if last_boundary is not None:
+        # the boundary we stopped at starts the first new stroke (give or take a sample)
+        closest = int(np.argmin(np.abs(boundaries - last_boundary)))
+        if abs(int(boundaries[closest]) - last_boundary) <= 2:
+            strokes = strokes[closest:]
+        else:
+            strokes = strokes[int(np.searchsorted(boundaries, last_boundary, side='right')):]
+    if strokes:
+        indexNewStrokes(strokes, fed)
+        trackStrokeShapes(strokes, fed)
+    _tracking_state = (settings, int(boundaries[-1]), fed + len(strokes))
+    return len(strokes)
+
+
+def setReferenceStroke(path=None):
+    """Score every new stroke against the average stroke saved at path (None turns it off)."""
+    global reference_stroke, _feedback_state
+    if path is None:
+        reference_stroke = None
+    else:
+        from bkfbmobile.AU.strokeFeedback import ReferenceStroke
+        reference_stroke = ReferenceStroke.fromFile(path)
+    _feedback_state = None
+    stroke_feedback.clear()
+    return reference_stroke
+
+
+def saveReferenceStroke(path):
+    """Save this session's average stroke to path and use it as the reference."""
+    analysis = strokeAnalysis(data_points)
+    if analysis is None or not analysis.strokes:
+        return None
+    from bkfbmobile.AU.averageStroke import getAverageStroke, saveAverageStroke
+    avg_acc, avg_vel = getAverageStroke(list(analysis.strokes), sampling_rate_hz=SAMPLE_RATE_HZ, direction=stroke_direction)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    saveAverageStroke(os.path.dirname(path), os.path.basename(path), avg_acc, avg_vel)
+    return setReferenceStroke(path)
+
+
+def feedbackSamples(values):
+    """Feed filtered stroke-axis values to the feedback detector, scoring strokes as they end."""
+    global _feedback_state
+    if reference_stroke is None:
+        return
+    if _feedback_state is None or _feedback_state[0] != stroke_axis:
+        from bkfbmobile.AU.streamingStroke import StreamingStrokeDetector
+        _feedback_state = (stroke_axis, StreamingStrokeDetector(sample_rate_hz=SAMPLE_RATE_HZ),
+                           deque(maxlen=FEEDBACK_HISTORY_SAMPLES))
+    _axis, detector, recent = _feedback_state
+    for value in values:
+        # same 'ay' (g) getUniformAccelerationData gives the analysis
+        ay = -float(value) / 9.81
+        recent.append(ay)
+        if detector.update(ay) is not None and len(detector.boundaries) >= 2:
+            scoreFinishedStroke(detector, recent)
+
+
+def scoreFinishedStroke(detector, recent):
+    # cut the stroke the way getStrokes does, padding included, from the recent values
+    with metrics.Timer(_feedback_ms_metric):
+        first = detector.index - len(recent)  # sample index of recent[0]
+        start = max(0, detector.boundaries[-2] - stroke_padding_samples) - first
+        end = min(detector.index, detector.boundaries[-1] + stroke_padding_samples) - first
+        if start < 0:
+            return None
+        stroke = np.fromiter(islice(recent, start, end), dtype=float, count=end - start)
+        feedback = reference_stroke.compare(stroke)
+    stroke_feedback.append(feedback)
+    _feedback_score_metric.set(feedback.score)
+    return feedback
+
+
+def strokeFeedbackText():
+    if not stroke_feedback:
+        return "Reference: waiting for a stroke"
+    feedback = stroke_feedback[-1]
+    direction = "high" if feedback.bias > 0 else "low"
+    return f"Reference: off by {feedback.score:.1f} std, worst {feedback.worstPhase} ({direction})"
+
+
+def alignedAverageStroke(strokes):
+    """Phase-aligned average of the strokes so far, aligning only the ones not seen yet."""
+    global _aligned_state
+    from bkfbmobile.AU.averageStroke import getMostCommonNumSamples
+    from bkfbmobile.AU.strokeAlignment import DtwStrokeAligner, alignedAverage
+
+    settings = (stroke_axis, stroke_padding_samples, stroke_detector, refine_stroke_boundaries)
+    if _aligned_state is None or _aligned_state[0] != settings or len(strokes) < _aligned_state[2]:
+        # template length fixed by the strokes we start with, as getAverageStroke would pick it
+        length, _resample = getMostCommonNumSamples([len(stroke) for stroke in strokes])
+        _aligned_state = (settings, DtwStrokeAligner(length), 0)
+    _settings, aligner, aligned = _aligned_state
+    aligner.extend(strokes[aligned:])
+    _aligned_state = (settings, aligner, len(strokes))
+    return alignedAverage(aligner, SAMPLE_RATE_HZ, stroke_direction)
+
+
+def setShowStrokeClusters(flag):
+    global show_stroke_clusters
+    show_stroke_clusters = bool(flag)
+
+
+def similarStrokes(stroke=None, k=5, other_sessions=True):
+    """Closest strokes in the index to stroke (default: the latest one) as (distance, session, number)."""
+    if strokeIndex() is None:
+        return []
+    if stroke is None:
+        analysis = strokeAnalysis(data_points)
+        if analysis is None or not analysis.strokes:
+            return []
+        stroke = analysis.strokes[-1]
+    return stroke_index.query(stroke, k=k, excludeSession=session_label if other_sessions else None)
+
+
+def similarStrokesText(k=3):
+    """The latest stroke's closest matches from earlier sessions, for the status line."""
+    matches = similarStrokes(k=k)
+    if not matches:
+        return "No similar strokes yet"
+    return "Most like: " + ", ".join(f"{session} #{number + 1} ({distance:.2f})" for distance, session, number in matches)
+
+
+CLUSTER_COLORS = ('tab:red', 'tab:blue', 'tab:green', 'tab:orange', 'tab:purple')
+
+
+def plotStrokeClusters(ax, clusters):
+    """Mean acceleration with a +/- 1 std band for each cluster."""
+    for n, (_label, count, mean, std) in enumerate(clusters.clusters()):
+        color = CLUSTER_COLORS[n % len(CLUSTER_COLORS)]
+        x = np.arange(len(mean))
+        ax.plot(x, mean, color=color, linewidth=2, label=f'Cluster {n + 1} ({count} strokes)')
+        ax.fill_between(x, mean - std, mean + std, color=color, alpha=0.2)
+    ax.set_ylabel('Acceleration (g)')
+    ax.legend(loc='upper right')
+
+
 def averageStroke(data_points):
     """Generate a PNG image of the average stroke plot."""
     try:
-        if len(data_points['z']) < 20:
-            return None
-        
-        # because it breaks on mobile
-        try:
-            from bkfbmobile.AU.averageStroke import getStrokes, getAverageStroke, readData, getAccelerationData
-        except ImportError as e:
-            # Optional numeric dependencies are missing in this runtime.
-            print(f"Stroke analysis not available: {e}")
-            return None
-        
-        # csv to store data for processing
-        import tempfile
-        with tempfile.NamedTemporaryFile(mode='w', suffix='.csv', delete=False) as f:
-            temp_csv = f.name
-            f.write('Time,Sensor1,Sensor2,Sensor3\n')
-            for i in range(len(data_points['z'])):
-                x_val = data_points['x'][i] if i < len(data_points['x']) else 0
-                y_val = data_points['y'][i] if i < len(data_points['y']) else 0
-                z_val = data_points['z'][i]
-                f.write(f'{i * 66666666},{x_val},{y_val},{z_val}\n')
-        
-        # process data to extract strokes and compute average
-        raw = readData(temp_csv)
-        acc = getAccelerationData(raw, axis=stroke_axis)
-        strokes = getStrokes(acc, padding_samples=stroke_padding_samples)
-        
-        os.unlink(temp_csv)
-        
-        if not strokes:
+        analysis = strokeAnalysis(data_points)
+        if analysis is None or not analysis.strokes:
             return None
+        strokes = analysis.strokes
+
+        # nothing changed since the last draw -> reuse the last image
+        cache_key = (analysis.version, stroke_direction, show_individual_strokes, show_stroke_clusters,
+                     stroke_alignment, frame_format)
+        cached = _render_cache.get(PAGE_AVERAGE)
+        if cached is not None and cached[0] == cache_key:
+            _render_cache_hits_metric.inc()
+            return cached[1]
+
+        from bkfbmobile.AU.averageStroke import getAverageStroke
         
         # plot
         fig, ax = plt.subplots(figsize=(8, 5))
@@ -179,9 +866,21 @@ def averageStroke(data_points):
             for i, s in enumerate(strokes):
                 ax.plot(np.arange(s.shape[0]), s, color='gray', alpha=0.6)
         
+        if show_stroke_clusters and stroke_clusters is not None and len(stroke_clusters):
+            plotStrokeClusters(ax, stroke_clusters)
+            ax.set_xlabel('Sample Index (resampled)')
+            ax.set_title(f'Stroke Clusters ({len(strokes)} strokes detected, {stroke_axis.upper()} axis)')
+            ax.grid(True)
+            output = figureOutput(fig)
+            _render_cache[PAGE_AVERAGE] = (cache_key, output)
+            return output
+
         # plot average
         try:
-            avg_acc, avg_vel = getAverageStroke(strokes, direction=stroke_direction)
+            if stroke_alignment == STROKE_ALIGNMENT_DTW:
+                avg_acc, avg_vel = alignedAverageStroke(strokes)
+            else:
+                avg_acc, avg_vel = getAverageStroke(strokes, sampling_rate_hz=SAMPLE_RATE_HZ, direction=stroke_direction)
             avg_acc_curve = avg_acc[0]
             avg_vel_curve = avg_vel[0]
             
@@ -204,17 +903,14 @@ def averageStroke(data_points):
             print(f"Could not compute average: {e}")
         
         ax.set_xlabel('Sample Index')
-        ax.set_title(f'Average Stroke ({len(strokes)} strokes detected, {stroke_axis.upper()} axis)')
+        aligned = ', phase-aligned' if stroke_alignment == STROKE_ALIGNMENT_DTW else ''
+        ax.set_title(f'Average Stroke ({len(strokes)} strokes detected, {stroke_axis.upper()} axis{aligned})')
         ax.grid(True)
         
-        # Convert to PNG bytes
-        buf = BytesIO()
-        fig.savefig(buf, format='png', dpi=80, bbox_inches='tight')
-        buf.seek(0)
-        png_data = buf.getvalue()
-        plt.close(fig)
-        
-        return png_data
+        # convert for display in app (png or raw rgba)
+        output = figureOutput(fig)
+        _render_cache[PAGE_AVERAGE] = (cache_key, output)
+        return output
     except Exception as e:
         print(f"Error generating average stroke PNG: {e}")
         import traceback
@@ -226,39 +922,24 @@ def averageStroke(data_points):
 def lastTwo(data_points):
     """Generate a PNG image comparing acceleration and velocity of the last two strokes."""
     try:
-        if len(data_points['z']) < 20:
+        analysis = strokeAnalysis(data_points)
+        if analysis is None or len(analysis.strokes) < 2:
             return None
+        strokes = analysis.strokes
 
-        try:
-            from bkfbmobile.AU.averageStroke import getStrokes, readData, getAccelerationData, getVelocityData
-        except ImportError as e:
-            print(f"Stroke comparison not available: {e}")
-            return None
-
-        import tempfile
-        with tempfile.NamedTemporaryFile(mode='w', suffix='.csv', delete=False) as f:
-            temp_csv = f.name
-            f.write('Time,Sensor1,Sensor2,Sensor3\n')
-            for i in range(len(data_points['z'])):
-                x_val = data_points['x'][i] if i < len(data_points['x']) else 0
-                y_val = data_points['y'][i] if i < len(data_points['y']) else 0
-                z_val = data_points['z'][i]
-                f.write(f'{i * 66666666},{x_val},{y_val},{z_val}\n')
-
-        raw = readData(temp_csv)
-        acc = getAccelerationData(raw, axis=stroke_axis)
-        strokes = getStrokes(acc, padding_samples=stroke_padding_samples)
-
-        os.unlink(temp_csv)
+        cache_key = (analysis.version, stroke_direction, frame_format)
+        cached = _render_cache.get(PAGE_COMPARE)
+        if cached is not None and cached[0] == cache_key:
+            _render_cache_hits_metric.inc()
+            return cached[1]
 
-        if len(strokes) < 2:
-            return None
+        from bkfbmobile.AU.averageStroke import getVelocityData
 
         stroke_prev = np.asarray(strokes[-2], dtype=float)
         stroke_last = np.asarray(strokes[-1], dtype=float)
 
-        vel_prev = np.asarray(getVelocityData(stroke_prev, direction=stroke_direction), dtype=float)
-        vel_last = np.asarray(getVelocityData(stroke_last, direction=stroke_direction), dtype=float)
+        vel_prev = np.asarray(getVelocityData(stroke_prev, sampling_rate_hz=SAMPLE_RATE_HZ, direction=stroke_direction), dtype=float)
+        vel_last = np.asarray(getVelocityData(stroke_last, sampling_rate_hz=SAMPLE_RATE_HZ, direction=stroke_direction), dtype=float)
 
         fig, ax_vel = plt.subplots(figsize=(8, 5))
 
@@ -300,21 +981,20 @@ def lastTwo(data_points):
         acc_half = max(abs(acc_data_min), abs(acc_data_max)) * 1.5
         ax_acc.set_ylim(-acc_half, acc_half)
 
-        ax_vel.set_title(f'Compare Stroke: Velocity + Current Stroke Acceleration ({stroke_axis.upper()} axis)')
+        title = f'Compare Stroke: Velocity + Current Stroke Acceleration ({stroke_axis.upper()} axis)'
+        if stroke_consistency and stroke_consistency[-1] is not None:
+            title += f'\nCurrent stroke consistency: {stroke_consistency[-1]:.2f}'
+        ax_vel.set_title(title)
         ax_vel.legend([line_prev_vel, line_last_vel, line_last_acc], [
             'Previous',
             'Current',
             'Current Stroke Acceleration'
         ], loc='upper right')
 
-        buf = BytesIO()
         fig.tight_layout()
-        fig.savefig(buf, format='png', dpi=80, bbox_inches='tight')
-        buf.seek(0)
-        png_data = buf.getvalue()
-        plt.close(fig)
-
-        return png_data
+        output = figureOutput(fig)
+        _render_cache[PAGE_COMPARE] = (cache_key, output)
+        return output
     except Exception as e:
         print(f"Error generating last-two-strokes PNG: {e}")
         import traceback
@@ -323,17 +1003,134 @@ def lastTwo(data_points):
 
 # when reset button is pressed
 def reset():
-    global data_points, point_count, save_writer, _filtered_sample
+    global data_points, sample_seqs, point_count, save_writer
     data_points = {"x": [], "y": [], "z": []}
+    sample_seqs = []
     point_count = 0
     save_writer = None
-    _filtered_sample = {'x': None, 'y': None, 'z': None}
+    _sample_filter.reset()
+    stroke_rate_estimator.reset()
+    _stale_pages.clear()
+    session_overview.reset()
+    rate_segments[:] = [(0, SAMPLE_RATE_HZ)]
+    resetStrokeAnalysis()
+    _render_cache.clear()
+    _shown_outputs.clear()
+    global _last_analysis_point_count
+    _last_analysis_point_count = 0
+    # the firmware starts counting from 1 again when the link drops and carries on through
+    # whatever it records offline, so the first seq after a reconnect says nothing about loss
+    global _last_seq
+    _last_seq = None
+    latency.dropPending()
+
+
+def resetStrokeAnalysis():
+    """Forget detected strokes and everything built from them (the samples stay)."""
+    global _analysis_cache, _streaming_state, _aligned_state, _tracking_state
+    _analysis_cache = None
+    _streaming_state = None
+    _aligned_state = None
+    _tracking_state = None
+    # strokes detected afresh are a new session as far as the stroke index is concerned
+    global session_label, _indexed_strokes
+    if _indexed_strokes:
+        session_label = time.strftime('%Y-%m-%d %H:%M:%S')
+    _indexed_strokes = 0
+    global stroke_clusters, stroke_shape_model, _clustered_strokes
+    stroke_clusters = None
+    stroke_shape_model = None
+    stroke_consistency.clear()
+    _clustered_strokes = 0
+    # the reference stays, the strokes scored against it don't
+    global _feedback_state
+    _feedback_state = None
+    stroke_feedback.clear()
+
+
+def exportLatencyTrace(path=None):
+    """Write the collected latency trace as Chrome trace JSON; returns the path or None."""
+    if not latency.enabled:
+        return None
+    if path is None:
+        path = os.environ.get("BKFB_TRACE_FILE") or os.path.join(tempfile.gettempdir(), "bkfb_trace.json")
+    try:
+        return latency.exportChromeTrace(path)
+    except Exception as e:
+        print(f"Error exporting latency trace: {e}")
+        return None
+
+def readSessionValues(session_path):
+    """(N, 3) x/y/z array from a session CSV (Time,Sensor1,Sensor2,Sensor3)."""
+    values = np.loadtxt(session_path, delimiter=',', skiprows=1, usecols=(1, 2, 3), ndmin=2)
+    return values.reshape(-1, 3)
+
+
+def saveSession(directory, name=None, points=None, seqs=None):
+    """Write the session as CSV with its zoom pyramid alongside; returns the CSV path."""
+    os.makedirs(directory, exist_ok=True)
+    if name is None:
+        name = f"bkfb_session_{int(time.time())}.csv"
+    session_path = os.path.join(directory, name)
+
+    # saved on the sequence-number timebase, so Time is real sample time
+    grid = sessionTimebase(points, seqs)
+    with open(session_path, 'w') as f:
+        f.write('Time,Sensor1,Sensor2,Sensor3\n')
+        for t, (x_val, y_val, z_val) in zip(grid.times, grid.values):
+            f.write(f'{int(round(t * CSV_TIME_UNITS_PER_SECOND))},{x_val},{y_val},{z_val}\n')
+    pyramid.SessionPyramid.fromValues(grid.values).save(session_path)
+    if points is None:
+        # index the strokes since the last analysis too
+        strokeAnalysis(data_points)
+    saveStrokeIndex()
+    return session_path
+
+
+def openSession(session_path):
+    """Zoomable pyramid for a recorded session (built on first open for older CSVs)."""
+    return pyramid.loadOrBuild(session_path, readSessionValues)
+
 
 # also when reset button is pressed
 def clearInAppPlots():
     """Clear accumulated live data and return refreshed plot images."""
     reset()
-    return livePlot(data_points), None, None
+    return renderLive(data_points), None, None
+
+
+def setActivePage(page):
+    """Tell the renderer which page is on screen (None for pages without a plot)."""
+    global active_page
+    active_page = page
+
+
+def renderPage(page, force=False):
+    """Render one page's figure if it has new data since it was last shown.
+
+    Returns (plot_png, avg_png, compare_png) with only that page's slot filled.
+    """
+    if not force and page not in _stale_pages:
+        return None, None, None
+    _stale_pages.discard(page)
+
+    if page == PAGE_LIVE:
+        return renderLive(data_points), None, None
+    if page == PAGE_AVERAGE:
+        with metrics.Timer(_analysis_ms_metric):
+            return None, unchangedAsNone(page, averageStroke(data_points), force), None
+    if page == PAGE_COMPARE:
+        with metrics.Timer(_analysis_ms_metric):
+            return None, None, unchangedAsNone(page, lastTwo(data_points), force)
+    return None, None, None
+
+
+def unchangedAsNone(page, output, force=False):
+    # a cached image the app already shows doesn't need converting again
+    if output is not None and output is _shown_outputs.get(page) and not force:
+        return None
+    _shown_outputs[page] = output
+    return output
 
 
 async def setStatus(on_status, text):
@@ -405,15 +1202,142 @@ def isMobilePlatform() -> bool:
         for key in ["ANDROID_ARGUMENT", "ANDROID_BOOTLOGO", "ANDROID_STORAGE", "IOS_ARGUMENT"]
     )
 
-def enqueueSample(loop, queue, x_value, y_value, z_value):
-    loop.call_soon_threadsafe(queue.put_nowait, (x_value, y_value, z_value))
+def setMetricsEnabled(flag):
+    """Turn pipeline metrics on or off."""
+    global _last_seq
+    if flag and not metrics.enabled:
+        # sequence numbers weren't tracked while off; the gap since isn't packet loss
+        _last_seq = None
+    metrics.setEnabled(flag)
+
+
+def trackSequence(seq):
+    """Count dropped/duplicated firmware sequence numbers."""
+    global _last_seq
+    if seq is None:
+        return
+    kind = timebase.classify(_last_seq, seq)
+    if kind == timebase.SEQ_DUPLICATE:
+        _seq_duplicate_metric.inc()
+        return
+    if kind == timebase.SEQ_GAP:
+        _seq_dropped_metric.inc(seq - _last_seq - 1)
+    _last_seq = seq
+
+
+def nextSeq(seq):
+    # samples without a sequence number are assumed to follow on
+    if seq is not None:
+        return seq
+    return sample_seqs[-1] + 1 if sample_seqs else 1
+
+
+def appendSample(seq, x_value, y_value, z_value):
+    """Filter one incoming sample and add it to the live data."""
+    global point_count
+    latency.mark(seq, "pipe")
+    if metrics.enabled:
+        _samples_metric.inc()
+        trackSequence(seq)
+    x_value, y_value, z_value = lowPassFilterSample(x_value, y_value, z_value)
+    latency.mark(seq, "filter")
+    data_points['x'].append(x_value)
+    data_points['y'].append(y_value)
+    data_points['z'].append(z_value)
+    session_overview.append((x_value, y_value, z_value))
+    axis_value = {'x': x_value, 'y': y_value, 'z': z_value}[stroke_axis]
+    stroke_rate_estimator.append(axis_value)
+    feedbackSamples((axis_value,))
+    sample_seqs.append(nextSeq(seq))
+    point_count += 1
+
+
+def appendSamples(samples):
+    """Filter a burst of (seq, x, y, z) samples in one vectorized call and add them."""
+    global point_count
+    if not samples:
+        return
+    if latency.enabled or metrics.enabled:
+        for seq, _x, _y, _z in samples:
+            latency.mark(seq, "pipe")
+            if metrics.enabled:
+                _samples_metric.inc()
+                trackSequence(seq)
+    filtered = lowPassFilterBatch([sample[1:] for sample in samples])
+    if latency.enabled:
+        for seq, _x, _y, _z in samples:
+            latency.mark(seq, "filter")
+    data_points['x'].extend(filtered[:, 0].tolist())
+    data_points['y'].extend(filtered[:, 1].tolist())
+    data_points['z'].extend(filtered[:, 2].tolist())
+    session_overview.extend(filtered)
+    axis_values = filtered[:, 'xyz'.index(stroke_axis)]
+    stroke_rate_estimator.extend(axis_values)
+    feedbackSamples(axis_values)
+    for seq, _x, _y, _z in samples:
+        sample_seqs.append(nextSeq(seq))
+    point_count += len(samples)
+
+
+async def renderUpdate(on_update):
+    """Render whichever page is visible and hand it to the app; hidden pages just go stale."""
+    global _last_analysis_point_count
+
+    plot_png = None
+    avg_png = None
+    compare_png = None
+
+    if active_page == PAGE_LIVE:
+        with metrics.Timer(_render_ms_metric):
+            plot_png = renderLive(data_points)
+        latency.markFrame("render")
+        _stale_pages.discard(PAGE_LIVE)
+    else:
+        _stale_pages.add(PAGE_LIVE)
+
+    # batches can jump over an exact multiple, so go by how far we've come since the last analysis
+    if point_count - _last_analysis_point_count >= avg_stroke_update_interval:
+        _last_analysis_point_count = point_count
+        _stale_pages.update((PAGE_AVERAGE, PAGE_COMPARE))
+        if active_page in (PAGE_AVERAGE, PAGE_COMPARE):
+            _plot, avg_png, compare_png = renderPage(active_page)
+        else:
+            # strokes still go into the index, clusters and shape model whatever page is up
+            with metrics.Timer(_analysis_ms_metric):
+                trackNewStrokes()
+
+    if plot_png is None and avg_png is None and compare_png is None:
+        return active_page != PAGE_LIVE
+    if plot_png is not None:
+        _frames_metric.inc()
+    await on_update(plot_png, avg_png, compare_png)
+    return True
+
+
+def enqueueSample(buffer, seq, x_value, y_value, z_value):
+    buffer.push((seq, x_value, y_value, z_value))
 
 
 # stupid worker that i hate
-async def runWorkerStream(on_update, stop_event, on_status):
-    global _active_worker, _active_worker_pid
+# it's started once in the background and reused by every connect, so pressing connect
+# doesn't pay for python startup, the bleak import and BlueZ setup each time
+async def startWorker():
+    """Start the background BLE worker process, or return the one already running."""
+    global _worker_start
+
+    worker = _active_worker
+    if worker is not None and worker.returncode is None:
+        return worker
+    # prewarm and a quick connect press both land here; they share one start
+    if _worker_start is None or _worker_start.done():
+        _worker_start = asyncio.ensure_future(spawnWorker())
+    return await asyncio.shield(_worker_start)
+
 
 # run in a seperate process grrr
+async def spawnWorker():
+    global _active_worker, _active_worker_pid
+
     env = os.environ.copy()
     env["PYTHONDEVMODE"] = "0"
     env["PYTHONMALLOC"] = "malloc"
@@ -430,7 +1354,7 @@ async def runWorkerStream(on_update, stop_event, on_status):
         sys.executable,
         "-m",
         "bkfbmobile.Networking.ble_worker",
-        ESP32_ADDR,
+        stdin=asyncio.subprocess.PIPE,
         stdout=asyncio.subprocess.PIPE,
         stderr=asyncio.subprocess.PIPE,
         env=env,
@@ -439,135 +1363,263 @@ async def runWorkerStream(on_update, stop_event, on_status):
 
     _active_worker = worker
     _active_worker_pid = worker.pid
+    _worker_stderr_tail.clear()
+    # keep stderr drained so a chatty worker can't block on a full pipe
+    asyncio.create_task(drainWorkerStderr(worker))
+    return worker
+
 
-    # because it breaks a lot
+async def drainWorkerStderr(worker):
+    if worker.stderr is None:
+        return
+    while True:
+        try:
+            line = await worker.stderr.readline()
+        except Exception:
+            return
+        if not line:
+            return
+        _worker_stderr_tail.append(line.decode("utf-8", errors="replace").rstrip())
+
+
+async def prewarmWorker():
+    """Start the BLE worker at app launch so the first connect doesn't wait for it."""
+    if isMobilePlatform():
+        return
     try:
-        while not stop_event.is_set():
-            if worker.stdout is None:
-                await setStatus(on_status, "BLE worker failed to start")
-                return
+        await startWorker()
+    except Exception as e:
+        print(f"Could not pre-start BLE worker: {e}")
+
+
+async def sendWorkerCommand(cmd, **fields):
+    worker = _active_worker
+    if worker is None or worker.returncode is not None or worker.stdin is None:
+        return False
+
+    payload = dict(fields, cmd=cmd)
+    try:
+        worker.stdin.write((json.dumps(payload) + "\n").encode("utf-8"))
+        await worker.stdin.drain()
+    except (BrokenPipeError, ConnectionResetError):
+        return False
+    return True
+
+
+async def requestDownload():
+    """Fetch the data the sensor recorded while disconnected.
+
+    Returns the (seq, x, y, z) samples, or None when not connected or the sensor didn't answer.
+    """
+    global _download_done
+    recorded_samples.clear()
+    if isMobilePlatform():
+        if await ble_runtime.request_download() is None:
+            return None
+    else:
+        if not _worker_streaming:
+            return None
+        _download_done = asyncio.get_running_loop().create_future()
+        try:
+            if not await sendWorkerCommand("download", session=_worker_session):
+                return None
+            # runWorkerStream resolves it with the worker's "downloaded" message
+            if await asyncio.wait_for(_download_done, ble_runtime.DOWNLOAD_TIMEOUT) is None:
+                return None
+        finally:
+            _download_done = None
+    samples = list(recorded_samples)
+    recorded_samples.clear()
+    return samples
+
+
+def saveRecordedSession(samples, directory):
+    """Save samples downloaded from the sensor as a session of their own; returns the CSV path."""
+    points = {'x': [s[1] for s in samples], 'y': [s[2] for s in samples], 'z': [s[3] for s in samples]}
+    return saveSession(directory, f"bkfb_recorded_{int(time.time())}.csv", points, [s[0] for s in samples])
+
+
+async def pumpWorkerLines(stream, lines):
+    # readline() hands over one line per wake-up; queueing them lets the reader take all that are waiting
+    while True:
+        line = await stream.readline()
+        lines.put_nowait(line)
+        if not line:
+            return
+
+
+async def runWorkerStream(on_update, stop_event, on_status):
+    global _active_worker, _active_worker_pid, _worker_session
+
+    worker = await startWorker()
+    loop = asyncio.get_running_loop()
+
+    if worker.stdout is None:
+        await setStatus(on_status, "BLE worker failed to start")
+        return
+
+    _worker_session += 1
+    session = _worker_session
+    await sendWorkerCommand("connect", address=ESP32_ADDR, session=session)
+
+    disconnect_deadline = None
+    session_ended = False
+    lines = asyncio.Queue()
+    pump = asyncio.ensure_future(pumpWorkerLines(worker.stdout, lines))
+
+    try:
+        # because it breaks a lot
+        while True:
+            if stop_event.is_set() and disconnect_deadline is None:
+                await sendWorkerCommand("disconnect", session=session)
+                disconnect_deadline = loop.time() + 2.0
+            if disconnect_deadline is not None and loop.time() > disconnect_deadline:
+                break
 
             try:
-                raw_line = await asyncio.wait_for(worker.stdout.readline(), timeout=0.25)
+                raw_lines = [await asyncio.wait_for(lines.get(), timeout=0.25)]
             except asyncio.TimeoutError:
                 if worker.returncode is not None:
                     break
                 continue
-
-            if not raw_line:
-                if worker.returncode is not None:
+            while not lines.empty():
+                raw_lines.append(lines.get_nowait())
+
+            first_point = point_count
+            samples = []
+            ending = None
+            for raw_line in raw_lines:
+                try:
+                    message = json.loads(raw_line.decode("utf-8").strip())
+                except Exception:
+                    continue
+
+                # leftovers from an earlier session
+                if message.get("session") != session:
+                    continue
+
+                kind = message.get("type")
+                if kind == "sample":
+                    if disconnect_deadline is not None:
+                        continue
+                    seq = message.get("seq")
+                    if latency.enabled:
+                        latency.markStamps(seq, message.get("t"))
+                    samples.append((seq, message["x"], message["y"], message["z"]))
+                    continue
+
+                # anything else applies from here on, so the samples before it go in first
+                appendSamples(samples)
+                samples = []
+                if kind == "status":
+                    await setStatus(on_status, message.get("text", ""))
+                elif kind == "metrics":
+                    for name, value in message.get("stats", {}).items():
+                        metrics.gauge(f"worker.{name}").set(value)
+                elif kind == "rate":
+                    applySampleRate(message["rate_hz"], message.get("batch", 1))
+                    await setStatus(on_status, f"Sample rate {SAMPLE_RATE_HZ:g} Hz")
+                elif kind == "recorded":
+                    recorded_samples.append((message["seq"], message["x"], message["y"], message["z"]))
+                elif kind == "downloaded":
+                    if _download_done is not None and not _download_done.done():
+                        _download_done.set_result(message.get("count"))
+                elif kind == "sensor_status":
+                    status = message.get("status")
+                    if status is not None:
+                        sensor_status.clear()
+                        sensor_status.update(status)
+                    if _status_done is not None and not _status_done.done():
+                        _status_done.set_result(status)
+                elif kind in ("error", "disconnected"):
+                    ending = message
                     break
-                continue
 
-            try:
-                message = json.loads(raw_line.decode("utf-8").strip())
-            except Exception:
+            appendSamples(samples)
+            if ending is None:
+                added = point_count - first_point
+                if added:
+                    _coalesced_metric.inc(added - 1)
+                    await renderUpdate(on_update)
                 continue
 
-            kind = message.get("type")
-            if kind == "status":
-                await setStatus(on_status, message.get("text", ""))
-            elif kind == "sample":
-                x_value, y_value, z_value = lowPassFilterSample(
-                    message["x"], message["y"], message["z"]
-                )
-                data_points['x'].append(x_value)
-                data_points['y'].append(y_value)
-                data_points['z'].append(z_value)
-
-                global point_count
-                point_count += 1
-
-                plot_png = livePlot(data_points)
-                avg_png = None
-                compare_png = None
-                if point_count % avg_stroke_update_interval == 0:
-                    avg_png = averageStroke(data_points)
-                    compare_png = lastTwo(data_points)
-
-                if plot_png:
-                    await on_update(plot_png, avg_png, compare_png)
-            elif kind == "error":
-                await setStatus(on_status, message.get("text", "Connection error"))
-                return
-            elif kind == "disconnected":
-                await setStatus(on_status, "Disconnected")
+            session_ended = True
+            if disconnect_deadline is None:
+                if ending["type"] == "error":
+                    await setStatus(on_status, ending.get("text", "Connection error"))
+                else:
+                    await setStatus(on_status, "Disconnected")
                 return
+            break
     finally:
-        if worker.returncode is None:
-            worker.terminate()
-            try:
-                await asyncio.wait_for(worker.wait(), timeout=1.0)
-            except asyncio.TimeoutError:
-                worker.kill()
-                await worker.wait()
+        pump.cancel()
+        await asyncio.wait([pump])
+
+    if worker.returncode is not None:
+        # worker died, next connect starts a fresh one
+        _active_worker = None
+        _active_worker_pid = None
+        if worker.returncode != 0:
+            if _worker_stderr_tail:
+                await setStatus(on_status, f"BLE worker error: {_worker_stderr_tail[-1]}")
+            else:
+                await setStatus(on_status, f"BLE worker exited ({worker.returncode})")
+            return
+    elif not session_ended:
+        # worker didn't let go of the connection in time, so restart it
+        forceStopWorkerSync()
+        try:
+            await asyncio.wait_for(worker.wait(), timeout=1.0)
+        except asyncio.TimeoutError:
+            worker.kill()
         _active_worker = None
         _active_worker_pid = None
-
-    if worker.returncode not in (0, None):
-        stderr_text = ""
-        if worker.stderr is not None:
-            try:
-                stderr_text = (await worker.stderr.read()).decode("utf-8", errors="replace").strip()
-            except Exception:
-                stderr_text = ""
-        if stderr_text:
-            await setStatus(on_status, f"BLE worker error: {stderr_text.splitlines()[-1]}")
-        else:
-            await setStatus(on_status, f"BLE worker exited ({worker.returncode})")
-        return
 
     await setStatus(on_status, "Stopped")
 
 
 async def runInProcessStream(on_update, stop_event, on_status):
-    sample_queue: asyncio.Queue[tuple[float, float, float]] = asyncio.Queue()
-    stream_done = asyncio.Event()
-
     loop = asyncio.get_running_loop()
+    try:
+        sample_buffer = ingest.SampleBuffer(loop, INGEST_QUEUE_CAPACITY, INGEST_QUEUE_POLICY)
+    except ValueError as e:
+        print(f"{e}, using {ingest.DROP_OLDEST}")
+        sample_buffer = ingest.SampleBuffer(loop, INGEST_QUEUE_CAPACITY, ingest.DROP_OLDEST)
     
+    # rate acks arrive on the BLE callback; they're applied by the consumer, after the
+    # samples that were queued before them
+    rate_acks = []
+
     async def status_wrapper(text: str) -> None:
         await setStatus(on_status, text)
 
+    def on_rate(rate_hz, batch):
+        rate_acks.append((rate_hz, batch, len(sample_buffer)))
+
     async def consume_samples():
-        global point_count
         last_rendered_point_count = 0
 
-        while not stream_done.is_set() or not sample_queue.empty():
-            try:
-                x_value, y_value, z_value = await asyncio.wait_for(
-                    sample_queue.get(), timeout=0.1
-                )
-                x_value, y_value, z_value = lowPassFilterSample(x_value, y_value, z_value)
-                # append first sample
-                data_points['x'].append(x_value)
-                data_points['y'].append(y_value)
-                data_points['z'].append(z_value)
-                point_count += 1
-
-                # remove queue
-                while not sample_queue.empty():
-                    x_value, y_value, z_value = sample_queue.get_nowait()
-                    x_value, y_value, z_value = lowPassFilterSample(x_value, y_value, z_value)
-                    data_points['x'].append(x_value)
-                    data_points['y'].append(y_value)
-                    data_points['z'].append(z_value)
-                    point_count += 1
-            except asyncio.TimeoutError:
-                pass
+        while not sample_buffer.closed or len(sample_buffer):
+            # one wake-up hands over everything that queued up since the last one
+            batch = await sample_buffer.getBatch(timeout=0.1)
+            # what was queued when an ack came is the front of this batch
+            taken = 0
+            while rate_acks:
+                rate_hz, sensor_samples, queued = rate_acks.pop(0)
+                appendSamples(batch[taken:queued])
+                taken = max(taken, queued)
+                applySampleRate(rate_hz, sensor_samples)
+                await setStatus(on_status, f"Sample rate {SAMPLE_RATE_HZ:g} Hz")
+            batch = batch[taken:]
+            if batch:
+                _queue_depth_metric.set(len(batch))
+                _coalesced_metric.inc(len(batch) - 1)
+                appendSamples(batch)
 
             if point_count == last_rendered_point_count:
                 continue
 
-            plot_png = livePlot(data_points)
-            avg_png = None
-            compare_png = None
-            if point_count % avg_stroke_update_interval == 0:
-                avg_png = averageStroke(data_points)
-                compare_png = lastTwo(data_points)
-
-            if plot_png:
-                await on_update(plot_png, avg_png, compare_png)
+            if await renderUpdate(on_update):
                 last_rendered_point_count = point_count
 
     consume_task = asyncio.create_task(consume_samples())
@@ -575,9 +1627,11 @@ async def runInProcessStream(on_update, stop_event, on_status):
     try:
         await ble_runtime.stream_samples(
             ESP32_ADDR,
-            on_sample=lambda x, y, z: enqueueSample(loop, sample_queue, x, y, z),
+            on_sample=lambda seq, x, y, z: enqueueSample(sample_buffer, seq, x, y, z),
             stop_event=stop_event,
             on_status=status_wrapper,
+            on_rate=on_rate,
+            on_recorded=lambda seq, x, y, z: recorded_samples.append((seq, x, y, z)),
         )
     except Exception as exc:
         await setStatus(on_status, f"BLE stream error: {exc}")
@@ -586,8 +1640,10 @@ async def runInProcessStream(on_update, stop_event, on_status):
         traceback.print_exc()
         return
     finally:
-        stream_done.set()
+        sample_buffer.close()
         await consume_task
+        if sample_buffer.overflow:
+            print(f"Ingest queue overflowed {sample_buffer.overflow} times ({sample_buffer.policy})")
 
     if stop_event.is_set():
         await setStatus(on_status, "Stopped")
@@ -604,12 +1660,20 @@ async def connectLiveInApp(on_update, stop_event=None, on_status=None):
         return
 
     reset()
+    # the sensor starts every connection at its default rate
+    applySampleRate(ble_runtime.DEFAULT_SAMPLE_RATE_HZ)
     await setStatus(on_status, f"Connecting to {ESP32_ADDR}...")
 
     if isMobilePlatform():
         await runInProcessStream(on_update, stop_event, on_status)
     else:
-        await runWorkerStream(on_update, stop_event, on_status)
+        global _worker_streaming
+        # only while this runs is anyone reading the worker's replies
+        _worker_streaming = True
+        try:
+            await runWorkerStream(on_update, stop_event, on_status)
+        finally:
+            _worker_streaming = False
 
 
 if __name__ == "__main__":
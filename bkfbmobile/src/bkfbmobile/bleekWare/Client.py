@@ -174,6 +174,16 @@ class _PythonGattCallback(static_proxy(BluetoothGattCallback)):
         if status == BluetoothGatt.GATT_SUCCESS:
             self.client.mtu = mtu
 
+    @Override(jvoid, [BluetoothGatt, jint, jint])
+    def onReadRemoteRssi(self, gatt, rssi, status):
+        """Store the signal strength of the connection.
+
+        This is the callback function for Android's 'gatt.readRemoteRssi'.
+        """
+        if status == BluetoothGatt.GATT_SUCCESS:
+            self.client.rssi = rssi
+        self.client.rssi_read = True
+
 
 class Client:
     """Class to connect to a Bluetooth LE GATT server and communicate."""
@@ -211,6 +221,8 @@ class Client:
         self.gatt = None
         self._services = []
         self.mtu = 23
+        self.rssi = None
+        self.rssi_read = False
 
     def __str__(self):
         return f'{self.__class__.__name__}, {self.address}'
@@ -477,6 +489,25 @@ class Client:
         else:
             raise bleekWareCharacteristicNotFoundError(uuid)
 
+    async def get_rssi(self, timeout=1.0):
+        """Read the signal strength (dBm) of the current connection.
+
+        Not part of bleak's client API (bleak can't while connected);
+        returns None when it can't be read or no answer comes within timeout.
+        """
+        if self.gatt is None:
+            return None
+        self.rssi = None
+        self.rssi_read = False
+        if not self.gatt.readRemoteRssi():
+            return None
+        deadline = asyncio.get_running_loop().time() + timeout
+        while not self.rssi_read:
+            if asyncio.get_running_loop().time() > deadline:
+                return None
+            await asyncio.sleep(0.05)
+        return self.rssi
+
     @property
     def address(self):
         return self._address
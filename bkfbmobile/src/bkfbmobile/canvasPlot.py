@@ -0,0 +1,151 @@
+# native live plot - draws the XYZ window straight onto a toga.Canvas so the live view
+# doesn't go through matplotlib + PNG encode/decode every frame (matplotlib is still used
+# for the stroke pages and static exports)
+
+import math
+
+from toga.fonts import BOLD, SANS_SERIF, Font
+
+# same colours as livePlot
+COLORS = {"x": "red", "y": "blue", "z": "green"}
+GRID_COLOR = "#d0d0d0"
+AXIS_COLOR = "#404040"
+
+MARGIN_LEFT = 48
+MARGIN_RIGHT = 12
+MARGIN_TOP = 12
+MARGIN_BOTTOM = 28
+
+_label_font = None
+_rate_font = None
+
+
+def labelFont():
+    # fonts need the toga backend, so don't build one at import time
+    global _label_font
+    if _label_font is None:
+        _label_font = Font(SANS_SERIF, 9)
+    return _label_font
+
+
+def rateFont():
+    global _rate_font
+    if _rate_font is None:
+        _rate_font = Font(SANS_SERIF, 14, weight=BOLD)
+    return _rate_font
+
+
+def niceTicks(lo, hi, count=5):
+    """Round tick positions covering [lo, hi]."""
+    span = hi - lo
+    if span <= 0 or not math.isfinite(span):
+        return [lo]
+    raw_step = span / max(1, count)
+    magnitude = 10 ** math.floor(math.log10(raw_step))
+    for multiple in (1, 2, 5, 10):
+        step = multiple * magnitude
+        if step >= raw_step:
+            break
+    first = math.ceil(lo / step) * step
+    ticks = []
+    value = first
+    while value <= hi + step * 1e-9:
+        ticks.append(round(value, 10))
+        value += step
+    return ticks
+
+
+def tickDecimals(ticks):
+    """Decimals needed to tell ticks apart (from the step between them)."""
+    if len(ticks) < 2:
+        return 0
+    step = abs(ticks[1] - ticks[0])
+    if step <= 0 or not math.isfinite(step):
+        return 0
+    return max(0, -math.floor(math.log10(step) + 1e-9))
+
+
+def formatTick(value, decimals=0):
+    return f"{value:.{decimals}f}"
+
+
+def drawLivePlot(canvas, frame, width, height):
+    """Draw one live frame (from bkfb.liveFrame) onto the canvas."""
+    # newer toga calls the canvas' root drawing context root_state, older versions context
+    ctx = getattr(canvas, "root_state", None) or canvas.context
+    ctx.clear()
+    if frame is None:
+        return
+
+    plot_w = width - MARGIN_LEFT - MARGIN_RIGHT
+    plot_h = height - MARGIN_TOP - MARGIN_BOTTOM
+    if plot_w <= 10 or plot_h <= 10:
+        return
+
+    x_lo, x_hi = frame["start"], max(frame["end"], frame["start"] + 1)
+    y_lo, y_hi = frame["ymin"], frame["ymax"]
+    if y_hi <= y_lo:
+        y_lo, y_hi = y_lo - 1.0, y_hi + 1.0
+
+    x_scale = plot_w / (x_hi - x_lo)
+    y_scale = plot_h / (y_hi - y_lo)
+
+    def px(index):
+        return MARGIN_LEFT + (index - x_lo) * x_scale
+
+    def py(value):
+        return MARGIN_TOP + (y_hi - value) * y_scale
+
+    # grid + tick labels
+    y_ticks = niceTicks(y_lo, y_hi)
+    x_ticks = niceTicks(x_lo, x_hi)
+    with ctx.Stroke(color=GRID_COLOR, line_width=1) as grid:
+        for tick in y_ticks:
+            grid.move_to(MARGIN_LEFT, py(tick))
+            grid.line_to(MARGIN_LEFT + plot_w, py(tick))
+        for tick in x_ticks:
+            grid.move_to(px(tick), MARGIN_TOP)
+            grid.line_to(px(tick), MARGIN_TOP + plot_h)
+
+    y_decimals = tickDecimals(y_ticks)
+    for tick in y_ticks:
+        ctx.write_text(formatTick(tick, y_decimals), 4, py(tick) + 3, font=labelFont())
+    x_decimals = tickDecimals(x_ticks)
+    for tick in x_ticks:
+        ctx.write_text(formatTick(tick, x_decimals), px(tick) - 8, MARGIN_TOP + plot_h + 14, font=labelFont())
+
+    # axes box
+    with ctx.Stroke(color=AXIS_COLOR, line_width=1) as axes:
+        axes.rect(MARGIN_LEFT, MARGIN_TOP, plot_w, plot_h)
+
+    # one polyline per axis (one point per sample unless the frame gives its own x positions)
+    start = frame["start"]
+    xs = frame.get("xs")
+    for coord, values in frame["series"].items():
+        if len(values) < 2:
+            continue
+        positions = xs if xs is not None else range(start, start + len(values))
+        points = iter(zip(positions, values))
+        with ctx.Stroke(color=COLORS[coord], line_width=2) as line:
+            x, value = next(points)
+            line.move_to(px(x), py(value))
+            for x, value in points:
+                line.line_to(px(x), py(value))
+
+    # stroke rate in the top left corner
+    if "stroke_rate" in frame:
+        spm = frame["stroke_rate"]
+        text = f"{spm:.1f} spm" if spm is not None else "-- spm"
+        ctx.write_text(text, MARGIN_LEFT + 8, MARGIN_TOP + 16, font=rateFont())
+    # last stroke against the reference, under it
+    if frame.get("feedback"):
+        ctx.write_text(frame["feedback"], MARGIN_LEFT + 8, MARGIN_TOP + 32, font=labelFont())
+
+    # legend
+    legend_x = MARGIN_LEFT + plot_w - 70
+    for i, coord in enumerate(frame["series"]):
+        y = MARGIN_TOP + 14 + i * 14
+        with ctx.Stroke(color=COLORS[coord], line_width=2) as swatch:
+            swatch.move_to(legend_x, y - 4)
+            swatch.line_to(legend_x + 16, y - 4)
+        ctx.write_text(coord.upper(), legend_x + 22, y, font=labelFont())
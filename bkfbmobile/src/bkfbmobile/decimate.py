@@ -0,0 +1,127 @@
+# incremental min/max decimation for drawing a whole session
+#
+# keeps at most max_buckets (min, max) pairs per channel. when the buckets fill up,
+# neighbouring pairs are merged and the bucket width doubles, so a 3 hour session costs
+# the same to draw as a few hundred points, and spikes survive because every bucket
+# keeps its extremes.
+
+import numpy as np
+
+
+class MinMaxDecimator:
+    def __init__(self, max_buckets=400, channels=3):
+        if max_buckets < 2 or max_buckets % 2:
+            raise ValueError("max_buckets must be an even number >= 2")
+        self.max_buckets = max_buckets
+        self.channels = channels
+        self.reset()
+
+    def reset(self):
+        self.bucket_size = 1
+        self.count = 0  # full buckets
+        self.total = 0  # samples seen
+        self.mins = np.empty((self.max_buckets, self.channels))
+        self.maxs = np.empty((self.max_buckets, self.channels))
+        self._partial_min = None
+        self._partial_max = None
+        self._partial_count = 0
+
+    def _commitPartial(self):
+        self.mins[self.count] = self._partial_min
+        self.maxs[self.count] = self._partial_max
+        self.count += 1
+        self._partial_min = None
+        self._partial_max = None
+        self._partial_count = 0
+        if self.count == self.max_buckets:
+            self._merge()
+
+    def _merge(self):
+        half = self.count // 2
+        self.mins[:half] = np.minimum(self.mins[0:self.count:2], self.mins[1:self.count:2])
+        self.maxs[:half] = np.maximum(self.maxs[0:self.count:2], self.maxs[1:self.count:2])
+        self.count = half
+        self.bucket_size *= 2
+
+    def append(self, values):
+        """Add one sample (one value per channel). Cheap enough to call per sample."""
+        if self._partial_count == 0:
+            self._partial_min = list(values)
+            self._partial_max = list(values)
+        else:
+            pmin = self._partial_min
+            pmax = self._partial_max
+            for c, value in enumerate(values):
+                if value < pmin[c]:
+                    pmin[c] = value
+                elif value > pmax[c]:
+                    pmax[c] = value
+        self._partial_count += 1
+        self.total += 1
+        if self._partial_count == self.bucket_size:
+            self._commitPartial()
+
+    def extend(self, values):
+        """Add an (N, channels) batch in a few vectorized steps."""
+        values = np.asarray(values, dtype=float).reshape(-1, self.channels)
+        n = len(values)
+        i = 0
+        while i < n:
+            remaining = n - i
+            if self._partial_count or remaining < self.bucket_size:
+                take = min(self.bucket_size - self._partial_count, remaining)
+                chunk = values[i:i + take]
+                chunk_min = chunk.min(axis=0)
+                chunk_max = chunk.max(axis=0)
+                if self._partial_count:
+                    chunk_min = np.minimum(chunk_min, self._partial_min)
+                    chunk_max = np.maximum(chunk_max, self._partial_max)
+                self._partial_min = list(chunk_min)
+                self._partial_max = list(chunk_max)
+                self._partial_count += take
+                self.total += take
+                i += take
+                if self._partial_count == self.bucket_size:
+                    self._commitPartial()
+                continue
+
+            whole = min(remaining // self.bucket_size, self.max_buckets - self.count)
+            block = values[i:i + whole * self.bucket_size].reshape(whole, self.bucket_size, self.channels)
+            self.mins[self.count:self.count + whole] = block.min(axis=1)
+            self.maxs[self.count:self.count + whole] = block.max(axis=1)
+            self.count += whole
+            self.total += whole * self.bucket_size
+            i += whole * self.bucket_size
+            if self.count == self.max_buckets:
+                self._merge()
+
+    def buckets(self):
+        """(starts, mins, maxs) for every bucket including the one still filling.
+
+        starts are the sample index each bucket begins at; mins/maxs are (buckets, channels).
+        """
+        mins = self.mins[:self.count]
+        maxs = self.maxs[:self.count]
+        if self._partial_count:
+            mins = np.vstack([mins, self._partial_min])
+            maxs = np.vstack([maxs, self._partial_max])
+        starts = np.arange(len(mins)) * self.bucket_size
+        return starts, mins, maxs
+
+    def envelope(self):
+        """Zig-zag polyline through each bucket's min and max, one array per channel.
+
+        Drawing this as a plain line shows the full envelope (spikes included).
+        Returns (xs, ys) with xs of length 2*buckets and ys of shape (2*buckets, channels).
+        """
+        starts, mins, maxs = self.buckets()
+        if len(starts) == 0:
+            return np.empty(0), np.empty((0, self.channels))
+        ends = np.minimum(starts + self.bucket_size, self.total) - 1
+        xs = np.empty(2 * len(starts))
+        xs[0::2] = starts
+        xs[1::2] = np.maximum(starts, ends)
+        ys = np.empty((2 * len(starts), self.channels))
+        ys[0::2] = mins
+        ys[1::2] = maxs
+        return xs, ys
@@ -0,0 +1,101 @@
+# stateful low-pass filters for incoming samples
+#
+# state is kept per channel between calls, so a burst of samples can be filtered as one
+# (N, channels) batch and give the same output as feeding them in one at a time.
+
+import numpy as np
+
+FILTER_RC = 'rc'
+FILTER_BUTTERWORTH = 'butter'
+
+
+def _lfilter():
+    # scipy is optional at runtime (see AU), fall back to a plain loop without it
+    try:
+        from scipy.signal import lfilter
+        return lfilter
+    except ImportError:
+        return None
+
+
+class LowPassFilter:
+    """First-order (RC) low-pass. The first sample passes through unchanged."""
+
+    def __init__(self, cutoff_hz, sample_rate_hz, channels=3):
+        dt = 1.0 / sample_rate_hz
+        rc = 1.0 / (2.0 * np.pi * cutoff_hz)
+        self.alpha = dt / (rc + dt)
+        self.channels = channels
+        self.reset()
+
+    def reset(self):
+        self.state = None
+
+    def sample(self, values):
+        """Filter one sample (one value per channel); returns a tuple."""
+        alpha = self.alpha
+        if self.state is None:
+            self.state = [float(v) for v in values]
+        else:
+            state = self.state
+            for c, raw in enumerate(values):
+                prev = state[c]
+                state[c] = prev + alpha * (float(raw) - prev)
+        return tuple(self.state)
+
+    def batch(self, values):
+        """Filter an (N, channels) batch in one call; returns an (N, channels) array."""
+        values = np.asarray(values, dtype=float).reshape(-1, self.channels)
+        if len(values) == 0:
+            return values.copy()
+        if self.state is None:
+            self.state = values[0].tolist()
+
+        lfilter = _lfilter()
+        if lfilter is None:
+            return np.array([self.sample(row) for row in values])
+
+        # y[n] = y[n-1] + alpha * (x[n] - y[n-1])
+        decay = 1.0 - self.alpha
+        zi = (decay * np.asarray(self.state))[None, :]
+        out, _zf = lfilter([self.alpha], [1.0, -decay], values, axis=0, zi=zi)
+        self.state = out[-1].tolist()
+        return out
+
+
+class ButterworthFilter:
+    """Butterworth low-pass as second-order sections, settled to the first sample."""
+
+    def __init__(self, cutoff_hz, sample_rate_hz, order=2, channels=3):
+        from scipy.signal import butter, sosfilt_zi
+
+        if not 0 < cutoff_hz < sample_rate_hz / 2.0:
+            raise ValueError(f"cutoff must be between 0 and {sample_rate_hz / 2.0} Hz (Nyquist)")
+        self.sos = butter(order, cutoff_hz, btype='low', fs=sample_rate_hz, output='sos')
+        self._zi_unit = sosfilt_zi(self.sos)  # (sections, 2) steady state for a unit step
+        self.channels = channels
+        self.reset()
+
+    def reset(self):
+        self.zi = None
+
+    def sample(self, values):
+        return tuple(self.batch([values])[0])
+
+    def batch(self, values):
+        from scipy.signal import sosfilt
+
+        values = np.asarray(values, dtype=float).reshape(-1, self.channels)
+        if len(values) == 0:
+            return values.copy()
+        if self.zi is None:
+            # start as if the first value had always been there (no start-up ringing)
+            self.zi = self._zi_unit[:, :, None] * values[0][None, None, :]
+        out, self.zi = sosfilt(self.sos, values, axis=0, zi=self.zi)
+        return out
+
+
+def makeFilter(kind, cutoff_hz, sample_rate_hz, order=2, channels=3):
+    if kind == FILTER_BUTTERWORTH:
+        return ButterworthFilter(cutoff_hz, sample_rate_hz, order=order, channels=channels)
+    return LowPassFilter(cutoff_hz, sample_rate_hz, channels=channels)
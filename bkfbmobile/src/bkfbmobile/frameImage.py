@@ -0,0 +1,70 @@
+# turns bkfb plot output (PNG bytes or raw RGBA frames) into toga images
+#
+# raw frames go into the backend's native bitmap type where we know how to build one (GTK
+# pixbuf, Android Bitmap). that skips PNG entirely but still copies the pixels, as
+# neither API can borrow a python buffer. other backends (cocoa, winforms, ...) go through
+# toga's Pillow support, which writes and reads back an uncompressed PNG.
+
+import toga
+from toga.platform import get_platform_factory
+
+from bkfbmobile import bkfb
+
+_native_builder = None
+_native_checked = False
+
+
+def _gtkPixbuf(frame):
+    from gi.repository import GdkPixbuf, GLib
+
+    # GLib.Bytes takes a copy of the pixels
+    return GdkPixbuf.Pixbuf.new_from_bytes(
+        GLib.Bytes.new(bytes(frame.buffer)),
+        GdkPixbuf.Colorspace.RGB,
+        True,
+        8,
+        frame.width,
+        frame.height,
+        frame.width * 4,
+    )
+
+
+def _androidBitmap(frame):
+    from android.graphics import Bitmap
+    from java.nio import ByteBuffer
+
+    # ARGB_8888 is stored as RGBA bytes, same layout as the Agg buffer; the pixels are copied
+    # into a java byte[] and again into the bitmap
+    bitmap = Bitmap.createBitmap(frame.width, frame.height, Bitmap.Config.ARGB_8888)
+    bitmap.copyPixelsFromBuffer(ByteBuffer.wrap(bytes(frame.buffer)))
+    return bitmap
+
+
+def _nativeBuilder():
+    global _native_builder, _native_checked
+    if not _native_checked:
+        _native_checked = True
+        backend = getattr(get_platform_factory(), "__name__", "")
+        if backend.startswith("toga_gtk"):
+            _native_builder = _gtkPixbuf
+        elif backend.startswith("toga_android"):
+            _native_builder = _androidBitmap
+    return _native_builder
+
+
+def toTogaImage(frame):
+    """Build a toga.Image from PNG bytes or a bkfb.RgbaFrame."""
+    global _native_builder
+    if not isinstance(frame, bkfb.RgbaFrame):
+        return toga.Image(src=frame)
+
+    builder = _nativeBuilder()
+    if builder is not None:
+        try:
+            return toga.Image(src=builder(frame))
+        except Exception as e:
+            # don't keep trying a path that doesn't work on this device
+            print(f"Native frame conversion failed, using Pillow: {e}")
+            _native_builder = None
+
+    return toga.Image(src=bkfb.rgbaFrameToPil(frame))
@@ -0,0 +1,104 @@
+# bounded handoff from the BLE callback to the asyncio consumer
+#
+# samples are pushed one at a time (from whatever thread the BLE backend calls back on) but
+# collected in batches: the consumer is woken at most once per batch instead of once per
+# sample, and the buffer never grows past its capacity however far behind rendering gets.
+
+import asyncio
+import threading
+from collections import deque
+
+from bkfbmobile import metrics
+
+DROP_OLDEST = 'drop_oldest'    # keep the newest data, the live view stays current
+DROP_NEWEST = 'drop_newest'    # keep what's queued, discard new arrivals
+BLOCK = 'block'                # make the producer wait for room (never from the loop thread)
+POLICIES = (DROP_OLDEST, DROP_NEWEST, BLOCK)
+
+_overflow_metric = metrics.counter("pipeline.queue_overflow")
+
+
+class SampleBuffer:
+    def __init__(self, loop, capacity=2048, policy=DROP_OLDEST, block_timeout=1.0):
+        if policy not in POLICIES:
+            raise ValueError(f"Unknown queue policy: {policy}")
+        self.loop = loop
+        self.capacity = capacity
+        self.policy = policy
+        self.block_timeout = block_timeout
+        self.overflow = 0
+
+        self._items = deque()
+        self._lock = threading.Lock()
+        self._space = threading.Condition(self._lock)
+        self._ready = asyncio.Event()
+        self._wake_pending = False
+        self._closed = False
+        self._loop_thread = threading.get_ident()
+
+    def __len__(self):
+        return len(self._items)
+
+    def push(self, sample):
+        """Add one sample. Safe to call from any thread; returns False if something was dropped."""
+        with self._lock:
+            kept = True
+            if len(self._items) >= self.capacity:
+                kept = self._makeRoom()
+            if kept is not None:
+                self._items.append(sample)
+            wake = not self._wake_pending
+            self._wake_pending = True
+        if wake:
+            self._wake()
+        return kept is True
+
+    def _makeRoom(self):
+        # called with the lock held and the buffer full. returns True if there's room
+        # without losing anything, False if an old sample was dropped, None to drop this one
+        if self.policy == BLOCK and threading.get_ident() != self._loop_thread:
+            if self._space.wait_for(lambda: len(self._items) < self.capacity or self._closed,
+                                    timeout=self.block_timeout):
+                if not self._closed:
+                    return True
+        self.overflow += 1
+        _overflow_metric.inc()
+        if self.policy == DROP_OLDEST:
+            self._items.popleft()
+            return False
+        # drop-newest, or block that couldn't wait
+        return None
+
+    def _wake(self):
+        if threading.get_ident() == self._loop_thread:
+            self._ready.set()
+        else:
+            try:
+                self.loop.call_soon_threadsafe(self._ready.set)
+            except RuntimeError:
+                pass  # loop already closed
+
+    async def getBatch(self, timeout=None):
+        """Everything queued so far as a list (empty on timeout or once closed and drained)."""
+        if not self._items and not self._closed:
+            try:
+                await asyncio.wait_for(self._ready.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+        with self._lock:
+            batch = list(self._items)
+            self._items.clear()
+            self._ready.clear()
+            self._wake_pending = False
+            self._space.notify_all()
+        return batch
+
+    def close(self):
+        with self._lock:
+            self._closed = True
+            self._space.notify_all()
+        self._wake()
+
+    @property
+    def closed(self):
+        return self._closed
@@ -0,0 +1,185 @@
+# optional sample-to-pixel latency tracing
+#
+# every sample is timestamped (time.perf_counter_ns) at each stage of the hot path, keyed by
+# the firmware sequence number. turn it on with BKFB_TRACE=1 (the BLE worker inherits it) or
+# setEnabled(True). perf_counter is a system-wide monotonic clock on linux/macOS/windows, so
+# the worker's timestamps can be compared with the app's.
+
+import json
+import os
+import time
+from collections import OrderedDict, deque
+
+# in pipeline order
+STAGES = (
+    "notify",   # BLE notification handed to python
+    "decode",   # payload decoded and parsed into a sample
+    "pipe",     # sample reached the app (worker JSON pipe / in-process queue)
+    "filter",   # lowPassFilterSample done
+    "render",   # livePlot image encoded
+    "image",    # toga.Image created in the app
+)
+_STAGE_ORDER = {stage: i for i, stage in enumerate(STAGES)}
+
+# histogram bucket upper bounds in microseconds (last bucket is everything above)
+BUCKET_BOUNDS_US = (50, 100, 250, 500, 1000, 2500, 5000, 10000, 25000, 50000, 100000, 250000, 500000, 1000000)
+
+MAX_PENDING = 4096      # samples still travelling through the pipeline
+MAX_COMPLETED = 5000    # finished traces kept for chrome export
+
+enabled = os.environ.get("BKFB_TRACE", "").lower() in ("1", "true", "yes")
+
+_pending = OrderedDict()  # seq -> {stage: ns}
+_completed = deque(maxlen=MAX_COMPLETED)
+
+
+def _emptyHistograms():
+    names = STAGES[1:] + ("total",)
+    return {name: [0] * (len(BUCKET_BOUNDS_US) + 1) for name in names}
+
+
+_histograms = _emptyHistograms()
+
+
+def setEnabled(flag):
+    global enabled
+    enabled = bool(flag)
+    if not enabled:
+        reset()
+
+
+def reset():
+    global _histograms
+    _pending.clear()
+    _completed.clear()
+    _histograms = _emptyHistograms()
+
+
+def dropPending():
+    """Forget samples still in flight (the sensor numbers samples from 1 again after the link drops)."""
+    _pending.clear()
+
+
+def now():
+    return time.perf_counter_ns()
+
+
+def _bucket(latency_ns):
+    latency_us = latency_ns / 1000.0
+    for i, bound in enumerate(BUCKET_BOUNDS_US):
+        if latency_us <= bound:
+            return i
+    return len(BUCKET_BOUNDS_US)
+
+
+def mark(seq, stage, t_ns=None):
+    """Timestamp one sample at one stage."""
+    if not enabled or seq is None:
+        return
+
+    stamps = _pending.get(seq)
+    if stamps is None:
+        stamps = {}
+        _pending[seq] = stamps
+        if len(_pending) > MAX_PENDING:
+            _pending.popitem(last=False)
+    stamps[stage] = now() if t_ns is None else int(t_ns)
+
+    if stage == STAGES[-1]:
+        _finish(seq)
+
+
+def markStamps(seq, stamps):
+    """Merge timestamps taken elsewhere (e.g. in the BLE worker process)."""
+    if not enabled or seq is None or not stamps:
+        return
+    for stage, t_ns in stamps.items():
+        if stage in _STAGE_ORDER:
+            mark(seq, stage, t_ns)
+
+
+def markFrame(stage, t_ns=None):
+    """Timestamp every sample that's waiting for this stage.
+
+    Rendering coalesces samples, so one frame finishes every sample that has reached the
+    stage before it.
+    """
+    if not enabled or not _pending:
+        return
+
+    t_ns = now() if t_ns is None else t_ns
+    order = _STAGE_ORDER[stage]
+    waiting = [
+        seq for seq, stamps in _pending.items()
+        if stage not in stamps and STAGES[order - 1] in stamps
+    ]
+    for seq in waiting:
+        mark(seq, stage, t_ns)
+
+
+def _finish(seq):
+    stamps = _pending.pop(seq, None)
+    if not stamps:
+        return
+
+    ordered = [(stage, stamps[stage]) for stage in STAGES if stage in stamps]
+    for (_prev_stage, prev_ns), (stage, t_ns) in zip(ordered, ordered[1:]):
+        _histograms[stage][_bucket(max(0, t_ns - prev_ns))] += 1
+    if len(ordered) > 1:
+        _histograms["total"][_bucket(max(0, ordered[-1][1] - ordered[0][1]))] += 1
+
+    _completed.append((seq, ordered))
+
+
+def _percentile(counts, fraction):
+    total = sum(counts)
+    if total == 0:
+        return None
+    target = fraction * total
+    running = 0
+    for i, count in enumerate(counts):
+        running += count
+        if running >= target:
+            return BUCKET_BOUNDS_US[i] if i < len(BUCKET_BOUNDS_US) else float("inf")
+    return float("inf")
+
+
+def summary():
+    """Per-stage latency histograms (time since the previous stage) with rough percentiles."""
+    result = {"bucket_bounds_us": list(BUCKET_BOUNDS_US), "stages": {}}
+    for name, counts in _histograms.items():
+        result["stages"][name] = {
+            "count": sum(counts),
+            "counts": list(counts),
+            "p50_us": _percentile(counts, 0.5),
+            "p95_us": _percentile(counts, 0.95),
+        }
+    return result
+
+
+def chromeTrace():
+    """Completed traces as Chrome trace-event JSON (load in chrome://tracing or Perfetto)."""
+    events = []
+    for seq, ordered in _completed:
+        for (prev_stage, prev_ns), (stage, t_ns) in zip(ordered, ordered[1:]):
+            events.append({
+                "name": stage,
+                "cat": "sample",
+                "ph": "X",
+                "ts": prev_ns / 1000.0,
+                "dur": max(0, t_ns - prev_ns) / 1000.0,
+                "pid": 1,
+                "tid": _STAGE_ORDER[stage],
+                "args": {"seq": seq, "from": prev_stage},
+            })
+    thread_names = [
+        {"name": "thread_name", "ph": "M", "pid": 1, "tid": _STAGE_ORDER[stage], "args": {"name": stage}}
+        for stage in STAGES[1:]
+    ]
+    return {"traceEvents": thread_names + events, "displayTimeUnit": "ms"}
+
+
+def exportChromeTrace(path):
+    with open(path, "w") as f:
+        json.dump(chromeTrace(), f)
+    return path
@@ -0,0 +1,185 @@
+# lightweight pipeline metrics (counters, gauges, fixed-bucket histograms)
+#
+# updates are a single flag check while collection is off, so the hot path can call these
+# unconditionally. turn on with BKFB_METRICS=1 or setEnabled(True) (the diagnostics page does).
+
+import json
+import os
+import time
+from bisect import bisect_left
+
+enabled = os.environ.get("BKFB_METRICS", "").lower() in ("1", "true", "yes")
+
+# default histogram buckets, in milliseconds
+DEFAULT_BOUNDS_MS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000)
+
+_counters = {}
+_gauges = {}
+_histograms = {}
+_last_snapshot_time = None
+
+
+class Counter:
+    def __init__(self, name):
+        self.name = name
+        self.value = 0
+        self._last_value = 0
+
+    def inc(self, amount=1):
+        if enabled:
+            self.value += amount
+
+
+class Gauge:
+    def __init__(self, name):
+        self.name = name
+        self.value = None
+
+    def set(self, value):
+        if enabled:
+            self.value = value
+
+
+class Histogram:
+    def __init__(self, name, bounds=DEFAULT_BOUNDS_MS):
+        self.name = name
+        self.bounds = tuple(bounds)
+        self.counts = [0] * (len(self.bounds) + 1)
+        self.total = 0.0
+        self.count = 0
+        self.max = None
+
+    def observe(self, value):
+        if not enabled:
+            return
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.total += value
+        self.count += 1
+        if self.max is None or value > self.max:
+            self.max = value
+
+    def snapshot(self):
+        return {
+            "bounds": list(self.bounds),
+            "counts": list(self.counts),
+            "count": self.count,
+            "mean": self.total / self.count if self.count else None,
+            "max": self.max,
+        }
+
+
+class Timer:
+    """Context manager that observes elapsed milliseconds into a histogram."""
+
+    def __init__(self, histogram):
+        self.histogram = histogram
+        self.start = None
+
+    def __enter__(self):
+        if enabled:
+            self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if self.start is not None:
+            self.histogram.observe((time.perf_counter() - self.start) * 1000.0)
+            self.start = None
+        return False
+
+
+def counter(name):
+    metric = _counters.get(name)
+    if metric is None:
+        metric = _counters[name] = Counter(name)
+    return metric
+
+
+def gauge(name):
+    metric = _gauges.get(name)
+    if metric is None:
+        metric = _gauges[name] = Gauge(name)
+    return metric
+
+
+def histogram(name, bounds=DEFAULT_BOUNDS_MS):
+    metric = _histograms.get(name)
+    if metric is None:
+        metric = _histograms[name] = Histogram(name, bounds)
+    return metric
+
+
+def timer(name, bounds=DEFAULT_BOUNDS_MS):
+    return Timer(histogram(name, bounds))
+
+
+def setEnabled(flag):
+    global enabled
+    enabled = bool(flag)
+
+
+def reset():
+    global _last_snapshot_time
+    for metric in _counters.values():
+        metric.value = 0
+        metric._last_value = 0
+    for metric in _gauges.values():
+        metric.value = None
+    for metric in _histograms.values():
+        metric.counts = [0] * (len(metric.bounds) + 1)
+        metric.total = 0.0
+        metric.count = 0
+        metric.max = None
+    _last_snapshot_time = None
+
+
+def snapshot():
+    """Current values of every metric. Counters also report their rate since the last snapshot."""
+    global _last_snapshot_time
+    now = time.monotonic()
+    elapsed = None if _last_snapshot_time is None else now - _last_snapshot_time
+    _last_snapshot_time = now
+
+    counters = {}
+    for name, metric in sorted(_counters.items()):
+        rate = None
+        if elapsed:
+            rate = (metric.value - metric._last_value) / elapsed
+        metric._last_value = metric.value
+        counters[name] = {"value": metric.value, "per_second": rate}
+
+    return {
+        "enabled": enabled,
+        "time": time.time(),
+        "counters": counters,
+        "gauges": {name: metric.value for name, metric in sorted(_gauges.items())},
+        "histograms": {name: metric.snapshot() for name, metric in sorted(_histograms.items())},
+    }
+
+
+def formatSnapshot(snap):
+    """Plain-text version of a snapshot for the diagnostics page."""
+    lines = []
+    for name, info in snap["counters"].items():
+        rate = info["per_second"]
+        rate_text = f"  ({rate:.1f}/s)" if rate is not None else ""
+        lines.append(f"{name}: {info['value']}{rate_text}")
+    for name, value in snap["gauges"].items():
+        if isinstance(value, float):
+            value = f"{value:.2f}"
+        lines.append(f"{name}: {value}")
+    for name, info in snap["histograms"].items():
+        if info["count"]:
+            lines.append(f"{name}: n={info['count']} mean={info['mean']:.2f} max={info['max']:.2f}")
+        else:
+            lines.append(f"{name}: n=0")
+    return "\n".join(lines)
+
+
+def dumpJson(path, extra=None):
+    """Write a snapshot (plus any extra sections) to a JSON file for field reports."""
+    data = snapshot()
+    if extra:
+        data.update(extra)
+    with open(path, "w") as f:
+        json.dump(data, f, indent=2)
+    return path
@@ -0,0 +1,206 @@
+# multi-resolution min/max/mean pyramid for recorded sessions
+#
+# level k summarises 2**k samples per row (level 0 is the raw data). every level lives in
+# one .npy next to the session CSV, opened memory-mapped, so zooming/scrubbing reads only the
+# rows on screen from the coarsest level that still has enough detail - constant work no
+# matter how long the session is.
+
+import json
+import os
+
+import numpy as np
+
+STAT_MIN = 0
+STAT_MAX = 1
+STAT_MEAN = 2
+
+PYRAMID_SUFFIX = ".pyramid.npy"
+META_SUFFIX = ".pyramid.json"
+FORMAT_VERSION = 1
+# narrowest view zooming in stops at, in samples
+MIN_VIEW_SPAN = 20
+
+
+def pyramidPaths(session_path):
+    """(data, metadata) paths stored alongside a session CSV."""
+    base, _ext = os.path.splitext(session_path)
+    return base + PYRAMID_SUFFIX, base + META_SUFFIX
+
+
+def levelRows(total, level):
+    return -(-total // (1 << level))  # ceil
+
+
+def levelOffsets(total):
+    """Row offset of every level in the stacked array, plus the total row count."""
+    offsets = []
+    rows = 0
+    level = 0
+    while True:
+        offsets.append(rows)
+        count = levelRows(total, level)
+        rows += count
+        if count <= 1:
+            break
+        level += 1
+    return offsets, rows
+
+
+def buildLevels(values):
+    """Stack every level of an (N, channels) array into one (rows, 3, channels) float32 array."""
+    values = np.asarray(values, dtype=np.float64)
+    if values.ndim == 1:
+        values = values[:, None]
+    total, channels = values.shape
+    offsets, rows = levelOffsets(max(total, 1))
+    stacked = np.empty((rows, 3, channels), dtype=np.float32)
+    if total == 0:
+        stacked[:] = np.nan
+        return stacked, offsets
+
+    mins = maxs = values
+    sums = values
+    counts = np.ones(total)
+    for level, offset in enumerate(offsets):
+        n = len(mins)
+        stacked[offset:offset + n, STAT_MIN] = mins
+        stacked[offset:offset + n, STAT_MAX] = maxs
+        stacked[offset:offset + n, STAT_MEAN] = sums / counts[:, None]
+        if level == len(offsets) - 1:
+            break
+        # pair rows up (an odd last row carries over on its own)
+        if n % 2:
+            mins = np.vstack([mins, mins[-1:]])
+            maxs = np.vstack([maxs, maxs[-1:]])
+            sums = np.vstack([sums, np.zeros((1, channels))])
+            counts = np.append(counts, 0)
+        mins = np.minimum(mins[0::2], mins[1::2])
+        maxs = np.maximum(maxs[0::2], maxs[1::2])
+        sums = sums[0::2] + sums[1::2]
+        counts = counts[0::2] + counts[1::2]
+    return stacked, offsets
+
+
+class SessionPyramid:
+    def __init__(self, data, total, channels=("x", "y", "z")):
+        self.data = data
+        self.total = total
+        self.channels = tuple(channels)
+        self.offsets, _rows = levelOffsets(max(total, 1))
+
+    @classmethod
+    def fromValues(cls, values, channels=("x", "y", "z")):
+        data, _offsets = buildLevels(values)
+        return cls(data, len(values), channels)
+
+    @classmethod
+    def load(cls, session_path):
+        """Open a saved pyramid memory-mapped; only the rows that get read are paged in."""
+        data_path, meta_path = pyramidPaths(session_path)
+        with open(meta_path, "r") as f:
+            meta = json.load(f)
+        if meta.get("version") != FORMAT_VERSION:
+            raise ValueError(f"Unsupported pyramid version: {meta.get('version')}")
+        data = np.load(data_path, mmap_mode="r")
+        return cls(data, meta["total"], meta["channels"])
+
+    def save(self, session_path):
+        data_path, meta_path = pyramidPaths(session_path)
+        np.save(data_path, np.asarray(self.data))
+        with open(meta_path, "w") as f:
+            json.dump({"version": FORMAT_VERSION, "total": self.total, "channels": list(self.channels)}, f)
+        return data_path
+
+    @property
+    def levels(self):
+        return len(self.offsets)
+
+    def levelFor(self, start, end, max_points):
+        """Coarsest level that still gives at least max_points rows across [start, end)."""
+        span = max(1, end - start)
+        level = 0
+        while level + 1 < self.levels and span >> (level + 1) >= max_points:
+            level += 1
+        return level
+
+    def rows(self, level, start, end):
+        """(first sample index of each row, rows) for samples [start, end) at one level."""
+        start = max(0, start)
+        end = min(self.total, end)
+        first = start >> level
+        last = levelRows(end, level) if end > 0 else 0
+        offset = self.offsets[level]
+        tile = np.asarray(self.data[offset + first:offset + max(first, last)])
+        return np.arange(first, first + len(tile)) << level, tile
+
+    def window(self, start, end, max_points=400):
+        """Summary of samples [start, end) with roughly max_points rows, read from one level."""
+        level = self.levelFor(start, end, max_points)
+        starts, tile = self.rows(level, start, end)
+        return level, starts, tile
+
+    def clampView(self, start, span):
+        """(start, end) of a view span samples wide, moved back inside the session if needed."""
+        span = int(min(max(span, MIN_VIEW_SPAN), max(self.total, 1)))
+        start = int(min(max(start, 0), max(self.total - span, 0)))
+        return start, start + span
+
+    def zoom(self, start, end, factor):
+        """View [start, end) scaled by factor about its centre (below 1 zooms in)."""
+        span = max((end - start) * factor, MIN_VIEW_SPAN)
+        return self.clampView(round((start + end - span) / 2), round(span))
+
+    def pan(self, start, end, fraction):
+        """View [start, end) moved by fraction of its width (negative pans back)."""
+        return self.clampView(start + round((end - start) * fraction), end - start)
+
+    def scrub(self, start, end, position):
+        """View as wide as [start, end) centred at position (0..1) through the session."""
+        span = end - start
+        return self.clampView(round(position * self.total - span / 2), span)
+
+    def frame(self, start, end, max_points=400):
+        """Zoomed view in the same shape as bkfb.liveFrame, ready for canvasPlot.drawLivePlot."""
+        level, starts, tile = self.window(start, end, max_points)
+        if level == 0:
+            xs = starts.astype(float)
+            ys = tile[:, STAT_MEAN]
+        else:
+            # zig-zag through each bucket's min and max so spikes stay visible
+            size = 1 << level
+            xs = np.empty(2 * len(starts))
+            xs[0::2] = starts
+            xs[1::2] = np.minimum(starts + size, self.total) - 1
+            ys = np.empty((2 * len(starts), len(self.channels)), dtype=np.float32)
+            ys[0::2] = tile[:, STAT_MIN]
+            ys[1::2] = tile[:, STAT_MAX]
+
+        if len(ys):
+            y_min, y_max = float(np.nanmin(ys)) - 0.5, float(np.nanmax(ys)) + 0.5
+        else:
+            y_min, y_max = -1.0, 1.0
+        return {
+            "start": max(0, start),
+            "end": min(self.total, end),
+            "xs": xs.tolist(),
+            "series": {coord: ys[:, i].tolist() for i, coord in enumerate(self.channels)},
+            "ymin": y_min,
+            "ymax": y_max,
+        }
+
+
+def loadOrBuild(session_path, values_loader):
+    """Open the pyramid for a session, building and saving it first if it's missing or stale."""
+    data_path, meta_path = pyramidPaths(session_path)
+    try:
+        fresh = os.path.getmtime(meta_path) >= os.path.getmtime(session_path)
+    except OSError:
+        fresh = False
+    if fresh:
+        try:
+            return SessionPyramid.load(session_path)
+        except Exception as e:
+            print(f"Error loading session pyramid, rebuilding: {e}")
+    pyramid = SessionPyramid.fromValues(values_loader(session_path))
+    pyramid.save(session_path)
+    return pyramid
@@ -0,0 +1,136 @@
+# sequence-number timebase
+#
+# the firmware numbers every sample, so sample times come from the sequence number instead
+# of the order samples happened to arrive in. dropped packets show up as jumps in seq,
+# duplicates as repeats, and a dropped link as seq starting over (the firmware goes back
+# to 1 when the link drops).
+
+from collections import namedtuple
+
+import numpy as np
+
+SEQ_NEXT = 'next'
+SEQ_GAP = 'gap'
+SEQ_DUPLICATE = 'duplicate'
+SEQ_RESTART = 'restart'
+
+# a seq this far behind the last one is a firmware restart, not a late duplicate
+REORDER_WINDOW = 16
+# gaps up to this many missing samples are filled by interpolation; longer ones are left
+# as a jump in time rather than inventing data
+MAX_INTERPOLATED_GAP = 5
+
+Timebase = namedtuple('Timebase', [
+    'times',         # seconds from the first sample, (M,)
+    'values',        # (M, channels) on the uniform grid
+    'seqs',          # unwrapped sequence number of each row (restarts continue on)
+    'dropped',       # samples missing from the stream
+    'duplicates',    # repeated samples that were discarded
+    'interpolated',  # rows filled in over short gaps
+    'long_gaps',     # gaps left unfilled
+    'restarts',      # times the firmware sequence started over
+])
+
+
+def classify(prev_seq, seq):
+    """How seq follows prev_seq: next, gap, duplicate or restart."""
+    if prev_seq is None or seq == prev_seq + 1:
+        return SEQ_NEXT
+    if seq > prev_seq:
+        return SEQ_GAP
+    if prev_seq - seq < REORDER_WINDOW and seq > 1:
+        return SEQ_DUPLICATE
+    return SEQ_RESTART
+
+
+def unwrapSequence(seqs):
+    """Sequence numbers made continuous across firmware restarts.
+
+    Returns (unwrapped, restarts). After a restart the count carries on right after the
+    previous run, since how long the reconnect took isn't known.
+    """
+    seqs = np.asarray(seqs, dtype=np.int64)
+    if len(seqs) == 0:
+        return seqs.copy(), 0
+
+    # most samples just count up, so only look at the places where they don't
+    boundaries = np.zeros(len(seqs), dtype=np.int64)
+    restarts = 0
+    highest = seqs[0]
+    for i in np.flatnonzero(np.diff(seqs) != 1) + 1:
+        highest = max(highest, seqs[i - 1])
+        if classify(highest, seqs[i]) == SEQ_RESTART:
+            boundaries[i] = highest - seqs[i] + 1
+            highest = seqs[i]
+            restarts += 1
+    return seqs + np.cumsum(boundaries), restarts
+
+
+def uniformGrid(seqs, values, sample_rate_hz, max_gap=MAX_INTERPOLATED_GAP):
+    """Put samples on a uniform time grid keyed by sequence number.
+
+    Duplicates are dropped, out-of-order samples sorted, gaps of up to max_gap samples
+    linearly interpolated (all channels at once) and longer gaps kept as a jump in time.
+    """
+    values = np.asarray(values, dtype=float)
+    values = values.reshape(len(values), -1)
+    n, channels = values.shape
+    if n == 0:
+        empty = np.empty(0)
+        return Timebase(empty, np.empty((0, channels)), empty.astype(np.int64), 0, 0, 0, 0, 0)
+
+    unwrapped, restarts = unwrapSequence(seqs)
+    order = np.argsort(unwrapped, kind='stable')
+    unwrapped = unwrapped[order]
+    values = values[order]
+
+    keep = np.ones(n, dtype=bool)
+    keep[1:] = np.diff(unwrapped) != 0
+    duplicates = int(n - np.count_nonzero(keep))
+    unwrapped = unwrapped[keep]
+    values = values[keep]
+
+    missing = np.diff(unwrapped) - 1
+    dropped = int(missing.sum())
+    long_starts = np.flatnonzero(missing > max_gap)
+
+    first = unwrapped[0]
+    grid = np.arange(first, unwrapped[-1] + 1)
+    if len(long_starts):
+        inside = np.zeros(len(grid), dtype=bool)
+        for i in long_starts:
+            inside[unwrapped[i] - first + 1:unwrapped[i + 1] - first] = True
+        grid = grid[~inside]
+
+    resampled = np.empty((len(grid), channels))
+    for c in range(channels):
+        resampled[:, c] = np.interp(grid, unwrapped, values[:, c])
+
+    times = (grid - first) / float(sample_rate_hz)
+    return Timebase(
+        times, resampled, grid, dropped, duplicates,
+        int(len(grid) - len(unwrapped)), int(len(long_starts)), restarts,
+    )
+
+
+def joinGrids(grids):
+    """One Timebase from (Timebase, sample_rate_hz) stretches recorded one after another.
+
+    Each stretch starts one of its own sample periods after the previous one ends, and the
+    counts are added up.
+    """
+    if not grids:
+        return uniformGrid([], np.empty((0, 3)), 1.0)
+    times = []
+    end = None
+    for grid, rate in grids:
+        offset = 0.0 if end is None else end + 1.0 / float(rate)
+        times.append(grid.times + offset)
+        if len(grid.times):
+            end = times[-1][-1]
+    return Timebase(
+        np.concatenate(times),
+        np.concatenate([grid.values for grid, _rate in grids]),
+        np.concatenate([grid.seqs for grid, _rate in grids]),
+        *(sum(grid[i] for grid, _rate in grids) for i in range(3, len(Timebase._fields))),
+    )
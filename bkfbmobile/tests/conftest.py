@@ -0,0 +1,65 @@
+import math
+
+import pytest
+
+from bkfbmobile import bkfb
+from bkfbmobile.AU.strokeIndex import StrokeIndex
+
+# bkfb settings tests change through its setters; each one is put back after the test
+RESTORED_SETTINGS = (
+    "active_page",
+    "live_render_mode",
+    "live_view_mode",
+    "stroke_axis",
+    "stroke_direction",
+    "stroke_detector",
+    "stroke_alignment",
+    "refine_stroke_boundaries",
+    "show_stroke_clusters",
+    "reference_stroke",
+    "stroke_index",
+    "stroke_index_path",
+)
+
+
+class SyntheticSession:
+    """Stroke-like samples on the y axis, one stroke every `period` samples, fed through appendSample."""
+
+    period = 40
+
+    def __init__(self):
+        self.samples = 0
+
+    def add(self, count, after_each=None):
+        """Feed count more samples, carrying on from the last one; after_each runs after every sample."""
+        for _ in range(count):
+            value = 15.0 * math.sin(2 * math.pi * self.samples / self.period)
+            self.samples += 1
+            bkfb.appendSample(self.samples, 0.0, value, 0.0)
+            if after_each is not None:
+                after_each()
+        return self
+
+    def restart(self):
+        """Start the session over (bkfb.reset), keeping the settings."""
+        bkfb.reset()
+        self.samples = 0
+        return self
+
+    def strokes(self):
+        return bkfb.strokeAnalysis(bkfb.data_points).strokes
+
+    def indexStrokes(self):
+        """Give bkfb an empty in-memory stroke index for this test."""
+        bkfb.stroke_index = StrokeIndex()
+        return bkfb.stroke_index
+
+
+@pytest.fixture
+def synthetic_session(monkeypatch):
+    """A fresh bkfb session to feed synthetic strokes into; bkfb is reset and its settings restored afterwards."""
+    for name in RESTORED_SETTINGS:
+        monkeypatch.setattr(bkfb, name, getattr(bkfb, name))
+    bkfb.reset()
+    yield SyntheticSession()
+    bkfb.reset()
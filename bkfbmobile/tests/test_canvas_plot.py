@@ -0,0 +1,53 @@
+from bkfbmobile import bkfb, canvasPlot
+
+
+def test_nice_ticks():
+    """Ticks land on round 1/2/5 steps inside the range."""
+    assert canvasPlot.niceTicks(0, 10) == [0, 2, 4, 6, 8, 10]
+    assert canvasPlot.niceTicks(-3.2, 7.9) == [0, 5]
+    assert canvasPlot.niceTicks(0.01, 0.26) == [0.05, 0.1, 0.15, 0.2, 0.25]
+    assert canvasPlot.niceTicks(100, 600) == [100, 200, 300, 400, 500, 600]
+    # nothing to spread ticks over
+    assert canvasPlot.niceTicks(3.0, 3.0) == [3.0]
+    assert canvasPlot.niceTicks(0.0, float("inf")) == [0.0]
+
+
+def test_tick_labels_follow_the_step():
+    """Labels get as many decimals as the tick step needs, so neighbours never read the same."""
+    def labels(lo, hi):
+        ticks = canvasPlot.niceTicks(lo, hi)
+        decimals = canvasPlot.tickDecimals(ticks)
+        return [canvasPlot.formatTick(tick, decimals) for tick in ticks]
+
+    assert labels(0.01, 0.26) == ["0.05", "0.10", "0.15", "0.20", "0.25"]
+    assert labels(-1.0, 1.0) == ["-1.0", "-0.5", "0.0", "0.5", "1.0"]
+    assert labels(0, 10) == ["0", "2", "4", "6", "8", "10"]
+    assert labels(100, 600) == ["100", "200", "300", "400", "500", "600"]
+    assert labels(3.0, 3.0) == ["3"]
+
+
+def test_live_frame_is_the_visible_window():
+    """liveFrame holds the last window_size samples per axis, with a little headroom on y."""
+    bkfb.reset()
+    try:
+        for i in range(bkfb.window_size + 30):
+            bkfb.data_points['x'].append(float(i % 3))
+            bkfb.data_points['y'].append(-4.0)
+            bkfb.data_points['z'].append(9.0)
+        frame = bkfb.liveFrame(bkfb.data_points)
+        assert frame['start'] == 30 and frame['end'] == bkfb.window_size + 30
+        assert set(frame['series']) == {'x', 'y', 'z'}
+        assert all(len(values) == bkfb.window_size for values in frame['series'].values())
+        assert frame['series']['x'][0] == 0.0
+        assert (frame['ymin'], frame['ymax']) == (-4.5, 9.5)
+        assert 'stroke_rate' in frame and 'xs' not in frame
+    finally:
+        bkfb.reset()
+
+
+def test_live_frame_without_data():
+    """An empty session still gives the canvas a sane y range and no lines."""
+    bkfb.reset()
+    frame = bkfb.liveFrame(bkfb.data_points)
+    assert frame['series'] == {}
+    assert (frame['ymin'], frame['ymax']) == (-1.0, 1.0)
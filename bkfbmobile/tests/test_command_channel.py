@@ -0,0 +1,115 @@
+import asyncio
+
+import pytest
+
+from bkfbmobile import bkfb
+from bkfbmobile.Networking import ble_runtime
+from bkfbmobile.Networking.simulated_sensor import SimulatedSensor
+
+
+class QuietClient:
+    """Takes commands and never answers; the test plays the sensor."""
+
+    def __init__(self):
+        self.written = []
+
+    async def write_gatt_char(self, _char, data, response=False):
+        self.written.append(bytes(data).decode("utf-8"))
+
+
+def test_replies_reach_their_own_request_in_any_order():
+    """Several commands in flight; tagged replies resolve the right one even out of order."""
+    async def session():
+        client = QuietClient()
+        channel = ble_runtime.CommandChannel(client)
+        first = asyncio.create_task(channel.request("STATUS"))
+        second = asyncio.create_task(channel.request("RATE 50 3"))
+        while len(client.written) < 2:
+            await asyncio.sleep(0)
+        tags = [ble_runtime.split_tag(text)[0] for text in client.written]
+        assert len(set(tags)) == 2 and len(channel) == 2
+
+        # samples pass straight through, untouched
+        assert channel.handle("12 x 0.1 y 0.2 z 0.3") == (None, "12 x 0.1 y 0.2 z 0.3")
+        channel.handle(f"#{tags[1]} ACK RATE 50 3")
+        channel.handle(f"#{tags[0]} STATUS rate 50 batch 3")
+        assert await first == "STATUS rate 50 batch 3"
+        assert await second == "ACK RATE 50 3"
+        assert len(channel) == 0
+
+    asyncio.run(session())
+
+
+def test_unanswered_command_times_out():
+    """No reply means CommandTimeout after the timeout, and the tag is freed."""
+    async def session():
+        channel = ble_runtime.CommandChannel(QuietClient())
+        with pytest.raises(ble_runtime.CommandTimeout):
+            await channel.request("STATUS", timeout=0.05)
+        assert len(channel) == 0
+
+    asyncio.run(session())
+
+
+def test_simulated_sensor_answers_tagged_commands():
+    """The simulated sensor echoes tags, so status, rate and download can all wait together."""
+    async def session():
+        sensor = SimulatedSensor("simulated")
+        channel = ble_runtime.CommandChannel(sensor)
+
+        def on_rx(_sender, data):
+            text = bytes(data).decode("utf-8")
+            if text.startswith(ble_runtime.TAG_PREFIX):
+                channel.handle(text)
+
+        await sensor.start_notify(ble_runtime.UART_TX, on_rx)
+        try:
+            status, ack, done = await asyncio.gather(
+                channel.request(ble_runtime.STATUS_COMMAND),
+                channel.request(ble_runtime.rate_command(50, 3)),
+                channel.request(ble_runtime.DOWNLOAD_COMMAND),
+            )
+        finally:
+            await sensor.disconnect()
+        assert ble_runtime.parse_status(status)["rate"] == 20
+        assert ble_runtime.parse_rate_ack(ack) == (50.0, 3)
+        assert ble_runtime.parse_download_done(done) == 0
+
+    asyncio.run(session())
+
+
+def test_in_process_download_keeps_the_recorded_samples(monkeypatch):
+    """On the in-process (mobile) path '[OLD]' lines reach recorded_samples before the DONE reply."""
+    # seqs well past anything the live stream reaches during the test
+    recorded = [(90001, 0.5, 1.5, 9.8), (90002, 0.25, -1.0, 9.7)]
+
+    class RecordingSensor(SimulatedSensor):
+        def __init__(self, *args, **kwargs):
+            super().__init__(*args, **kwargs)
+            self.recorded = list(recorded)
+
+    monkeypatch.setenv("BKFB_SIMULATED_SENSOR", "1")
+    monkeypatch.setattr(ble_runtime, "_get_bleak_client_class", lambda: RecordingSensor)
+    monkeypatch.setattr(bkfb, "ESP32_ADDR", "simulated")
+    monkeypatch.setattr(bkfb, "isMobilePlatform", lambda: True)
+
+    async def on_update(*_images):
+        pass
+
+    async def session():
+        stop = asyncio.Event()
+        task = asyncio.create_task(bkfb.connectLiveInApp(on_update, stop))
+        try:
+            while bkfb.point_count < 3 and not task.done():
+                await asyncio.sleep(0.02)
+            return await bkfb.requestDownload()
+        finally:
+            stop.set()
+            await asyncio.wait_for(task, 5)
+
+    try:
+        assert asyncio.run(asyncio.wait_for(session(), 10)) == recorded
+        # and they don't end up in the live data
+        assert 90001 not in bkfb.sample_seqs
+    finally:
+        bkfb.reset()
@@ -0,0 +1,34 @@
+import numpy as np
+
+from bkfbmobile.decimate import MinMaxDecimator
+
+
+def test_append_and_extend_agree():
+    """Per-sample and batched updates build the same buckets."""
+    rng = np.random.default_rng(1)
+    values = rng.standard_normal((5000, 3))
+
+    one_by_one = MinMaxDecimator(max_buckets=64)
+    for row in values:
+        one_by_one.append(tuple(row))
+    batched = MinMaxDecimator(max_buckets=64)
+    batched.extend(values[:1234])
+    batched.extend(values[1234:])
+
+    for a, b in zip(one_by_one.buckets(), batched.buckets()):
+        np.testing.assert_allclose(a, b)
+    assert batched.total == 5000
+
+
+def test_spikes_survive_decimation():
+    """A single-sample spike is still the envelope maximum after many merges."""
+    values = np.zeros((100000, 3))
+    values[77777, 1] = 42.0
+    decimator = MinMaxDecimator(max_buckets=100)
+    decimator.extend(values)
+
+    xs, ys = decimator.envelope()
+    assert len(xs) <= 2 * 100
+    assert ys[:, 1].max() == 42.0
+    spike_x = xs[np.argmax(ys[:, 1])]
+    assert abs(spike_x - 77777) <= decimator.bucket_size
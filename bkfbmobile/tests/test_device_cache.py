@@ -0,0 +1,62 @@
+import asyncio
+from types import SimpleNamespace
+
+from bkfbmobile.Networking import ble_runtime, device_cache
+
+
+def test_remember_device_merges_metadata(tmp_path):
+    """Later connects add to the record instead of replacing it."""
+    path = str(tmp_path / "devices.json")
+    device_cache.remember_device("aa:bb:cc:dd:ee:ff", name="BKFB AU", rssi=-60, path=path)
+    device_cache.remember_device("AA:BB:CC:DD:EE:FF", mtu=247, handles={"6e400003": 14}, path=path)
+
+    record = device_cache.get_device("aa:bb:cc:dd:ee:ff", path=path)
+    assert record["name"] == "BKFB AU"
+    assert record["rssi"] == -60
+    assert record["mtu"] == 247
+    assert record["handles"] == {"6E400003": 14}
+    assert device_cache.is_known("AA:BB:CC:DD:EE:FF", path=path)
+
+
+def test_remember_scan_orders_by_last_seen(tmp_path, monkeypatch):
+    """Scanned devices are listed most recent first."""
+    now = [1000.0]
+    monkeypatch.setattr(device_cache, "time", SimpleNamespace(time=lambda: now[0]))
+    path = str(tmp_path / "devices.json")
+    device_cache.remember_device("11:11:11:11:11:11", name="Old", path=path)
+    now[0] += 60.0
+    device = SimpleNamespace(address="22:22:22:22:22:22", name="New")
+    device_cache.remember_scan([(device, SimpleNamespace(rssi=-40))], path=path)
+
+    devices = device_cache.known_devices(path=path)
+    assert [d["name"] for d in devices] == ["New", "Old"]
+    assert devices[0]["rssi"] == -40
+    assert not device_cache.is_known("22:22:22:22:22:22", path=path)
+
+
+def test_worker_resolves_the_sensor_once(monkeypatch):
+    """A process without the app's scan results looks the sensor up once, later connects reuse it."""
+    lookups = []
+    device = SimpleNamespace(address="33:33:33:33:33:33", name="BKFB AU")
+
+    class Scanner:
+        @staticmethod
+        async def find_device_by_address(address, timeout):
+            lookups.append(address)
+            return device
+
+    monkeypatch.delenv("BKFB_SIMULATED_SENSOR", raising=False)
+    monkeypatch.setattr(ble_runtime, "_is_android", lambda: False)
+    monkeypatch.setattr(ble_runtime, "_get_bleak_scanner_class", lambda: Scanner)
+    monkeypatch.setattr(device_cache, "save_devices", lambda devices, path=None: None)
+    try:
+        for _ in range(2):
+            asyncio.run(ble_runtime.resolve_device("33:33:33:33:33:33"))
+            assert ble_runtime.client_args("33:33:33:33:33:33")[0] is device
+        assert lookups == ["33:33:33:33:33:33"]
+
+        # a failed connect forgets it, so a stale device isn't reused
+        device_cache.forget_scanned_device("33:33:33:33:33:33")
+        assert ble_runtime.client_args("33:33:33:33:33:33")[0] == "33:33:33:33:33:33"
+    finally:
+        device_cache.forget_scanned_device("33:33:33:33:33:33")
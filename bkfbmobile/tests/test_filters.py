@@ -0,0 +1,66 @@
+import numpy as np
+import pytest
+
+from bkfbmobile import bkfb
+from bkfbmobile.filters import ButterworthFilter, LowPassFilter
+
+
+def referenceLowPass(values, alpha):
+    # the original per-sample loop
+    out = []
+    prev = None
+    for row in values:
+        prev = list(row) if prev is None else [p + alpha * (r - p) for p, r in zip(prev, row)]
+        out.append(prev)
+    return np.array(out)
+
+
+def test_batch_matches_per_sample():
+    """Filtering in uneven batches gives the original per-sample output."""
+    rng = np.random.default_rng(3)
+    values = rng.standard_normal((500, 3)) * 5
+    lowpass = LowPassFilter(10, 20.0)
+    expected = referenceLowPass(values, lowpass.alpha)
+
+    out = np.vstack([lowpass.batch(values[:1]), lowpass.batch(values[1:137]), lowpass.batch(values[137:])])
+    np.testing.assert_allclose(out, expected, rtol=1e-12, atol=1e-12)
+
+    lowpass.reset()
+    singles = np.array([lowpass.sample(row) for row in values])
+    np.testing.assert_allclose(singles, expected, rtol=1e-12, atol=1e-12)
+
+
+def test_butterworth_state_carries_across_batches():
+    """Butterworth output doesn't depend on how the samples were split up."""
+    rng = np.random.default_rng(4)
+    values = rng.standard_normal((400, 3))
+    whole = ButterworthFilter(40, 500.0, order=4).batch(values)
+    split = ButterworthFilter(40, 500.0, order=4)
+    parts = np.vstack([split.batch(values[:50]), np.array([split.sample(values[50])]), split.batch(values[51:])])
+    np.testing.assert_allclose(parts, whole, rtol=1e-10, atol=1e-12)
+
+    # settled start: a constant input comes straight out
+    flat = ButterworthFilter(40, 500.0).batch(np.full((20, 3), 2.5))
+    np.testing.assert_allclose(flat, 2.5)
+
+    with pytest.raises(ValueError):
+        ButterworthFilter(10, 20.0)
+
+
+def test_append_samples_matches_append_sample():
+    """A burst added with appendSamples ends up the same as adding samples one by one."""
+    rng = np.random.default_rng(5)
+    samples = [(i, *rng.standard_normal(3)) for i in range(60)]
+
+    bkfb.reset()
+    for sample in samples:
+        bkfb.appendSample(*sample)
+    one_by_one = {k: list(v) for k, v in bkfb.data_points.items()}
+
+    bkfb.reset()
+    bkfb.appendSamples(samples[:7])
+    bkfb.appendSamples(samples[7:])
+    for coord in ('x', 'y', 'z'):
+        np.testing.assert_allclose(bkfb.data_points[coord], one_by_one[coord], rtol=1e-12)
+    assert bkfb.point_count == 60
+    bkfb.reset()
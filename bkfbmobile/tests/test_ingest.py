@@ -0,0 +1,65 @@
+import asyncio
+import threading
+
+import pytest
+
+from bkfbmobile import ingest
+
+
+def fill(policy, count, capacity=4):
+    async def run():
+        buffer = ingest.SampleBuffer(asyncio.get_running_loop(), capacity, policy)
+        for i in range(count):
+            buffer.push(i)
+        return buffer, await buffer.getBatch(timeout=0.1)
+    return asyncio.run(run())
+
+
+def test_drop_policies():
+    """A full buffer keeps the newest or the oldest samples and counts what it dropped."""
+    buffer, batch = fill(ingest.DROP_OLDEST, 10)
+    assert batch == [6, 7, 8, 9]
+    assert buffer.overflow == 6
+
+    buffer, batch = fill(ingest.DROP_NEWEST, 10)
+    assert batch == [0, 1, 2, 3]
+    assert buffer.overflow == 6
+
+    with pytest.raises(ValueError):
+        fill("sometimes", 1)
+
+
+def test_block_waits_for_the_consumer():
+    """With the block policy a producer thread waits for room instead of losing samples."""
+    async def run():
+        buffer = ingest.SampleBuffer(asyncio.get_running_loop(), 8, ingest.BLOCK, block_timeout=5.0)
+        producer = threading.Thread(target=lambda: [buffer.push(i) for i in range(100)])
+        producer.start()
+        received = []
+        while len(received) < 100:
+            received.extend(await buffer.getBatch(timeout=1.0))
+        producer.join()
+        return buffer, received
+
+    buffer, received = asyncio.run(run())
+    assert received == list(range(100))
+    assert buffer.overflow == 0
+
+
+def test_one_wakeup_per_batch():
+    """Pushes from another thread schedule one loop callback until the batch is collected."""
+    async def run():
+        loop = asyncio.get_running_loop()
+        buffer = ingest.SampleBuffer(loop, 1024)
+        calls = []
+        original = loop.call_soon_threadsafe
+        loop.call_soon_threadsafe = lambda *args: calls.append(args) or original(*args)
+        thread = threading.Thread(target=lambda: [buffer.push(i) for i in range(200)])
+        thread.start()
+        thread.join()
+        batch = await buffer.getBatch(timeout=1.0)
+        return batch, calls
+
+    batch, calls = asyncio.run(run())
+    assert batch == list(range(200))
+    assert len(calls) == 1
@@ -0,0 +1,25 @@
+from bkfbmobile import latency
+
+
+def test_frame_marks_finish_coalesced_samples():
+    """One rendered frame completes every sample filtered before it."""
+    latency.setEnabled(True)
+    try:
+        for seq in (1, 2, 3):
+            latency.mark(seq, "notify", 1_000)
+            latency.mark(seq, "decode", 2_000)
+            latency.mark(seq, "pipe", 3_000)
+            latency.mark(seq, "filter", 4_000 + seq)
+        latency.markFrame("render", 10_000)
+        latency.markFrame("image", 20_000)
+
+        stages = latency.summary()["stages"]
+        assert stages["image"]["count"] == 3
+        assert stages["total"]["count"] == 3
+
+        trace = latency.chromeTrace()
+        events = [e for e in trace["traceEvents"] if e["ph"] == "X"]
+        assert len(events) == 3 * 5
+        assert {e["args"]["seq"] for e in events} == {1, 2, 3}
+    finally:
+        latency.setEnabled(False)
@@ -0,0 +1,54 @@
+import asyncio
+
+from bkfbmobile.Networking import ble_runtime
+from bkfbmobile.Networking.simulated_sensor import SimulatedSensor
+
+
+def test_heartbeats_only_once_the_link_goes_quiet():
+    """No writes while samples flow; a stall is flagged within a few periods, then the link is given up."""
+    async def session():
+        sensor = SimulatedSensor("simulated")
+        monitor = ble_runtime.LinkMonitor(sensor)
+        monitor.check_interval_s = 0.01
+        monitor.heartbeat_idle_s = 0.1
+        monitor.stall_min_s = 0.15
+        monitor.dead_min_s = 1.0
+        states = []
+
+        async def on_change(state, _idle):
+            states.append(state)
+
+        await sensor.start_notify(ble_runtime.UART_TX, lambda _sender, _data: monitor.received())
+        task = asyncio.create_task(monitor.run(on_change))
+        try:
+            await asyncio.sleep(0.5)
+            assert sensor.written == [] and states == []
+
+            sensor.paused = True
+            await asyncio.sleep(0.5)
+            assert states == [ble_runtime.LINK_STALLED]
+            assert "batman" in sensor.written
+            sensor.paused = False
+            await asyncio.sleep(0.2)
+            assert states[-1] == ble_runtime.LINK_OK
+
+            sensor.paused = True
+            assert await asyncio.wait_for(task, timeout=3) == ble_runtime.LINK_DEAD
+        finally:
+            await sensor.disconnect()
+        assert states[-2:] == [ble_runtime.LINK_STALLED, ble_runtime.LINK_DEAD]
+        assert monitor.stalls == 2
+        assert -63 <= monitor.rssi <= -57
+
+    asyncio.run(session())
+
+
+def test_stall_time_follows_the_notification_period():
+    """Slow, batched rates get more time before counting as stalled or needing a heartbeat."""
+    monitor = ble_runtime.LinkMonitor(None)
+    assert monitor.stall_after() == monitor.stall_min_s
+    assert monitor.heartbeat_idle_s == monitor.heartbeat_min_s
+    monitor.set_rate(1, 8)
+    assert monitor.stall_after() == 32.0
+    assert monitor.dead_after() == 64.0
+    assert monitor.heartbeat_idle_s == 16.0
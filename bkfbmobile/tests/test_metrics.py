@@ -0,0 +1,50 @@
+from bkfbmobile import bkfb, metrics
+
+
+def test_metrics_are_noops_when_disabled():
+    """Nothing is recorded while collection is off."""
+    metrics.setEnabled(False)
+    counter = metrics.counter("test.disabled")
+    counter.inc(5)
+    metrics.histogram("test.disabled_ms").observe(3.0)
+    assert counter.value == 0
+    assert metrics.histogram("test.disabled_ms").count == 0
+
+
+def test_histogram_buckets_and_snapshot():
+    """Values land in fixed buckets and show up in the JSON snapshot."""
+    metrics.setEnabled(True)
+    try:
+        hist = metrics.histogram("test.render_ms", bounds=(1, 10, 100))
+        for value in (0.5, 5, 50, 500):
+            hist.observe(value)
+        metrics.counter("test.samples").inc(3)
+        metrics.gauge("test.depth").set(7)
+
+        snap = metrics.snapshot()
+        assert snap["histograms"]["test.render_ms"]["counts"] == [1, 1, 1, 1]
+        assert snap["counters"]["test.samples"]["value"] == 3
+        assert snap["gauges"]["test.depth"] == 7
+    finally:
+        metrics.reset()
+        metrics.setEnabled(False)
+
+
+def test_reenabling_metrics_does_not_count_the_gap_as_drops():
+    """Samples that arrived while metrics were off aren't reported as dropped packets."""
+    bkfb.reset()
+    bkfb.setMetricsEnabled(True)
+    try:
+        for seq in range(1, 6):
+            bkfb.appendSample(seq, 0.0, 0.0, 9.8)
+        bkfb.setMetricsEnabled(False)
+        for seq in range(6, 51):
+            bkfb.appendSample(seq, 0.0, 0.0, 9.8)
+        bkfb.setMetricsEnabled(True)
+        bkfb.appendSample(51, 0.0, 0.0, 9.8)
+        bkfb.appendSample(53, 0.0, 0.0, 9.8)
+        assert metrics.counter("pipeline.seq_dropped").value == 1
+    finally:
+        metrics.reset()
+        metrics.setEnabled(False)
+        bkfb.reset()
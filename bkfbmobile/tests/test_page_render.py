@@ -0,0 +1,56 @@
+import asyncio
+import math
+
+from bkfbmobile import bkfb
+
+
+def addSamples(count):
+    for _ in range(count):
+        i = bkfb.point_count
+        bkfb.data_points['x'].append(0.0)
+        bkfb.data_points['y'].append(20.0 * math.sin(2 * math.pi * i / 20))
+        bkfb.data_points['z'].append(0.0)
+        bkfb.point_count += 1
+
+
+def renderOnce():
+    """Run renderUpdate and return the (plot, avg, compare) it handed over, or None."""
+    updates = []
+
+    async def on_update(*images):
+        updates.append(images)
+
+    asyncio.run(bkfb.renderUpdate(on_update))
+    return updates[0] if updates else None
+
+
+def test_only_the_visible_page_is_rendered():
+    """The live page renders on every update; the stroke pages only go stale until shown."""
+    bkfb.reset()
+    bkfb.setLiveRenderMode(bkfb.LIVE_RENDER_CANVAS)
+    try:
+        addSamples(bkfb.avg_stroke_update_interval * 4)
+        plot, avg, compare = renderOnce()
+        assert plot is not None and avg is None and compare is None
+        assert bkfb._stale_pages == {bkfb.PAGE_AVERAGE, bkfb.PAGE_COMPARE}
+
+        # the average page draws itself once it's up, the compare page is left stale
+        bkfb.setActivePage(bkfb.PAGE_AVERAGE)
+        addSamples(bkfb.avg_stroke_update_interval)
+        plot, avg, compare = renderOnce()
+        assert plot is None and avg is not None and compare is None
+        assert bkfb._stale_pages == {bkfb.PAGE_LIVE, bkfb.PAGE_COMPARE}
+
+        # not enough new samples for another analysis: nothing to hand over
+        addSamples(1)
+        assert renderOnce() is None
+
+        # switching pages renders the stale one once
+        assert bkfb.renderPage(bkfb.PAGE_COMPARE)[2] is not None
+        assert bkfb.renderPage(bkfb.PAGE_COMPARE) == (None, None, None)
+        assert bkfb.renderPage(bkfb.PAGE_LIVE)[0] is not None
+        assert not bkfb._stale_pages
+    finally:
+        bkfb.setActivePage(bkfb.PAGE_LIVE)
+        bkfb.setLiveRenderMode(bkfb.LIVE_RENDER_PNG)
+        bkfb.reset()
@@ -0,0 +1,63 @@
+import numpy as np
+
+from bkfbmobile import bkfb
+from bkfbmobile.pyramid import STAT_MAX, STAT_MEAN, STAT_MIN, SessionPyramid
+
+
+def test_levels_match_brute_force():
+    """Every row of every level is the min/max/mean of the samples it covers."""
+    rng = np.random.default_rng(2)
+    values = rng.standard_normal((1001, 3))
+    pyr = SessionPyramid.fromValues(values)
+
+    for level in range(pyr.levels):
+        size = 1 << level
+        starts, tile = pyr.rows(level, 0, len(values))
+        for start, row in zip(starts[::37], tile[::37]):
+            chunk = values[start:start + size]
+            np.testing.assert_allclose(row[STAT_MIN], chunk.min(axis=0), rtol=1e-6)
+            np.testing.assert_allclose(row[STAT_MAX], chunk.max(axis=0), rtol=1e-6)
+            np.testing.assert_allclose(row[STAT_MEAN], chunk.mean(axis=0), rtol=1e-5, atol=1e-6)
+    assert len(pyr.rows(pyr.levels - 1, 0, len(values))[1]) == 1
+
+
+def test_window_is_bounded_and_keeps_spikes():
+    """A view of any span reads a bounded number of rows without losing extremes."""
+    values = np.zeros((50000, 3))
+    values[31234, 0] = 9.0
+    pyr = SessionPyramid.fromValues(values)
+
+    level, starts, tile = pyr.window(0, 50000, max_points=200)
+    assert 200 <= len(tile) < 400
+    assert tile[:, STAT_MAX, 0].max() == 9.0
+
+    level, starts, tile = pyr.window(31200, 31300, max_points=200)
+    assert level == 0
+    assert starts[0] == 31200 and len(tile) == 100
+
+
+def test_saved_session_round_trip(tmp_path):
+    """saveSession writes the pyramid next to the CSV and openSession reads it back."""
+    points = {'x': list(np.linspace(0, 1, 300)), 'y': [0.5] * 300, 'z': [-1.0] * 300}
+    path = bkfb.saveSession(str(tmp_path), "session.csv", points)
+    assert (tmp_path / "session.pyramid.npy").exists()
+
+    pyr = bkfb.openSession(path)
+    assert pyr.total == 300
+    frame = pyr.frame(0, 300, max_points=50)
+    assert set(frame["series"]) == {"x", "y", "z"}
+    assert len(frame["xs"]) == len(frame["series"]["x"])
+    np.testing.assert_allclose(max(frame["series"]["x"]), 1.0, rtol=1e-6)
+
+
+def test_zoom_pan_and_scrub_stay_inside_the_session():
+    """View changes keep their width where they can and never leave [0, total)."""
+    pyr = SessionPyramid.fromValues(np.zeros((1000, 3)))
+    assert pyr.zoom(0, 1000, 0.5) == (250, 750)
+    assert pyr.zoom(250, 750, 4.0) == (0, 1000)
+    assert pyr.zoom(500, 520, 0.1) == (500, 520)  # as far in as it goes
+    assert pyr.pan(250, 750, 0.25) == (375, 875)
+    assert pyr.pan(250, 750, 1.0) == (500, 1000)
+    assert pyr.pan(250, 750, -1.0) == (0, 500)
+    assert pyr.scrub(0, 100, 0.5) == (450, 550)
+    assert pyr.scrub(0, 100, 1.0) == (900, 1000)
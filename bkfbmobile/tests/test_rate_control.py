@@ -0,0 +1,70 @@
+import asyncio
+
+import numpy as np
+
+from bkfbmobile import bkfb
+from bkfbmobile.Networking import ble_runtime
+
+
+def test_rate_protocol():
+    """Rate commands are clamped, acks parse, and batched notifications yield every sample."""
+    assert ble_runtime.rate_command(500, 20) == "RATE 100 8"
+    assert ble_runtime.rate_command(12.5, 2) == "RATE 12.5 2"
+    assert ble_runtime.parse_rate_ack("ACK RATE 50 3") == (50.0, 3)
+    assert ble_runtime.parse_rate_ack("1 x 0.1 y 0.2 z 0.3") is None
+    text = "7 x 0.1 y 0.2 z 0.3\n8 x 0.4 y 0.5 z 0.6"
+    assert [sample[0] for sample in ble_runtime.parse_sequenced_samples(text)] == [7, 8]
+
+
+def test_rate_change_starts_a_new_stretch():
+    """Everything rate dependent switches together; the session timebase keeps both rates."""
+    bkfb.reset()
+    try:
+        for i in range(40):
+            bkfb.appendSample(i + 1, 0.0, 1.0, 0.0)
+        bkfb.applySampleRate(50.0, 3)
+        for i in range(40, 100):
+            bkfb.appendSample(i + 1, 0.0, 1.0, 0.0)
+
+        assert bkfb.LOW_PASS_SAMPLE_RATE_HZ == 50.0
+        assert bkfb.stroke_rate_estimator.sample_rate_hz == 50.0
+        assert bkfb.rate_segments == [(0, 20.0), (40, 50.0)]
+        steps = np.diff(bkfb.sessionTimebase().times)
+        assert np.allclose(steps[:39], 0.05) and np.allclose(steps[39:], 0.02)
+        assert len(bkfb.sessionTimebase(current_rate_only=True).times) == 60
+    finally:
+        bkfb.applySampleRate(ble_runtime.DEFAULT_SAMPLE_RATE_HZ)
+        bkfb.reset()
+
+
+def test_simulated_sensor_rate_change(monkeypatch):
+    """Against the simulated sensor, the app only switches rate on the ack and keeps every sample."""
+    monkeypatch.setenv("BKFB_SIMULATED_SENSOR", "1")
+    monkeypatch.setattr(bkfb, "ESP32_ADDR", "simulated")
+    bkfb.reset()
+
+    async def on_update(*_images):
+        pass
+
+    async def session():
+        stop = asyncio.Event()
+        task = asyncio.create_task(bkfb.runInProcessStream(on_update, stop, None))
+        while bkfb.point_count < 5:
+            await asyncio.sleep(0.02)
+        assert bkfb.SAMPLE_RATE_HZ == 20.0
+        assert await ble_runtime.request_sample_rate(50, 3)
+        while bkfb.SAMPLE_RATE_HZ != 50.0:
+            await asyncio.sleep(0.02)
+        while bkfb.point_count < bkfb.rate_segments[-1][0] + 12:
+            await asyncio.sleep(0.02)
+        stop.set()
+        await task
+
+    try:
+        asyncio.run(asyncio.wait_for(session(), timeout=10))
+        assert bkfb.sensor_batch == 3
+        assert len(bkfb.rate_segments) == 2
+        assert bkfb.sample_seqs == list(range(1, len(bkfb.sample_seqs) + 1))
+    finally:
+        bkfb.applySampleRate(ble_runtime.DEFAULT_SAMPLE_RATE_HZ)
+        bkfb.reset()
@@ -0,0 +1,53 @@
+import numpy as np
+import pandas
+
+from bkfbmobile.AU.averageStroke import getPeaks, getStrokes, refinePeaks
+from bkfbmobile.AU.strokeFeatures import getStrokeFeatures
+
+
+def session(rate_hz, period_s=2.37, seconds=60):
+    t = np.arange(int(seconds * rate_hz)) / rate_hz
+    ay = 1.5 * np.cos(2 * np.pi * t / period_s) - 0.4 * np.cos(4 * np.pi * t / period_s)
+    return pandas.DataFrame({'time': t, 'ay': ay})
+
+
+def test_troughs_to_a_few_milliseconds_at_10hz():
+    """At half the firmware's rate refined troughs land within ~5 ms, whole samples up to 50 ms off."""
+    period = 2.37
+    acc = session(10.0, period)
+    peaks = np.asarray(getPeaks(acc))
+    refined = refinePeaks(acc, peaks)
+    true = (np.round(peaks / 10.0 / period - 0.5) + 0.5) * period  # troughs of the signal, in s
+    assert np.abs(peaks / 10.0 - true).max() > 0.02
+    assert np.abs(refined / 10.0 - true).max() < 0.005
+
+
+def test_fractional_boundaries_carry_through():
+    """Strokes start exactly at the refined trough and durations follow the exact period."""
+    period = 2.37
+    acc = session(10.0, period)
+    refined = refinePeaks(acc, getPeaks(acc))
+    strokes = getStrokes(acc, padding_samples=0, peakIndexes=refined)
+    assert len(strokes) == len(refined) - 1
+    trough = 1.5 * np.cos(np.pi) - 0.4 * np.cos(2 * np.pi)
+    assert all(abs(stroke[0] - trough) < 0.05 for stroke in strokes)
+
+    table = getStrokeFeatures(acc['ay'].to_numpy(), refined, sampling_rate_hz=10.0)
+    assert np.abs(table['duration_s'] - period).max() < 0.01
+
+    # whole-sample boundaries still work as before
+    assert len(getStrokes(acc, peakIndexes=getPeaks(acc))) == len(strokes)
+
+
+def test_fractional_strokes_match_whole_session_interpolation():
+    """Interpolating each stroke on its own slice gives what interpolating the whole session did."""
+    acc = session(20.0, seconds=120)
+    refined = refinePeaks(acc, getPeaks(acc))
+    ay = acc['ay'].to_numpy()
+    positions = np.arange(len(ay))
+    # the last boundary padded past the end of the data too
+    boundaries = np.append(refined, len(ay) - 0.6)
+    strokes = getStrokes(acc, padding_samples=2, peakIndexes=boundaries)
+    for start, stroke in zip(boundaries[:-1] - 2, strokes):
+        start = max(0.0, start)
+        assert np.allclose(stroke, np.interp(start + np.arange(len(stroke)), positions, ay), rtol=0, atol=1e-12)
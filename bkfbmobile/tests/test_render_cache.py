@@ -0,0 +1,47 @@
+import math
+
+from bkfbmobile import bkfb
+
+
+def fillStrokes(samples):
+    bkfb.reset()
+    for i in range(samples):
+        bkfb.data_points['x'].append(0.0)
+        bkfb.data_points['y'].append(20.0 * math.sin(2 * math.pi * i / 20))
+        bkfb.data_points['z'].append(0.0)
+        bkfb.point_count += 1
+
+
+def test_average_plot_reused_until_strokes_change():
+    """The average plot is only redrawn when the detected strokes or settings change."""
+    fillStrokes(95)
+    first = bkfb.averageStroke(bkfb.data_points)
+    assert first is not None
+    version = bkfb.strokeAnalysis(bkfb.data_points).version
+
+    # a few samples that don't complete another stroke
+    bkfb.data_points['x'].append(0.0)
+    bkfb.data_points['y'].append(0.0)
+    bkfb.data_points['z'].append(0.0)
+    bkfb.point_count += 1
+    assert bkfb.strokeAnalysis(bkfb.data_points).version == version
+    assert bkfb.averageStroke(bkfb.data_points) is first
+
+    bkfb.setStrokeDirection(-1)
+    try:
+        assert bkfb.averageStroke(bkfb.data_points) is not first
+    finally:
+        bkfb.setStrokeDirection(1)
+    bkfb.reset()
+
+
+def test_render_page_skips_unchanged_image():
+    """renderPage hands the app nothing when the cached compare image is already shown."""
+    fillStrokes(95)
+    _, _, shown = bkfb.renderPage(bkfb.PAGE_COMPARE, force=True)
+    assert shown is not None
+    assert bkfb.renderPage(bkfb.PAGE_COMPARE, force=False) == (None, None, None)
+    bkfb._stale_pages.add(bkfb.PAGE_COMPARE)
+    assert bkfb.renderPage(bkfb.PAGE_COMPARE) == (None, None, None)
+    assert bkfb.renderPage(bkfb.PAGE_COMPARE, force=True)[2] is shown
+    bkfb.reset()
@@ -0,0 +1,52 @@
+import numpy as np
+import pandas
+
+from bkfbmobile import bkfb
+from bkfbmobile.AU.averageStroke import getPeaks
+from bkfbmobile.AU.streamingStroke import StreamingStrokeDetector
+
+
+def strokeSignal(num_samples=600, period_samples=40):
+    t = np.arange(num_samples)
+    return 1.5 * np.sin(2 * np.pi * t / period_samples) + 0.5 * np.sin(4 * np.pi * t / period_samples + 1)
+
+
+def test_boundaries_match_get_peaks():
+    """The streaming detector finds the same troughs as find_peaks."""
+    ay = strokeSignal()
+    peaks = getPeaks(pandas.DataFrame({'time': np.arange(len(ay)), 'ay': ay}))
+    detector = StreamingStrokeDetector()
+    detector.feed(ay)
+    # the last trough isn't confirmed until the signal climbs back out
+    assert detector.boundaries == list(peaks[:len(detector.boundaries)])
+    assert len(detector.boundaries) >= len(peaks) - 1
+
+
+def test_boundary_emitted_once_confirmed():
+    """A boundary is reported by the sample that confirms it, not at the end of the series."""
+    ay = strokeSignal()
+    detector = StreamingStrokeDetector()
+    for i, value in enumerate(ay):
+        boundary = detector.update(value)
+        if boundary is not None:
+            assert boundary < i <= boundary + 20
+            break
+    else:
+        raise AssertionError("no boundary confirmed")
+
+
+def test_small_wiggles_are_not_strokes():
+    """Noise well below the prominence threshold never produces a boundary."""
+    rng = np.random.default_rng(6)
+    detector = StreamingStrokeDetector()
+    assert detector.feed(0.1 * rng.standard_normal(2000)) == []
+
+
+def test_strokes_with_streaming_detector(synthetic_session):
+    """strokeAnalysis can use the streaming detector and agrees with find_peaks."""
+    peaks = synthetic_session.add(400).strokes()
+    bkfb.setStrokeDetector(bkfb.STROKE_DETECTOR_STREAMING)
+    streaming = synthetic_session.restart().add(400).strokes()
+    assert len(streaming) >= len(peaks) - 1
+    for a, b in zip(streaming, peaks):
+        np.testing.assert_allclose(a, b)
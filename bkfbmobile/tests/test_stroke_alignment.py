@@ -0,0 +1,54 @@
+import math
+
+import numpy as np
+
+from bkfbmobile import bkfb
+from bkfbmobile.AU.strokeAlignment import DtwStrokeAligner, bandedDtw
+
+
+def full_dtw(x, y, radius):
+    n = len(x)
+    d = np.full((n + 1, n + 1), np.inf)
+    d[0, 0] = 0.0
+    for i in range(1, n + 1):
+        for j in range(max(1, i - radius), min(n, i + radius) + 1):
+            d[i, j] = (x[i - 1] - y[j - 1]) ** 2 + min(d[i - 1, j - 1], d[i - 1, j], d[i, j - 1])
+    return math.sqrt(d[n, n] / n)
+
+
+def test_matches_cell_by_cell_dtw():
+    """The vectorized band gives the textbook banded DTW distance, along a path inside the band."""
+    rng = np.random.default_rng(3)
+    for radius in (1, 4, 10):
+        x = rng.standard_normal(40)
+        y = rng.standard_normal(40)
+        distance, stroke_idx, template_idx = bandedDtw(x, y, radius)
+        assert math.isclose(distance, full_dtw(x, y, radius), rel_tol=1e-9)
+        assert np.abs(stroke_idx - template_idx).max() <= radius
+        assert math.isclose(math.sqrt(((x[stroke_idx] - y[template_idx]) ** 2).sum() / 40), distance, rel_tol=1e-9)
+
+
+def shifted_stroke(catch, length=50):
+    # a sharp catch at a varying phase on a smooth recovery
+    t = np.arange(length)
+    return np.exp(-0.5 * ((t - catch) / 1.5) ** 2) * 2.0 - 0.3 * np.sin(2 * np.pi * t / length)
+
+
+def test_alignment_keeps_the_catch_sharp():
+    """Catches at different phases average to a peak nearly as tall as one stroke's, unlike resampling."""
+    aligner = DtwStrokeAligner(50)
+    strokes = [shifted_stroke(20 + (i % 5) - 2) for i in range(40)]
+    aligner.extend(strokes)
+    plain = np.mean(strokes, axis=0)
+    assert aligner.mean.max() > 1.7
+    assert plain.max() < 1.4
+    assert aligner.std().max() < np.std(strokes, axis=0).max()
+
+
+def test_average_page_uses_dtw(synthetic_session):
+    """The live average page aligns each new stroke once, against the running template."""
+    bkfb.setStrokeAlignment(bkfb.STROKE_ALIGNMENT_DTW)
+    synthetic_session.add(300)
+    assert bkfb.averageStroke(bkfb.data_points) is not None
+    aligner = bkfb._aligned_state[1]
+    assert aligner.count == len(synthetic_session.strokes())
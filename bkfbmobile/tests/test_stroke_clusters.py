@@ -0,0 +1,88 @@
+import asyncio
+
+import numpy as np
+
+from bkfbmobile import bkfb, timebase
+from bkfbmobile.AU.strokeClusters import OnlineStrokeClusters
+
+
+def stroke(kind, rng, length=40):
+    t = np.linspace(0, 1, length)
+    if kind == "steady":
+        shape = np.sin(2 * np.pi * t)
+    else:
+        # race pace: harder, earlier drive
+        shape = 2.0 * np.sin(2 * np.pi * t ** 0.7)
+    return shape + 0.05 * rng.standard_normal(length)
+
+
+def test_separates_two_techniques():
+    """Steady and race-pace strokes end up in different clusters with tight bands."""
+    rng = np.random.default_rng(11)
+    clusters = OnlineStrokeClusters()
+    kinds = ["steady"] * 30 + ["race"] * 30 + ["steady"] * 10
+    labels = [clusters.add(stroke(kind, rng, 38 + i % 5)) for i, kind in enumerate(kinds)]
+
+    assert len(clusters) == 2
+    assert len(set(labels[:30])) == 1
+    assert len(set(labels[30:60])) == 1 and labels[30] != labels[0]
+    assert set(labels[60:]) == {labels[0]}
+
+    biggest = clusters.clusters()[0]
+    assert biggest[1] == 40
+    assert biggest[3].mean() < 0.15
+
+
+def test_single_technique_stays_one_cluster():
+    """Noise alone never splits a cluster."""
+    rng = np.random.default_rng(12)
+    clusters = OnlineStrokeClusters()
+    clusters.extend([stroke("steady", rng) for _ in range(200)])
+    assert len(clusters) == 1
+    assert clusters.counts[0] == 200
+
+
+def test_average_page_draws_clusters(synthetic_session):
+    """The average page can show per-cluster averages built from the live strokes."""
+    synthetic_session.add(300)
+    bkfb.setShowStrokeClusters(True)
+    assert bkfb.averageStroke(bkfb.data_points) is not None
+    assert sum(bkfb.stroke_clusters.counts) == len(synthetic_session.strokes())
+
+
+def test_strokes_are_tracked_on_any_page(synthetic_session):
+    """With the live page (or none) on screen, strokes still reach the index and the clusters."""
+    async def on_update(*_images):
+        pass
+
+    bkfb.setActivePage(None)
+    index = synthetic_session.indexStrokes()
+    synthetic_session.add(320, after_each=lambda: asyncio.run(bkfb.renderUpdate(on_update)))
+    assert len(index) >= 5
+    assert sum(bkfb.stroke_clusters.counts) == len(index)
+    assert len(bkfb.stroke_consistency) == len(index)
+
+
+def test_tracking_only_cuts_the_recent_samples(monkeypatch, synthetic_session):
+    """Off the stroke pages, each update cuts strokes from the last boundary on, not the whole session."""
+    windows = []
+    uniform_grid = timebase.uniformGrid
+
+    def recording_grid(seqs, values, *args, **kwargs):
+        windows.append(len(values))
+        return uniform_grid(seqs, values, *args, **kwargs)
+
+    async def on_update(*_images):
+        pass
+
+    monkeypatch.setattr(timebase, "uniformGrid", recording_grid)
+    bkfb.setLiveRenderMode(bkfb.LIVE_RENDER_CANVAS)
+    index = synthetic_session.indexStrokes()
+    synthetic_session.add(2000, after_each=lambda: asyncio.run(bkfb.renderUpdate(on_update)))
+    lookback = bkfb.STROKE_TRACKING_LOOKBACK_S * bkfb.SAMPLE_RATE_HZ
+    # a look back, up to two strokes since the last boundary was confirmed, and the new samples
+    assert max(windows[1:]) <= lookback + 2 * synthetic_session.period + bkfb.avg_stroke_update_interval
+    tracked = len(index)
+    assert sum(bkfb.stroke_clusters.counts) == tracked
+    # the same strokes the full analysis finds
+    assert tracked == len(synthetic_session.strokes())
@@ -0,0 +1,58 @@
+import math
+import time
+
+import numpy as np
+
+from bkfbmobile import bkfb
+from bkfbmobile.AU.strokeFeedback import ReferenceStroke
+
+
+def reference_curve(length=40):
+    return 1.5 * np.sin(2 * np.pi * np.arange(length) / length)
+
+
+def test_worst_phase_is_the_one_that_differs():
+    """A stroke that only goes wrong late in the drive is flagged there, with the right sign."""
+    curve = reference_curve()
+    reference = ReferenceStroke(curve, curve - 0.1, curve + 0.1)
+    assert reference.compare(curve).score < 1e-9
+
+    stroke = curve.copy()
+    stroke[8:18] += 0.5
+    feedback = reference.compare(stroke)
+    assert feedback.worstPhase == "drive"
+    assert feedback.bias > 0
+    assert feedback.phaseScores["drive"] > 2 * feedback.phaseScores["recovery"]
+
+
+def stream(bad_stroke=None, strokes=8):
+    seq = 0
+    for stroke_number in range(strokes):
+        for i in range(40):
+            seq += 1
+            value = 15.0 * math.sin(2 * math.pi * i / 40)
+            if stroke_number == bad_stroke and 20 <= i < 30:
+                value += 5.0
+            bkfb.appendSample(seq, 0.0, value, 0.0)
+
+
+def test_strokes_are_scored_as_they_end(tmp_path, synthetic_session):
+    """Each stroke gets feedback from the sample stream alone, quickly, and a bad one stands out."""
+    path = str(tmp_path / "reference_stroke.csv")
+    stream()
+    assert bkfb.saveReferenceStroke(path) is not None
+
+    synthetic_session.restart()
+    stream(bad_stroke=5)
+    # no whole-session analysis needed
+    assert bkfb._analysis_cache is None
+    scores = [feedback.score for feedback in bkfb.stroke_feedback]
+    assert len(scores) >= 6
+    assert max(scores) > 3 * np.median(scores)
+    assert "Reference" in bkfb.liveFrame(bkfb.data_points)["feedback"]
+
+    detector, recent = bkfb._feedback_state[1:]
+    started = time.perf_counter()
+    for _ in range(100):
+        bkfb.scoreFinishedStroke(detector, recent)
+    assert (time.perf_counter() - started) / 100 < 0.005
@@ -0,0 +1,99 @@
+import math
+
+import numpy as np
+
+from bkfbmobile import bkfb
+from bkfbmobile.AU.strokeIndex import StrokeIndex, resampleStroke
+
+
+def strokeShape(scale, length, shift=0.0):
+    t = np.linspace(0, 1, length)
+    return scale * np.sin(2 * np.pi * t) + shift * t
+
+
+def test_nearest_neighbours_with_and_without_pca(tmp_path):
+    """Queries return the closest strokes across sessions, before and after PCA and a reload."""
+    index = StrokeIndex()
+    for session in range(20):
+        strokes = [strokeShape(1.0 + 0.01 * i + session, 40 + i % 5) for i in range(50)]
+        index.add(strokes, f"session {session}")
+    target = strokeShape(7.02, 42)
+
+    exact = index.query(target, k=3)
+    assert exact[0][1] == "session 6"
+    assert exact[0][0] <= exact[1][0] <= exact[2][0]
+
+    index.fitPca(components=4)
+    assert [hit[1:] for hit in index.query(target, k=3)] == [hit[1:] for hit in exact]
+
+    path = str(tmp_path / "strokes.npz")
+    index.save(path)
+    loaded = StrokeIndex.load(path)
+    assert len(loaded) == 1000
+    assert [hit[1:] for hit in loaded.query(target, k=3)] == [hit[1:] for hit in exact]
+
+    # strokes added later are searchable straight away, and sessions can be excluded
+    loaded.add([target], "today")
+    assert loaded.query(target, k=1)[0][1] == "today"
+    assert loaded.query(target, k=1, excludeSession="today")[0][1] == "session 6"
+
+
+def test_large_index_is_searched_in_pca_space():
+    """Once reduced, 100k strokes are searched as 8 coefficients each and the hits are the exact ones."""
+    rng = np.random.default_rng(10)
+    index = StrokeIndex()
+    index.add(rng.standard_normal((100000, index.length)), "bulk")
+    index.fitPca(components=8)
+    assert index.vectors is None
+    assert index.space().shape == (100000, 8) and index.space().dtype == np.float32
+
+    target = rng.standard_normal(index.length)
+    hits = index.query(target, k=10)
+    projected = index.project(resampleStroke(target)[None, :])[0]
+    distances = np.linalg.norm(index.space().astype('float64') - projected, axis=1)
+    assert [hit[2] for hit in hits] == np.argsort(distances)[:10].tolist()
+    assert np.allclose([hit[0] for hit in hits], np.sort(distances)[:10], atol=1e-3)
+
+
+def test_live_strokes_are_indexed_incrementally(synthetic_session):
+    """New strokes detected during a session go into the index once."""
+    index = synthetic_session.indexStrokes()
+    first = len(synthetic_session.add(200).strokes())
+    assert len(index) == first
+    total = len(synthetic_session.add(120).strokes())
+    assert total > first
+    assert len(index) == total
+    assert bkfb.similarStrokes(k=1, other_sessions=False)[0][0] < 1e-3
+
+
+def test_changed_stroke_settings_replace_this_sessions_strokes(synthetic_session):
+    """Re-cutting strokes (here: refined boundaries off) swaps this session's entries, older sessions stay."""
+    index = synthetic_session.indexStrokes()
+    index.add([strokeShape(1.0, 40)] * 3, "yesterday")
+    count = len(synthetic_session.add(240).strokes())
+    assert len(index) == 3 + count
+
+    bkfb.setRefineStrokeBoundaries(False)
+    strokes = synthetic_session.strokes()
+    assert len(index) == 3 + len(strokes)
+    assert index.strokeNumbers[3:len(index)].tolist() == list(range(len(strokes)))
+    expected = np.asarray([resampleStroke(stroke) for stroke in strokes], dtype='float32')
+    assert np.allclose(index.vectors[3:len(index)], expected)
+    assert "yesterday" in bkfb.similarStrokesText()
+
+
+def test_large_index_is_saved_reduced(tmp_path, monkeypatch, synthetic_session):
+    """Once past the threshold the saved index keeps PCA coefficients, not full strokes."""
+    monkeypatch.setattr(bkfb, "STROKE_INDEX_PCA_THRESHOLD", 100)
+    path = str(tmp_path / "stroke_index.npz")
+    bkfb.setStrokeIndexPath(path)
+    bkfb.strokeIndex().add([strokeShape(1.0 + 0.01 * i, 40) for i in range(99)], "small")
+    bkfb.saveStrokeIndex()
+    assert StrokeIndex.load(path).vectors is not None
+
+    bkfb.stroke_index.add([strokeShape(2.0, 40)], "small", firstNumber=99)
+    bkfb.saveStrokeIndex()
+    loaded = StrokeIndex.load(path)
+    assert loaded.vectors is None and loaded.pca is not None
+    assert len(loaded) == 100
+    assert loaded.query(strokeShape(2.0, 40), k=1)[0][2] == 99
@@ -0,0 +1,68 @@
+import numpy as np
+
+from bkfbmobile import bkfb
+from bkfbmobile.AU.strokeIndex import StrokeIndex
+from bkfbmobile.AU.strokePca import IncrementalStrokePca
+
+
+def strokeMatrix(count, rng, length=50):
+    # strokes that vary along a few smooth shapes plus a little noise
+    t = np.linspace(0, 1, length)
+    shapes = np.array([np.sin(2 * np.pi * t), np.sin(4 * np.pi * t), t - 0.5])
+    weights = rng.standard_normal((count, 3)) * [1.0, 0.4, 0.2] + [1.0, 0.0, 0.0]
+    return weights @ shapes + 0.01 * rng.standard_normal((count, length))
+
+
+def test_incremental_matches_batch_pca():
+    """Fitting in small batches finds the same subspace and variances as one full SVD."""
+    rng = np.random.default_rng(13)
+    strokes = strokeMatrix(600, rng)
+    model = IncrementalStrokePca(components=3)
+    for start in range(0, 600, 37):
+        model.partialFit(strokes[start:start + 37])
+
+    centred = strokes - strokes.mean(axis=0)
+    _u, s, vt = np.linalg.svd(centred, full_matrices=False)
+    np.testing.assert_allclose(model.mean, strokes.mean(axis=0), atol=1e-12)
+    np.testing.assert_allclose(model.singularValues, s[:3], rtol=1e-3)
+    # same subspace: projecting one basis onto the other keeps its length
+    np.testing.assert_allclose(np.linalg.norm(model.basis @ vt[:3].T, axis=1), 1.0, atol=1e-4)
+
+
+def test_consistency_flags_odd_strokes():
+    """Strokes shaped like the rest score near 1, an odd one scores clearly lower."""
+    rng = np.random.default_rng(14)
+    model = IncrementalStrokePca(components=3).partialFit(strokeMatrix(300, rng))
+    typical = model.consistency(strokeMatrix(20, rng))
+    odd = model.consistency(model.mean + 0.5 * np.cos(np.linspace(0, 9 * np.pi, 50)))
+    assert typical.min() > 0.95
+    assert odd[0] < 0.5
+    assert model.reconstructionError(strokeMatrix(5, rng)).max() < 0.05
+
+
+def test_index_keeps_only_coefficients(tmp_path):
+    """After PCA the index stores a few coefficients per stroke and still answers queries."""
+    rng = np.random.default_rng(15)
+    strokes = strokeMatrix(5000, rng)
+    index = StrokeIndex()
+    index.add(strokes, "old session")
+    index.fitPca(components=4)
+
+    assert index.vectors is None
+    assert index.projected[:len(index)].nbytes == 5000 * 4 * 4
+    assert index.query(strokes[42], k=1)[0][1:] == ("old session", 42)
+
+    path = str(tmp_path / "compact.npz")
+    index.save(path)
+    loaded = StrokeIndex.load(path)
+    assert loaded.vectors is None
+    loaded.add(strokes[:1] * 1.5, "new session")
+    assert loaded.query(strokes[:1] * 1.5, k=1)[0][1] == "new session"
+
+
+def test_live_consistency_scores(synthetic_session):
+    """Each live stroke gets a consistency score once the model has seen a few strokes."""
+    strokes = synthetic_session.add(500).strokes()
+    assert len(bkfb.stroke_consistency) == len(strokes)
+    scores = [score for score in bkfb.stroke_consistency if score is not None]
+    assert scores and min(scores) > 0.9
@@ -0,0 +1,48 @@
+import numpy as np
+
+from bkfbmobile import bkfb
+from bkfbmobile.timebase import (
+    SEQ_DUPLICATE, SEQ_GAP, SEQ_NEXT, SEQ_RESTART, classify, uniformGrid,
+)
+
+
+def test_classify():
+    """Sequence steps are told apart, including a firmware restart from 1."""
+    assert classify(None, 7) == SEQ_NEXT
+    assert classify(6, 7) == SEQ_NEXT
+    assert classify(6, 9) == SEQ_GAP
+    assert classify(9, 9) == SEQ_DUPLICATE
+    assert classify(500, 1) == SEQ_RESTART
+
+
+def test_uniform_grid_fills_short_gaps_and_drops_duplicates():
+    """Short gaps are interpolated, duplicates dropped and long gaps kept as a time jump."""
+    seqs = [1, 2, 3, 5, 6, 6, 7, 30, 31]
+    values = np.array([[float(s), 2.0 * s, 0.0] for s in seqs])
+    grid = uniformGrid(seqs, values, sample_rate_hz=20.0)
+
+    assert grid.seqs.tolist() == [1, 2, 3, 4, 5, 6, 7, 30, 31]
+    np.testing.assert_allclose(grid.values[:, 0], grid.seqs)
+    np.testing.assert_allclose(grid.values[:, 1], 2.0 * grid.seqs)
+    np.testing.assert_allclose(grid.times, (grid.seqs - 1) / 20.0)
+    assert (grid.dropped, grid.duplicates, grid.interpolated, grid.long_gaps) == (23, 1, 1, 1)
+
+
+def test_restart_continues_the_timeline():
+    """A reconnect restarting seq at 1 carries on after the previous run."""
+    seqs = [10, 11, 12, 1, 2, 3]
+    grid = uniformGrid(seqs, np.arange(18.0).reshape(6, 3), sample_rate_hz=20.0)
+    assert grid.restarts == 1
+    assert grid.seqs.tolist() == [10, 11, 12, 13, 14, 15]
+    np.testing.assert_allclose(grid.values[:, 0], [0, 3, 6, 9, 12, 15])
+
+
+def test_session_timebase_uses_sample_seqs():
+    """Samples added through appendSample keep their sequence numbers."""
+    bkfb.reset()
+    for seq in (1, 2, 4, 5):
+        bkfb.appendSample(seq, 1.0, 1.0, 1.0)
+    grid = bkfb.sessionTimebase()
+    assert grid.seqs.tolist() == [1, 2, 3, 4, 5]
+    assert grid.interpolated == 1
+    bkfb.reset()
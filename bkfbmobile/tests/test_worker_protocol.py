@@ -0,0 +1,177 @@
+import asyncio
+import json
+import os
+import sys
+
+import pytest
+
+import bkfbmobile
+from bkfbmobile import bkfb
+
+PACKAGE_ROOT = os.path.dirname(os.path.dirname(bkfbmobile.__file__))
+
+
+def simulated_env(monkeypatch):
+    monkeypatch.setenv("BKFB_SIMULATED_SENSOR", "1")
+    monkeypatch.setenv("PYTHONPATH", os.pathsep.join(filter(None, [PACKAGE_ROOT, os.environ.get("PYTHONPATH")])))
+
+
+async def next_message(worker, kind, timeout=5.0):
+    """Read the worker's stdout until a message of this type comes along."""
+    async def read():
+        while True:
+            line = await worker.stdout.readline()
+            assert line, f"worker exited before sending {kind}"
+            if not line.startswith(b"{"):
+                continue
+            message = json.loads(line)
+            if message["type"] == kind:
+                return message
+    return await asyncio.wait_for(read(), timeout)
+
+
+def test_worker_commands(monkeypatch):
+    """connect/rate/status/download/disconnect/quit over stdin, answered as JSON lines on stdout."""
+    simulated_env(monkeypatch)
+
+    async def session():
+        worker = await asyncio.create_subprocess_exec(
+            sys.executable, "-m", "bkfbmobile.Networking.ble_worker",
+            stdin=asyncio.subprocess.PIPE, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.DEVNULL,
+        )
+
+        async def send(**command):
+            worker.stdin.write((json.dumps(command) + "\n").encode("utf-8"))
+            await worker.stdin.drain()
+
+        try:
+            await next_message(worker, "ready")
+            await send(cmd="status", session=1)
+            assert (await next_message(worker, "status"))["text"] == "Not connected"
+
+            await send(cmd="connect", address="simulated", session=1)
+            sample = await next_message(worker, "sample")
+            assert sample["session"] == 1 and {"seq", "x", "y", "z"} <= set(sample)
+
+            # several commands in flight at once
+            await send(cmd="rate", rate_hz=50, batch=3, session=1)
+            await send(cmd="status", session=1)
+            await send(cmd="download", session=1)
+            assert (await next_message(worker, "rate"))["batch"] == 3
+            assert (await next_message(worker, "sensor_status"))["status"]["rate"] == 50
+            assert (await next_message(worker, "downloaded"))["count"] == 0
+
+            await send(cmd="disconnect", session=1)
+            assert (await next_message(worker, "disconnected"))["session"] == 1
+            await send(cmd="quit")
+            assert await asyncio.wait_for(worker.wait(), 5) == 0
+        finally:
+            if worker.returncode is None:
+                worker.kill()
+                await worker.wait()
+
+    asyncio.run(session())
+
+
+def test_prewarm_and_connect_share_one_worker(monkeypatch):
+    """Two startWorker calls racing each other end up with the same process."""
+    simulated_env(monkeypatch)
+    monkeypatch.setattr(bkfb, "registerShutdownHooks", lambda: None)
+
+    async def session():
+        first, second = await asyncio.gather(bkfb.startWorker(), bkfb.startWorker())
+        try:
+            assert first is second
+        finally:
+            await bkfb.sendWorkerCommand("quit")
+            await asyncio.wait_for(first.wait(), 5)
+
+    try:
+        asyncio.run(session())
+    finally:
+        bkfb._active_worker = None
+        bkfb._active_worker_pid = None
+
+
+def test_download_and_status_through_a_live_session(monkeypatch):
+    """requestDownload and requestSensorStatus wait for the worker's replies and hand them back."""
+    simulated_env(monkeypatch)
+    monkeypatch.setattr(bkfb, "registerShutdownHooks", lambda: None)
+    monkeypatch.setattr(bkfb, "ESP32_ADDR", "simulated")
+    monkeypatch.setattr(bkfb, "isMobilePlatform", lambda: False)
+
+    async def on_update(*_images):
+        pass
+
+    async def session():
+        assert await bkfb.requestDownload() is None
+        assert await bkfb.requestSensorStatus() is None
+        stop = asyncio.Event()
+        task = asyncio.create_task(bkfb.connectLiveInApp(on_update, stop))
+        try:
+            while bkfb.point_count < 3:
+                await asyncio.sleep(0.02)
+            # the simulated sensor has nothing recorded
+            assert await bkfb.requestDownload() == []
+            status = await bkfb.requestSensorStatus()
+            assert status["rate"] == 20 and bkfb.sensor_status == status
+        finally:
+            stop.set()
+            await asyncio.wait_for(task, 5)
+            await bkfb.sendWorkerCommand("quit")
+            await asyncio.wait_for(bkfb._active_worker.wait(), 5)
+
+    try:
+        asyncio.run(asyncio.wait_for(session(), 20))
+    finally:
+        bkfb._active_worker = None
+        bkfb._active_worker_pid = None
+        bkfb.reset()
+
+
+def test_worker_samples_are_appended_in_batches(monkeypatch):
+    """Samples that pile up while a frame renders go through appendSamples together."""
+    simulated_env(monkeypatch)
+    monkeypatch.setattr(bkfb, "registerShutdownHooks", lambda: None)
+    monkeypatch.setattr(bkfb, "ESP32_ADDR", "simulated")
+    monkeypatch.setattr(bkfb, "isMobilePlatform", lambda: False)
+
+    batches = []
+    append_samples = bkfb.appendSamples
+
+    def recording_append(samples):
+        if samples:
+            batches.append(len(samples))
+        append_samples(samples)
+
+    async def slow_render(_on_update):
+        await asyncio.sleep(0.3)
+        return True
+
+    monkeypatch.setattr(bkfb, "appendSamples", recording_append)
+    monkeypatch.setattr(bkfb, "appendSample", lambda *_sample: pytest.fail("sample appended on its own"))
+    monkeypatch.setattr(bkfb, "renderUpdate", slow_render)
+
+    async def on_update(*_images):
+        pass
+
+    async def session():
+        stop = asyncio.Event()
+        task = asyncio.create_task(bkfb.connectLiveInApp(on_update, stop))
+        try:
+            while bkfb.point_count < 10:
+                await asyncio.sleep(0.02)
+        finally:
+            stop.set()
+            await asyncio.wait_for(task, 5)
+            await bkfb.sendWorkerCommand("quit")
+            await asyncio.wait_for(bkfb._active_worker.wait(), 5)
+
+    try:
+        asyncio.run(asyncio.wait_for(session(), 20))
+        assert max(batches) > 1
+        assert sum(batches) == bkfb.point_count
+    finally:
+        bkfb._active_worker = None
+        bkfb._active_worker_pid = None
+        bkfb.reset()
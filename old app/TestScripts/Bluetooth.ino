@@ -16,7 +16,10 @@ BLECharacteristic *pTxCharacteristic;
 bool deviceConnected = false;
 bool oldDeviceConnected = false;
 
-#define DELAY 50
+#define DELAY 50  // default sample period (ms), 20 Hz
+#define MIN_RATE_HZ 1
+#define MAX_RATE_HZ 100
+#define MAX_BATCH 8  // samples per notification, 8 x ~40 characters still fits one
 #define BUFFER_SIZE 32  // Number of records to buffer in RAM before writing to LittleFS
 
 // See the following for generating UUIDs:
@@ -37,8 +40,38 @@ struct Record {
 Record buffer[BUFFER_SIZE];
 uint8_t bufferIndex = 0;
 
+// live rate, set by the app with "RATE <hz> <batch>" and acknowledged with
+// "ACK RATE <hz> <batch>". back to the defaults on every new connection
+volatile uint32_t sampleDelay = DELAY;
+volatile uint8_t batchSize = 1;
+
+uint32_t sequence = 1;  // sequence counter
+
+// replies to commands, sent from the main loop in between samples. a command written as
+// "#<tag> <command>" gets its reply as "#<tag> <reply>" so the app can match them up
+#define MAX_REPLIES 4
+char replies[MAX_REPLIES][64];
+volatile uint8_t replyHead = 0;
+volatile uint8_t replyTail = 0;
+
+// DOWNLOAD answers "DONE <records>" once the last recorded sample went out
+bool downloadReplyPending = false;
+char downloadTag[12];
+uint32_t downloadCount = 0;
+
+// samples waiting to go out together in one notification
+char batchBuffer[MAX_BATCH * 48];
+size_t batchLength = 0;
+uint8_t batchCount = 0;
+
 class MyServerCallbacks : public BLEServerCallbacks {
   void onConnect(BLEServer *pServer) {
+    sampleDelay = DELAY;
+    batchSize = 1;
+    batchLength = 0;
+    batchCount = 0;
+    replyHead = replyTail = 0;
+    downloadReplyPending = false;
     deviceConnected = true;
     Serial.println("Device connected");
   }
@@ -51,6 +84,39 @@ class MyServerCallbacks : public BLEServerCallbacks {
 
 void sendSavedData(); // prototype
 
+// queue a reply (tag is "" for untagged commands); dropped if the queue is full
+void queueReply(const String &tag, const char *text) {
+  uint8_t next = (replyTail + 1) % MAX_REPLIES;
+  if (next == replyHead) return;
+  if (tag.length() > 0) snprintf(replies[replyTail], sizeof(replies[0]), "#%s %s", tag.c_str(), text);
+  else snprintf(replies[replyTail], sizeof(replies[0]), "%s", text);
+  replyTail = next;
+}
+
+// "RATE <hz> <batch>": switch at the next sample, ack from the main loop
+void setRate(const String &tag, const String &command) {
+  float hz = 0;
+  int batch = 1;
+  char ack[32];
+  if (sscanf(command.c_str(), "RATE %f %d", &hz, &batch) < 1) return;
+  if (hz < MIN_RATE_HZ) hz = MIN_RATE_HZ;
+  if (hz > MAX_RATE_HZ) hz = MAX_RATE_HZ;
+  if (batch < 1) batch = 1;
+  if (batch > MAX_BATCH) batch = MAX_BATCH;
+  sampleDelay = (uint32_t)(1000.0f / hz + 0.5f);
+  batchSize = batch;
+  snprintf(ack, sizeof(ack), "ACK RATE %g %d", hz, batch);
+  queueReply(tag, ack);
+}
+
+// "STATUS": current rate, batch and sequence number
+void sendStatus(const String &tag) {
+  char status[64];
+  snprintf(status, sizeof(status), "STATUS rate %g batch %d seq %lu",
+           1000.0f / sampleDelay, batchSize, sequence);
+  queueReply(tag, status);
+}
+
 class MyCallbacks : public BLECharacteristicCallbacks {
   void onWrite(BLECharacteristic *pCharacteristic) {
     String rxValue = pCharacteristic->getValue();
@@ -59,7 +125,24 @@ class MyCallbacks : public BLECharacteristicCallbacks {
     Serial.print(rxValue);
     Serial.println();
 
+    // optional "#<tag> " in front, echoed back with the reply
+    String tag = "";
+    if (rxValue.startsWith("#")) {
+      int space = rxValue.indexOf(' ');
+      if (space < 0) return;
+      tag = rxValue.substring(1, space);
+      rxValue = rxValue.substring(space + 1);
+    }
+
     if (rxValue == "GIMMEH DATAH") sendSavedData();
+    else if (rxValue == "DOWNLOAD") {
+      tag.toCharArray(downloadTag, sizeof(downloadTag));
+      downloadCount = 0;
+      downloadReplyPending = true;
+      sendSavedData();
+    }
+    else if (rxValue == "STATUS") sendStatus(tag);
+    else if (rxValue.startsWith("RATE ")) setRate(tag, rxValue);
 
   }
 };
@@ -69,11 +152,21 @@ class MyCallbacks : public BLECharacteristicCallbacks {
 File sendFile;      // file handle for sending data
 bool sendingData = false;  // flag to indicate we're in the middle of sending
 
+// answer a DOWNLOAD once everything is out
+void finishDownload() {
+  if (!downloadReplyPending) return;
+  char done[24];
+  snprintf(done, sizeof(done), "DONE %lu", downloadCount);
+  queueReply(String(downloadTag), done);
+  downloadReplyPending = false;
+}
+
 void sendSavedData() {
   sendFile = LittleFS.open("/data.bin", "r");
   if (!sendFile) {
     Serial.println("Failed to open data.bin for reading");
     sendingData = false;
+    finishDownload();
     return;
   }
 
@@ -93,6 +186,7 @@ void sendDataChunk() {
       sendFile.close();
       sendingData = false;
       Serial.println("Finished sending saved data.");
+      finishDownload();
       return;
     }
 
@@ -101,6 +195,7 @@ void sendDataChunk() {
 
     pTxCharacteristic->setValue(buffer);
     pTxCharacteristic->notify();
+    downloadCount++;
   }
 
   delay(10);
@@ -189,8 +284,6 @@ void setup() {
 // }
 
 void loop() {
-  static uint32_t sequence = 1;  // sequence counter
-
   sensors_event_t a, g, temp;
   mpu.getEvent(&a, &g, &temp);
 
@@ -229,13 +322,33 @@ void loop() {
 
     if (!sendingData) {  // only send live data if not sending recorded data
       if (deviceConnected) {
-        char bufferStr[64];
-        snprintf(bufferStr, sizeof(bufferStr), "%lu x %.3f y %.3f z %.3f",
-                r.seq, r.x, r.y, r.z);
-
-        pTxCharacteristic->setValue(bufferStr);
-        pTxCharacteristic->notify();
-        delay(DELAY);
+        if (replyHead != replyTail) {
+          // anything batched at the old rate goes out first, then the replies
+          if (batchLength > 0) {
+            pTxCharacteristic->setValue((uint8_t*)batchBuffer, batchLength);
+            pTxCharacteristic->notify();
+            batchLength = 0;
+            batchCount = 0;
+          }
+          while (replyHead != replyTail) {
+            pTxCharacteristic->setValue(replies[replyHead]);
+            pTxCharacteristic->notify();
+            replyHead = (replyHead + 1) % MAX_REPLIES;
+          }
+        }
+
+        // one "seq x .. y .. z .." line per sample, batchSize lines per notification
+        batchLength += snprintf(batchBuffer + batchLength, sizeof(batchBuffer) - batchLength,
+                                "%s%lu x %.3f y %.3f z %.3f", batchCount ? "\n" : "",
+                                r.seq, r.x, r.y, r.z);
+        batchCount++;
+        if (batchCount >= batchSize) {
+          pTxCharacteristic->setValue((uint8_t*)batchBuffer, batchLength);
+          pTxCharacteristic->notify();
+          batchLength = 0;
+          batchCount = 0;
+        }
+        delay(sampleDelay);
 
         sequence++;
       }